@@ -0,0 +1,580 @@
+"""
+Compiled AWBW actions.
+
+A replay action stores a view of its results for every player, so applying one
+means finding the view with the full information (ie. the acting player's view
+of their own unit) among views with hidden values. compile_action does that
+once, turning a replay action into a small typed record holding only the values
+AWBWGameState.apply_action needs:
+
+with AWBWReplay("52963.zip") as replay:
+    compiled = compile_actions(replay)
+state = AWBWGameState(replay_initial=replay.game_info())
+for action in compiled:
+    state = state.apply_action(action)
+
+The records only hold plain values, so a compiled action list can be pickled,
+cached (see AWBWReplay.compiled_actions) and applied again for every pass over
+the same replay. Unit values are dictionaries keyed like awbw.Unit, without the
+"units_" prefix of the replay.
+
+What the views say about who could see each unit is kept in the sightings of a
+record, as (unit id, seen by, hidden from) tuples of player ids, for
+fog.FogOfWar. EVERYONE in seen by stands for the global view of a game without
+fog, and a hidden from of None means every player not in seen by.
+"""
+
+import typing
+
+# Bump whenever a record changes shape, so cached compiled actions are rebuilt
+FORMAT_VERSION = 3
+
+# Player id of the view shared by every player
+EVERYONE = "global"
+
+_UNIT_PREFIX = "units_"
+
+def _viewer(key):
+    """Returns the player id of a view's key"""
+    return EVERYONE if key == EVERYONE else int(key)
+
+def _split_views(views, is_seen):
+    """Returns the (seen by, hidden from) player ids of a dictionary of views"""
+    seen_by = []
+    hidden_from = []
+    for key, view in views.items():
+        (seen_by if is_seen(view) else hidden_from).append(_viewer(key))
+    return tuple(seen_by), tuple(hidden_from)
+
+def _first_int(views):
+    """Returns the first integer value of a dictionary of views, or None if all are hidden"""
+    for value in views.values():
+        if isinstance(value, int):
+            return value
+    return None
+
+def _int_values(views):
+    """Returns the tuple of distinct integer values of a dictionary of views"""
+    return tuple(dict.fromkeys(value for value in views.values() if isinstance(value, int)))
+
+def _is_full_unit(view):
+    """
+    Returns whether a view of a unit has its full information. Other players'
+    views of a unit that moved back into the fog don't have its position.
+    """
+    return isinstance(view, dict) and "units_x" in view and "units_y" in view
+
+def _full_units(views):
+    """Returns the list of views of a unit with its full information"""
+    return [unit for unit in views.values() if _is_full_unit(unit)]
+
+def _unit_values(unit):
+    """Returns the values of a replay unit, keyed without the units_ prefix"""
+    return {key[len(_UNIT_PREFIX):]: value for key, value in unit.items()
+            if key.startswith(_UNIT_PREFIX)}
+
+def _full_unit(views):
+    """Returns the values of the first full view of a unit, or None if there isn't one"""
+    units = _full_units(views)
+    return _unit_values(units[0]) if units else None
+
+def _unit_sightings(views):
+    """Returns the sightings of a unit from the players' views of it"""
+    units = _full_units(views)
+    if not units:
+        return ()
+    return ((units[0]["units_id"], *_split_views(views, _is_full_unit)),)
+
+def _new_unit_sightings(views, u_ids):
+    """Returns the sightings of new units, which only players with a view of them can see"""
+    seen_by = tuple(_viewer(key) for key in views)
+    return tuple((u_id, seen_by, None) for u_id in u_ids)
+
+class Move(typing.NamedTuple):
+    """A unit moving, on its own or before another action"""
+    ACTION = "Move"
+    # Unit values, or None if no view has the unit's position
+    unit: typing.Optional[dict]
+    sightings: tuple = ()
+
+class Fire(typing.NamedTuple):
+    """A unit attacking another"""
+    ACTION = "Fire"
+    move: typing.Optional[Move]
+    # (player id, CO power meter)
+    co_powers: tuple
+    # (unit id, hit points, ammo, whether it attacked) of each visible unit
+    combatants: tuple
+    # (player id, funds gained) from Sasha's power
+    gained_funds: tuple
+    sightings: tuple = ()
+
+class Join(typing.NamedTuple):
+    """A unit joining another of the same type"""
+    ACTION = "Join"
+    move: typing.Optional[Move]
+    # The unit that no longer exists
+    joined_id: int
+    funds: typing.Optional[int]
+    # Values of the combined unit, or None if no view has them
+    unit: typing.Optional[dict]
+    sightings: tuple = ()
+
+class Resign(typing.NamedTuple):
+    """A player resigning"""
+    ACTION = "Resign"
+    player_id: int
+    game_over: bool
+    sightings: tuple = ()
+
+class Build(typing.NamedTuple):
+    """A new unit built by the active player"""
+    ACTION = "Build"
+    unit: dict
+    sightings: tuple = ()
+
+class End(typing.NamedTuple):
+    """The end of a turn"""
+    ACTION = "End"
+    next_player_id: int
+    day: int
+    # Funds of the next player, or None if hidden from every view
+    funds: typing.Optional[int]
+    # (unit id, hit points) of units repaired at the start of the next turn
+    repaired: tuple
+    sightings: tuple = ()
+
+class Power(typing.NamedTuple):
+    """A CO power or super CO power"""
+    ACTION = "Power"
+    player_id: int
+    co_power: int
+    co_power_on: bool
+    super_co_power_on: bool
+    # (player id, unit name, cost, ((unit id, x, y), ...)) of units added by Sensei
+    unit_add: typing.Optional[tuple]
+    # (player ids, hit points change) for every player's units
+    hp_changes: tuple
+    # (unit id, hit points or None, whether the unit is marked moved)
+    unit_replace: tuple
+    sightings: tuple = ()
+
+class Capt(typing.NamedTuple):
+    """A unit capturing a building"""
+    ACTION = "Capt"
+    move: typing.Optional[Move]
+    building_id: int
+    # Building values to update
+    building: dict
+    sightings: tuple = ()
+
+class Repair(typing.NamedTuple):
+    """A black boat repairing a unit"""
+    ACTION = "Repair"
+    move: typing.Optional[Move]
+    unit_id: int
+    hit_points: int
+    funds: typing.Optional[int]
+    sightings: tuple = ()
+
+class Supply(typing.NamedTuple):
+    """A unit resupplying its neighbours"""
+    ACTION = "Supply"
+    move: typing.Optional[Move]
+    sightings: tuple = ()
+
+class Load(typing.NamedTuple):
+    """A unit moving into a transport"""
+    ACTION = "Load"
+    move: typing.Optional[Move]
+    loaded_id: int
+    transport_id: int
+    sightings: tuple = ()
+
+class Unload(typing.NamedTuple):
+    """A transport dropping off a unit"""
+    ACTION = "Unload"
+    transport_id: int
+    # Values of the unloaded unit
+    unit: dict
+    sightings: tuple = ()
+
+class Delete(typing.NamedTuple):
+    """Units deleted by their owner"""
+    ACTION = "Delete"
+    unit_ids: tuple
+    sightings: tuple = ()
+
+class Hide(typing.NamedTuple):
+    """A sub diving or a stealth hiding"""
+    ACTION = "Hide"
+    move: typing.Optional[Move]
+    unit_ids: tuple
+    sightings: tuple = ()
+
+class Unhide(typing.NamedTuple):
+    """A sub surfacing or a stealth appearing"""
+    ACTION = "Unhide"
+    move: typing.Optional[Move]
+    unit_ids: tuple
+    sightings: tuple = ()
+
+def _compile_move(action_data):
+    sightings = list(_unit_sightings(action_data["unit"]))
+    # Units the move brought into view
+    for p_id, discovered in (action_data.get("discovered") or {}).items():
+        if isinstance(discovered, dict):
+            sightings.extend((int(unit["units_id"]), (_viewer(p_id),), ())
+                             for unit in discovered.get("units") or ())
+    return Move(_full_unit(action_data["unit"]), tuple(sightings))
+
+def _compile_leading_move(action_data):
+    """Compiles the move some actions start with, or returns None"""
+    if "Move" in action_data and isinstance(action_data["Move"], dict):
+        return _compile_move(action_data["Move"])
+    return None
+
+def _move_sightings(move):
+    """Returns the sightings of a leading move, which come before the action's own"""
+    return () if move is None else move.sightings
+
+def _fire_sightings(fire_action):
+    """Returns the sightings of the attacker and defender, some players may not see the attacker"""
+    sightings = []
+    for role in ["attacker", "defender"]:
+        u_id = None
+        seen_by = []
+        hidden_from = []
+        for key, combatinfo in fire_action["combatInfoVision"].items():
+            if not isinstance(combatinfo, dict) or not isinstance(combatinfo["combatInfo"], dict):
+                continue
+            unit = combatinfo["combatInfo"].get(role)
+            if isinstance(unit, dict):
+                u_id = int(unit["units_id"])
+                seen_by.append(_viewer(key))
+            else:
+                hidden_from.append(_viewer(key))
+        if u_id is not None:
+            sightings.append((u_id, tuple(seen_by), tuple(hidden_from)))
+    return tuple(sightings)
+
+def _compile_fire(action_data):
+    fire_action = action_data["Fire"]
+    assert isinstance(fire_action, dict)
+
+    # For some reason, the replay data has the co power meter multiplied
+    # by a magnitude of 10.
+    co_powers = tuple(
+        (int(values["playerId"]), int(values["copValue"]) / 10)
+        for values in fire_action["copValues"].values())
+
+    combatants = []
+    gained_funds = {}
+    for combatinfo in fire_action["combatInfoVision"].values():
+        if not isinstance(combatinfo, dict) or not isinstance(combatinfo["combatInfo"], dict):
+            continue
+        for role in ["attacker", "defender"]:
+            unit = combatinfo["combatInfo"].get(role)
+            if not isinstance(unit, dict):
+                # Indicates a unseen attacker
+                continue
+            combatants.append((
+                int(unit["units_id"]),
+                unit["units_hit_points"],
+                unit["units_ammo"],
+                role == "attacker",
+            ))
+        # Handle funds change in the case of Sasha's power
+        for p_id, funds in combatinfo["combatInfo"].get("gainedFunds", {}).items():
+            if funds is not None:
+                gained_funds[int(p_id)] = funds
+
+    # Every player's view repeats the same combat
+    move = _compile_leading_move(action_data)
+    return Fire(
+        move,
+        co_powers,
+        tuple(dict.fromkeys(combatants)),
+        tuple(gained_funds.items()),
+        _move_sightings(move) + _fire_sightings(fire_action))
+
+def _compile_join(action_data):
+    # To join two units, one must be moved
+    assert "Move" in action_data
+    join_action = action_data["Join"]
+    joined_id = _first_int(join_action["joinID"])
+    assert joined_id is not None
+    move = _compile_move(action_data["Move"])
+    return Join(
+        move,
+        joined_id,
+        _first_int(join_action["newFunds"]),
+        _full_unit(join_action["unit"]),
+        move.sightings + _unit_sightings(join_action["unit"]))
+
+def _compile_resign(action_data):
+    # TODO: The GameOver / Resign messages actual contain usernames.
+    return Resign(action_data["Resign"]["playerId"], "GameOver" in action_data)
+
+def _compile_build(action_data):
+    info = action_data["newUnit"]
+    unit_info = None
+
+    # Figure out what information is the true info for the unit
+    if "global" in info and len(info) == 1:
+        # This is a normal standard match, where the unit is not Sonja's
+        unit_info = info["global"]
+    else:
+        # This unit has special vision information (FOG or Sonja's unit)
+        for p_id, unit in info.items():
+            if p_id == "global":
+                continue
+            # Only pick the unit that has full information
+            # (since a player always has full view of their units)
+            if unit["units_players_id"] == int(p_id):
+                unit_info = unit
+                break
+
+    assert unit_info is not None
+    return Build(
+        _unit_values(unit_info),
+        _new_unit_sightings(info, [unit_info["units_id"]]))
+
+def _compile_end(action_data):
+    info = action_data["updatedInfo"]
+
+    repaired = []
+    repaired_info = info["repaired"]
+    if repaired_info and isinstance(repaired_info, dict):
+        for value in repaired_info.values():
+            assert isinstance(value, list)
+            repaired.extend((int(unit["units_id"]), unit["units_hit_points"]) for unit in value)
+
+    # In Fog matches, funds are hidden from some players, so there is a view
+    # on the nextFunds variable, with the hidden values being ''
+    return End(
+        int(info["nextPId"]),
+        int(info["day"]),
+        _first_int(info["nextFunds"]),
+        tuple(repaired))
+
+def _compile_power_unit_add(action_data):
+    """Compiles the units added by Sensei's powers, or returns None"""
+    if "unitAdd" not in action_data:
+        return None
+    assert action_data["coName"] == "Sensei"
+    unit_add_info = None
+    if "global" in action_data["unitAdd"]:
+        unit_add_info = action_data["unitAdd"]["global"]
+    else:
+        for p_id, info in action_data["unitAdd"].items():
+            if p_id == "global":
+                continue
+            if int(p_id) == info["playerId"]:
+                unit_add_info = info
+                break
+    assert unit_add_info is not None
+
+    # TODO: Improve unit creation from incomplete data
+    name = unit_add_info["unitName"]
+    # Infantry cost for Sensei
+    cost = 3000 if name == "Mech" else 1000
+    units = tuple((unit["units_id"], unit["units_x"], unit["units_y"])
+                  for unit in unit_add_info["units"])
+    return (unit_add_info["playerId"], name, cost, units)
+
+def _compile_power_hp_changes(action_data):
+    """Compiles the global hit point changes of powers like Hawke's and Drake's"""
+    hp_changes = []
+    hp_change = action_data.get("hpChange")
+    if not isinstance(hp_change, dict):
+        return ()
+    for hp_type in ["hpGain", "hpLoss"]:
+        hp_info = hp_change.get(hp_type)
+        if isinstance(hp_info, dict):
+            # The player ids are keys next to the other values, as strings since
+            # the action is JSON
+            p_ids = tuple(int(key) for key in hp_info if str(key).isdigit())
+            hp_changes.append((p_ids, hp_info["hp"]))
+    return tuple(hp_changes)
+
+def _compile_power_unit_replace(action_data):
+    """Compiles the units changed by powers like Von Bolt's or Sturm's"""
+    unit_replace = []
+    for units in action_data.get("unitReplace", {}).values():
+        if not units or not units["units"]:
+            continue
+        for unit in units["units"]:
+            unit_replace.append((
+                unit["units_id"],
+                unit.get("units_hit_points"),
+                "units_moved" in unit,
+            ))
+    return tuple(dict.fromkeys(unit_replace))
+
+def _compile_power(action_data):
+    unit_add = _compile_power_unit_add(action_data)
+    sightings = ()
+    if unit_add is not None:
+        sightings = _new_unit_sightings(action_data["unitAdd"], [unit[0] for unit in unit_add[3]])
+    return Power(
+        action_data["playerID"],
+        action_data["playersCOP"],
+        action_data["coPower"] == "Y",
+        action_data["coPower"] == "S",
+        unit_add,
+        _compile_power_hp_changes(action_data),
+        _compile_power_unit_replace(action_data),
+        sightings)
+
+def _compile_capt(action_data):
+    building = action_data["Capt"]["buildingInfo"]
+    values = {
+        "capture": building["buildings_capture"],
+        "team": building["buildings_team"],
+    }
+    if "buildings_players_id" in building:
+        # The capture completed, changing the owner and the property's terrain
+        values["players_id"] = building["buildings_players_id"]
+        values["terrain_id"] = building["terrain_id"]
+    move = _compile_leading_move(action_data)
+    return Capt(move, int(building["buildings_id"]), values, _move_sightings(move))
+
+def _compile_repair(action_data):
+    repair_info = action_data["Repair"]
+    unit = None
+    for value in repair_info["repaired"].values():
+        if isinstance(value, dict):
+            unit = value
+            break
+    assert unit is not None
+    move = _compile_leading_move(action_data)
+    return Repair(
+        move,
+        unit["units_id"],
+        unit["units_hit_points"],
+        _first_int(repair_info["funds"]),
+        _move_sightings(move))
+
+def _compile_supply(action_data):
+    # The supply data doesn't actually include the new fuel values,
+    # so for now only the move is kept.
+    move = _compile_leading_move(action_data)
+    return Supply(move, _move_sightings(move))
+
+def _compile_load(action_data):
+    # To load a unit into a transport, one must be moved
+    assert "Move" in action_data
+    load_action = action_data["Load"]
+    move = _compile_move(action_data["Move"])
+    return Load(
+        move,
+        _first_int(load_action["loaded"]) or 0,
+        _first_int(load_action["transport"]) or 0,
+        move.sightings)
+
+def _compile_unload(action_data):
+    unit = _full_unit(action_data["unit"])
+    assert unit is not None
+    return Unload(action_data["transportID"], unit, _unit_sightings(action_data["unit"]))
+
+def _compile_delete(action_data):
+    return Delete(_int_values(action_data["Delete"]["unitId"]))
+
+def _compile_hide(action_data):
+    move = _compile_leading_move(action_data)
+    views = action_data["Hide"]["unit"]
+    unit_ids = _int_values(views)
+    sightings = _move_sightings(move)
+    if unit_ids:
+        # Players who can still see the hidden unit get its id
+        seen_by, hidden_from = _split_views(views, lambda view: isinstance(view, int))
+        sightings += ((unit_ids[0], seen_by, hidden_from),)
+    return Hide(move, unit_ids, sightings)
+
+def _compile_unhide(action_data):
+    move = _compile_leading_move(action_data)
+    views = action_data["Unhide"]["unit"]
+    unit_ids = (unit["units_id"] for unit in _full_units(views))
+    return Unhide(
+        move,
+        tuple(dict.fromkeys(unit_ids)),
+        _move_sightings(move) + _unit_sightings(views))
+
+_ACTION_TO_COMPILE_FUNC = {
+    "Fire": _compile_fire,
+    "Join": _compile_join,
+    "Resign": _compile_resign,
+    "Move": _compile_move,
+    "Build": _compile_build,
+    "End": _compile_end,
+    "Power": _compile_power,
+    "Capt": _compile_capt,
+    "Load": _compile_load,
+    "Unload": _compile_unload,
+    "Repair": _compile_repair,
+    "Supply": _compile_supply,
+    "Delete": _compile_delete,
+    "Hide": _compile_hide,
+    "Unhide": _compile_unhide,
+}
+
+# Every compiled record type
+RECORD_TYPES = (Fire, Join, Resign, Move, Build, End, Power, Capt, Load, Unload,
+                Repair, Supply, Delete, Hide, Unhide)
+
+def compile_action(replay_action):
+    """
+    Arguments:
+    - replay_action: A replay action mapping, as yielded by AWBWReplay.actions()
+
+    Returns:
+    - The compiled record for the action, one of RECORD_TYPES
+    """
+    action_type = replay_action["action"]
+    if action_type not in _ACTION_TO_COMPILE_FUNC:
+        raise ValueError(f"Unsupported action type {action_type}")
+    return _ACTION_TO_COMPILE_FUNC[action_type](replay_action)
+
+def compile_actions(replay):
+    """
+    Arguments:
+    - replay: An open AWBWReplay
+
+    Returns:
+    - List of the compiled records of every action in the replay
+    """
+    return [compile_action(action) for action in replay.actions()]
+
+def acting_unit_id(action): # pylint: disable=too-many-return-statements
+    """Returns the id of the unit that acted in a compiled action, or None"""
+    if isinstance(action, Fire):
+        for u_id, _hit_points, _ammo, fired in action.combatants:
+            if fired:
+                return u_id
+    if isinstance(action, (Build, Unload)):
+        return action.unit["id"]
+    if isinstance(action, Move):
+        return None if action.unit is None else action.unit["id"]
+    if isinstance(action, Load):
+        return action.loaded_id
+    if isinstance(action, (Delete, Hide, Unhide)) and action.unit_ids:
+        return action.unit_ids[0]
+    move = getattr(action, "move", None)
+    if move is not None and move.unit is not None:
+        return move.unit["id"]
+    return None
+
+def target_unit_id(action):
+    """Returns the id of the unit an action was done to, or None"""
+    if isinstance(action, Fire):
+        for u_id, _hit_points, _ammo, fired in action.combatants:
+            if not fired:
+                return u_id
+    if isinstance(action, Join):
+        return None if action.unit is None else action.unit["id"]
+    if isinstance(action, Repair):
+        return action.unit_id
+    if isinstance(action, (Load, Unload)):
+        return action.transport_id
+    return None
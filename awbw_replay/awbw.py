@@ -1,12 +1,18 @@
 """Classes specific to AWBW Game States and Actions"""
+# pylint: disable=too-many-lines
 
 import logging
+import time
 from enum import Enum
-from copy import deepcopy
+from copy import copy, deepcopy
 
-from awbw_replay import game
+from awbw_replay import actions, game, instrument, terrain
 
-class GameInfo(game.DefaultDict):
+# Bump whenever applying actions gives different states, so results stored from
+# earlier states (ie. by index.ReplayIndex) are rebuilt
+ENGINE_VERSION = 2
+
+class GameInfo(game.Record):
     """Stores general information about the game"""
 
     ALLOWED_DATA = {
@@ -16,9 +22,15 @@ class GameInfo(game.DefaultDict):
         "turn": 0,
         "day": 0,
         "game_over": False,
+        # Whether units are hidden by fog of war
+        "fog": False,
+        # Funds each income earning property gives its owner per turn
+        "funds_per_property": 1000,
     }
 
-class Player(game.DefaultDict):
+    __slots__ = ()
+
+class Player(game.Record):
     """Stores per player information."""
 
     ALLOWED_DATA = {
@@ -36,7 +48,9 @@ class Player(game.DefaultDict):
         "funds": 0,
     }
 
-class Unit(game.DefaultDict):
+    __slots__ = ()
+
+class Unit(game.Record):
     """Stores per unit information."""
 
     ALLOWED_DATA = {
@@ -66,7 +80,9 @@ class Unit(game.DefaultDict):
         "carried": False,
     }
 
-class Building(game.DefaultDict):
+    __slots__ = ()
+
+class Building(game.Record):
     """Stores per building information."""
 
     ALLOWED_DATA = {
@@ -85,6 +101,143 @@ class Building(game.DefaultDict):
         "team": "",
     }
 
+    __slots__ = ()
+
+class PlayerStats(game.Record):
+    """Per player totals, kept up to date by AWBWGameState as actions are applied."""
+
+    ALLOWED_DATA = {
+        # Units alive, including carried units
+        "unit_count": 0,
+        # Sum of cost * hit_points / 10 over the units alive
+        "army_value": 0.0,
+        # Buildings owned, including com towers and labs
+        "property_count": 0,
+        # Funds earned per turn from properties, not counting CO bonuses
+        "income": 0,
+    }
+
+    __slots__ = ()
+
+def _yes_no(value):
+    """Converts a "Y" / "N" flag from the replay to a bool"""
+    return value == "Y"
+
+def flag_is_set(value):
+    """Returns whether a unit flag is set. Some actions give flags as "Y" / "N" or 0 / 1."""
+    if isinstance(value, str):
+        return value == "Y"
+    return bool(value)
+
+# Unit keys that decide where a unit is on the map grid
+_GRID_KEYS = frozenset(("x", "y", "carried", "hit_points"))
+
+# Record keys that the PlayerStats totals depend on
+_UNIT_STATS_KEYS = frozenset(("players_id", "hit_points", "cost"))
+_BUILDING_STATS_KEYS = frozenset(("players_id", "terrain_id"))
+
+def _grid_tile(unit):
+    """Returns the (x, y) tile a unit occupies, or None for dead and carried units"""
+    if unit["hit_points"] <= 0 or flag_is_set(unit["carried"]):
+        return None
+    return (unit["x"], unit["y"])
+
+# The replay keys read into each record type, and how to convert their values
+_PLAYER_REPLAY_FIELDS = {
+    "id": int,
+    "funds": int,
+    "users_id": int,
+    "countries_id": int,
+    "co_id": int,
+    "co_max_power": int,
+    "co_max_spower": int,
+    "co_power": int,
+    "co_power_on": _yes_no,
+    "eliminated": _yes_no,
+    "team": str,
+}
+
+_UNIT_REPLAY_FIELDS = {
+    "id": int,
+    "players_id": int,
+    "fuel": int,
+    "fuel_per_turn": int,
+    "ammo": int,
+    "cost": int,
+    "x": int,
+    "y": int,
+    "hit_points": int,
+    "name": str,
+    "symbol": str,
+    "movement_type": str,
+}
+
+_BUILDING_REPLAY_FIELDS = {
+    "id": int,
+    "capture": int,
+    "last_capture": int,
+    "terrain_id": int,
+    "x": int,
+    "y": int,
+}
+
+def _replay_record_info(replay_data, fields, prefix=""):
+    """
+    Reads the typed values for a record out of replay data.
+
+    Arguments:
+    - replay_data: Dictionary from the replay (game info or an action)
+    - fields: One of the *_REPLAY_FIELDS dictionaries
+    - prefix: Prefix of the keys in replay_data (ie. "units_" in actions)
+
+    Returns:
+    - Dictionary to construct the record with
+    """
+    return {key: convert(replay_data[prefix + key]) for key, convert in fields.items()}
+
+def _changed(old, new):
+    """Returns True if replacing old with new changes the stored value, including its type"""
+    return old is not new and (type(old) is not type(new) or old != new)
+
+class _OwnsEverything():
+    """Stands in for the owned set of a state that shares nothing with other states"""
+
+    def __contains__(self, item):
+        return True
+
+    def add(self, item):
+        """Every item is already owned"""
+
+_OWNS_EVERYTHING = _OwnsEverything()
+
+def _unit_stats(unit):
+    """Returns (player id, {stat: amount}) of what a unit adds to its player's PlayerStats"""
+    if unit["hit_points"] <= 0:
+        return unit["players_id"], {}
+    return unit["players_id"], {
+        "unit_count": 1,
+        "army_value": unit["cost"] * unit["hit_points"] / 10,
+    }
+
+def _building_stats(building, funds_per_property):
+    """Returns (player id, {stat: amount}) of what a building adds to its player's PlayerStats"""
+    info = terrain.property_info(building["terrain_id"])
+    if info is None:
+        return building["players_id"], {}
+    stats = {"property_count": 1}
+    if info[1] in terrain.INCOME_KINDS:
+        stats["income"] = funds_per_property
+    return building["players_id"], stats
+
+def _near_tiles(grid, x, y, distance):
+    """Generator over (tile, value) of the grid tiles within distance of (x, y)"""
+    for dx in range(-distance, distance + 1):
+        span = distance - abs(dx)
+        for dy in range(-span, span + 1):
+            tile = (x + dx, y + dy)
+            if tile in grid:
+                yield tile, grid[tile]
+
 # Derived classes for AWBW
 
 class AWBWGameAction(game.GameAction):
@@ -115,8 +268,15 @@ class AWBWGameAction(game.GameAction):
 
         self.type = self.Type(replay_action["action"])
         self.info = replay_action
+        self._compiled = None
+
+    def compiled(self):
+        """Returns the actions.compile_action record of this action, compiled on first use"""
+        if self._compiled is None:
+            self._compiled = actions.compile_action(self.info)
+        return self._compiled
 
-class AWBWGameState(game.GameState):
+class AWBWGameState(game.GameState): # pylint: disable=too-many-instance-attributes
     """
     Represents a single state in the AWBW game.
     """
@@ -127,7 +287,15 @@ class AWBWGameState(game.GameState):
             units=None,
             buildings=None,
             game_info=None,
-            replay_initial=None):
+            replay_initial=None,
+            units_type=None):
+        """
+        Arguments:
+        - game_map, players, units, buildings, game_info: Initial values, which are copied
+        - replay_initial: The replay's game_info(), which overrides the other values
+        - units_type: Optional mapping type to store the units in, constructed
+          from the units dictionary (ie. unit_store.UnitStore)
+        """
         super().__init__()
 
         # TODO: Setup game map - assume this never changes
@@ -145,37 +313,45 @@ class AWBWGameState(game.GameState):
         # TODO: Setup buildings as a dictionary mapping building id -> awbw.Building type
         self.buildings = deepcopy(buildings)
 
+        # Names of containers and (container, id) of records that this state
+        # may modify in place, because no other state shares them
+        self._owned = _OWNS_EVERYTHING
+        # List collecting change records, see apply_action_inplace
+        self._changes = None
+
         if replay_initial is not None:
             # Overwrite passed in values with info from the replay
             self._construct_from_replay_initial(replay_initial)
 
+        if units_type is not None:
+            self.units = units_type(self.units)
+
+        # (x, y) -> tuple of ids of the units on that tile, normally just one.
+        # Dead and carried units aren't on the grid.
+        self._unit_grid = {}
+        for u_id, unit in (self.units or {}).items():
+            self._move_on_grid(u_id, None, _grid_tile(unit))
+        # (x, y) -> building id. Buildings never move.
+        self._building_grid = {
+                (building["x"], building["y"]): b_id
+                for b_id, building in (self.buildings or {}).items()}
+
+        # Player id -> PlayerStats
+        self.player_stats = {p_id: PlayerStats() for p_id in (self.players or {})}
+        for unit in (self.units or {}).values():
+            self._adjust_player_stats(None, _unit_stats(unit))
+        for building in (self.buildings or {}).values():
+            self._adjust_player_stats(None, self._building_stats(building))
+
     def _construct_initial_players(self, replay_initial_players):
         """Helper for just the players info"""
         self.players = {}
         is_team = False
         for player in replay_initial_players.values():
-            player_info = {
-            }
-            player_keys_int = [
-                    "id",
-                    "funds",
-                    "users_id",
-                    "countries_id",
-                    "co_id",
-                    "co_max_power",
-                    "co_max_spower",
-                    "co_power",
-            ]
-            for k in player_keys_int:
-                player_info[k] = int(player[k])
-
-            player_keys_bool = ["co_power_on", "eliminated"]
-            for k in player_keys_bool:
-                player_info[k] = (player[k] == "Y")
-            player_info["team"] = player["team"]
+            player_info = _replay_record_info(player, _PLAYER_REPLAY_FIELDS)
             if "A" in player_info["team"] or "B" in player_info["team"]:
                 is_team = True
-            self.players[player_info["id"]] = Player(**player_info)
+            self.players[player_info["id"]] = Player(player_info)
 
         # TODO: Support team battles
         if is_team:
@@ -185,42 +361,20 @@ class AWBWGameState(game.GameState):
         """Helper for just the unit info"""
         self.units = {}
         for unit in replay_initial_units.values():
-            unit_info = {}
-            self.units[unit["id"]] = unit_info
-            unit_keys_int = [
-                    "id",
-                    "players_id",
-                    "fuel",
-                    "fuel_per_turn",
-                    "ammo",
-                    "cost",
-                    "x",
-                    "y",
-                    "hit_points"
-            ]
-            unit_keys_str = ["name", "symbol", "movement_type"]
-            for k in unit_keys_int:
-                unit_info[k] = int(unit[k])
-            for k in unit_keys_str:
-                unit_info[k] = unit[k]
-            self.units[unit_info["id"]] = Unit(**unit_info)
+            unit_info = _replay_record_info(unit, _UNIT_REPLAY_FIELDS)
+            self.units[unit_info["id"]] = Unit(unit_info)
 
     def _construct_initial_buildings(self, replay_initial_buildings):
         """Helper for just the building info"""
         self.buildings = {}
+        country_players = {player["countries_id"]: p_id for p_id, player in self.players.items()}
         for building in replay_initial_buildings.values():
-            building_info = {}
-            building_keys_int = [
-                    "id",
-                    "capture",
-                    "last_capture",
-                    "terrain_id",
-                    "x",
-                    "y",
-            ]
-            for k in building_keys_int:
-                building_info[k] = int(building[k])
-            self.buildings[building_info["id"]] = Building(**building_info)
+            building_info = _replay_record_info(building, _BUILDING_REPLAY_FIELDS)
+            # The terrain of a property shows which country, and so which player, owns it
+            info = terrain.property_info(building_info["terrain_id"])
+            if info is not None and info[0] in country_players:
+                building_info["players_id"] = country_players[info[0]]
+            self.buildings[building_info["id"]] = Building(building_info)
 
     def _construct_initial_game_info(self, replay_initial):
         """Helper for the global game info"""
@@ -230,6 +384,8 @@ class AWBWGameState(game.GameState):
         game_info_info["active_player_id"] = replay_initial["players"][0]["id"]
         game_info_info["turn"] = 0
         game_info_info["day"] = 1
+        game_info_info["funds_per_property"] = replay_initial["funds"]
+        game_info_info["fog"] = _yes_no(replay_initial["fog"])
         self.game_info = GameInfo(**game_info_info)
 
     def _construct_from_replay_initial(self, replay_initial):
@@ -239,541 +395,465 @@ class AWBWGameState(game.GameState):
         self._construct_initial_buildings(replay_initial["buildings"])
         self._construct_initial_game_info(replay_initial)
 
-    def _apply_fire_action(self, action_data):
+    def _derive(self):
         """
-        Helper for fire actions
+        Returns a new state sharing every container and record with this one.
+
+        The new state copies a container or record the first time one of the
+        _update_* / _add_* helpers modifies it, so anything left unchanged by an
+        action stays shared with this state.
+        """
+        derived = AWBWGameState.__new__(AWBWGameState)
+        # pylint: disable=protected-access
+        derived.game_map = self.game_map
+        derived.game_info = self.game_info
+        derived.players = self.players
+        derived.units = self.units
+        derived.buildings = self.buildings
+        derived._unit_grid = self._unit_grid
+        derived._building_grid = self._building_grid
+        derived.player_stats = self.player_stats
+        derived._owned = set()
+        derived._changes = None
+        # Everything is now shared with the derived state
+        self._owned = set()
+        return derived
+
+    def _take_ownership(self):
+        """Copies every shared container and record, so the state can be modified in place"""
+        self.game_info = copy(self.game_info)
+        self.players = {p_id: copy(player) for p_id, player in self.players.items()}
+        if getattr(self.units, "owns_records", False):
+            self.units = copy(self.units)
+        else:
+            self.units = {u_id: copy(unit) for u_id, unit in self.units.items()}
+        self.buildings = {b_id: copy(building) for b_id, building in self.buildings.items()}
+        self._unit_grid = dict(self._unit_grid)
+        self.player_stats = {p_id: copy(stats) for p_id, stats in self.player_stats.items()}
+        self._owned = _OWNS_EVERYTHING
+
+    def _record_changes(self, name, r_id, record, changes):
+        """Appends a change record for each value in changes that differs from record"""
+        for key, value in changes.items():
+            old = record.get(key)
+            if _changed(old, value):
+                self._changes.append((name, r_id, key, old, value))
+
+    def _own_container(self, name):
+        """Returns the named container (ie. "units"), copying it first if it's shared"""
+        container = getattr(self, name)
+        if name not in self._owned:
+            container = copy(container)
+            setattr(self, name, container)
+            self._owned.add(name)
+        return container
+
+    def _update_record(self, name, r_id, changes):
+        """
+        Updates the values of a single record, copying it first if it's shared.
+
+        Arguments:
+        - name: The container holding the record ("players", "units" or "buildings")
+        - r_id: The id of the record in the container
+        - changes: Dictionary of the new values
+        """
+        record = self._own_record(name, r_id)
+        if self._changes is not None:
+            self._record_changes(name, r_id, record, changes)
+        if name == "units" and not (_GRID_KEYS.isdisjoint(changes)
+                and _UNIT_STATS_KEYS.isdisjoint(changes)):
+            old_tile = _grid_tile(record)
+            old_stats = _unit_stats(record)
+            record.update(changes)
+            self._move_on_grid(r_id, old_tile, _grid_tile(record))
+            self._adjust_player_stats(old_stats, _unit_stats(record))
+        elif name == "buildings" and not _BUILDING_STATS_KEYS.isdisjoint(changes):
+            old_stats = self._building_stats(record)
+            record.update(changes)
+            self._adjust_player_stats(old_stats, self._building_stats(record))
+        else:
+            record.update(changes)
+
+    def _own_record(self, name, r_id):
+        """Returns a record from the named container, copying it first if it's shared"""
+        container = self._own_container(name)
+        record = container[r_id]
+        # Containers that own their records (ie. a UnitStore) copied them along with the container
+        if (name, r_id) not in self._owned and not getattr(container, "owns_records", False):
+            record = copy(record)
+            container[r_id] = record
+            self._owned.add((name, r_id))
+        return record
+
+    def _building_stats(self, building):
+        return _building_stats(building, self.game_info["funds_per_property"])
+
+    def _adjust_player_stats(self, old_stats, new_stats):
+        """
+        Moves a record's contribution to the PlayerStats totals.
+
+        The totals are derived from the other records, so unlike _update_record
+        this doesn't add to the change records.
+
+        Arguments:
+        - old_stats: (player id, {stat: amount}) the record used to add, or None
+        - new_stats: (player id, {stat: amount}) the record adds now, or None
+        """
+        if old_stats == new_stats:
+            return
+        for stats, sign in ((old_stats, -1), (new_stats, 1)):
+            if stats is None or stats[0] not in self.player_stats or not stats[1]:
+                # Nothing to add, or a neutral building
+                continue
+            player_stats = self._own_record("player_stats", stats[0])
+            for key, amount in stats[1].items():
+                player_stats[key] += sign * amount
+
+    def _update_unit(self, u_id, changes):
+        """Updates the values of a unit. See _update_record."""
+        self._update_record("units", u_id, changes)
+
+    def _update_player(self, p_id, changes):
+        """Updates the values of a player. See _update_record."""
+        self._update_record("players", p_id, changes)
+
+    def _update_building(self, b_id, changes):
+        """Updates the values of a building. See _update_record."""
+        self._update_record("buildings", b_id, changes)
+
+    def _update_game_info(self, changes):
+        """Updates the global game info, copying it first if it's shared."""
+        if "game_info" not in self._owned:
+            self.game_info = copy(self.game_info)
+            self._owned.add("game_info")
+        if self._changes is not None:
+            self._record_changes("game_info", None, self.game_info, changes)
+        self.game_info.update(changes)
+
+    def _unit_ids_differing(self, values):
+        """Returns the ids of units where any key doesn't have the given value"""
+        if hasattr(self.units, "ids_differing"):
+            return self.units.ids_differing(values)
+        return [u_id for u_id, unit in self.units.items()
+                if any(_changed(unit[k], v) for k, v in values.items())]
+
+    def _unit_ids_of_players(self, p_ids):
+        """Returns the ids of units owned by any player in p_ids"""
+        if hasattr(self.units, "ids_of_players"):
+            return self.units.ids_of_players(p_ids)
+        return [u_id for u_id, unit in self.units.items() if unit["players_id"] in p_ids]
+
+    def _add_unit(self, unit):
+        """Adds (or replaces) a unit with a new Unit record."""
+        units = self._own_container("units")
+        u_id = unit["id"]
+        old_tile = None
+        old_stats = None
+        if u_id in units:
+            old_tile = _grid_tile(units[u_id])
+            old_stats = _unit_stats(units[u_id])
+        if self._changes is not None:
+            old = copy(units[u_id]) if u_id in units else None
+            self._changes.append(("units", u_id, None, old, unit))
+        units[u_id] = unit
+        self._owned.add(("units", u_id))
+        self._move_on_grid(u_id, old_tile, _grid_tile(unit))
+        self._adjust_player_stats(old_stats, _unit_stats(unit))
+
+    def _remove_unit(self, u_id):
+        """Removes a unit record entirely (as opposed to killing it)."""
+        units = self._own_container("units")
+        # Copied before deleting, since a UnitStore view stops working once its row is freed
+        unit = copy(units[u_id])
+        del units[u_id]
+        self._move_on_grid(u_id, _grid_tile(unit), None)
+        self._adjust_player_stats(_unit_stats(unit), None)
+
+    def _move_on_grid(self, u_id, old_tile, new_tile):
+        """Moves a unit between grid tiles, where None is off the grid"""
+        if old_tile == new_tile:
+            return
+        # Tiles hold tuples, so copying the grid is enough to share it between states
+        grid = self._own_container("_unit_grid")
+        if old_tile is not None:
+            remaining = tuple(other for other in grid.get(old_tile, ()) if other != u_id)
+            if remaining:
+                grid[old_tile] = remaining
+            else:
+                grid.pop(old_tile, None)
+        if new_tile is not None:
+            grid[new_tile] = grid.get(new_tile, ()) + (u_id,)
+
+    def unit_at(self, x, y):
+        """
+        Returns the id of the unit on a tile, or None if the tile is empty.
+
+        Carried and dead units are never on a tile. While a Load or Join action
+        is applied two units may briefly share a tile; this returns the last one
+        to arrive.
         """
-        logging.debug("Fire action")
+        units = self._unit_grid.get((x, y))
+        return units[-1] if units else None
+
+    def units_at(self, x, y):
+        """Returns a tuple of the ids of every unit on a tile"""
+        return self._unit_grid.get((x, y), ())
+
+    def is_occupied(self, x, y):
+        """Returns True if any unit is on a tile"""
+        return (x, y) in self._unit_grid
+
+    def building_at(self, x, y):
+        """Returns the id of the building on a tile, or None if there isn't one"""
+        return self._building_grid.get((x, y))
+
+    def units_near(self, x, y, distance=1):
+        """
+        Arguments:
+        - x, y: The center tile
+        - distance: Maximum number of steps (Manhattan distance) from the center
+
+        Returns:
+        - List of ids of the units within distance of (x, y), including the center tile
+        """
+        return [u_id for _tile, u_ids in _near_tiles(self._unit_grid, x, y, distance)
+                for u_id in u_ids]
+
+    def buildings_near(self, x, y, distance=1):
+        """Returns the list of ids of the buildings within distance of (x, y), see units_near"""
+        return [b_id for _tile, b_id in _near_tiles(self._building_grid, x, y, distance)]
 
+    # The _apply_* helpers modify a state derived with _derive in place, from
+    # the records of the actions module.
+
+    def _apply_fire_action(self, action):
+        """
+        Helper for fire actions
+        """
         # Unit info
         # - position change
-        move_state = self
-        if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
-
-        fire_action = action_data["Fire"]
-        assert isinstance(fire_action, dict)
+        if action.move is not None:
+            self._apply_move_action(action.move)
 
         # Player info
         # - power meters
-        new_player_info = deepcopy(move_state.players)
-        for values in fire_action["copValues"].values():
-            p_id = int(values["playerId"])
-            # For some reason, the replay data has the co power meter multiplied
-            # by a magnitude of 10.
-            new_player_info[p_id]["co_power"] = int(values["copValue"]) / 10
-
-        # Handle funds change in the case of Sasha's power
-        gained_funds = {}
+        for p_id, co_power in action.co_powers:
+            self._update_player(p_id, {"co_power": co_power})
 
         # Unit info
         # - ammo change
         # - health change
-        new_unit_info = deepcopy(move_state.units)
-        for combatinfo in fire_action["combatInfoVision"].values():
-            if not isinstance(combatinfo, dict) or not isinstance(combatinfo["combatInfo"], dict):
-                continue
-            for role in ["attacker", "defender"]:
-                if role in combatinfo["combatInfo"]:
-                    unit = combatinfo["combatInfo"][role]
-                    if not isinstance(unit, dict):
-                        # Indicates a unseen attacker
-                        continue
-                    u_id = int(unit["units_id"])
-                    assert u_id in new_unit_info
-                    updated_unit_data = {
-                        "hit_points": unit["units_hit_points"],
-                        "ammo": unit["units_ammo"],
-                        "fired": role == "attacker",
-                    }
-                    new_unit_info[u_id] = {
-                        **new_unit_info[u_id],
-                        **updated_unit_data,
-                    }
-            if "gainedFunds" in combatinfo["combatInfo"]:
-                fundsinfo = combatinfo["combatInfo"]["gainedFunds"]
-                for p_id, funds in fundsinfo.items():
-                    p_id = int(p_id)
-                    if funds is not None:
-                        gained_funds[p_id] = funds
-
-        for p_id, funds in gained_funds.items():
-            new_player_info[p_id]["funds"] += funds
-
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
-
-    def _apply_join_action(self, action_data):
+        for u_id, hit_points, ammo, fired in action.combatants:
+            assert u_id in self.units
+            self._update_unit(u_id, {"hit_points": hit_points, "ammo": ammo, "fired": fired})
+
+        # Handle funds change in the case of Sasha's power
+        for p_id, funds in action.gained_funds:
+            self._update_player(p_id, {"funds": self.players[p_id]["funds"] + funds})
+
+    def _apply_join_action(self, action):
         """
         Helper for join actions
         """
-        logging.debug("Join action")
-        # To join two units, one must be moved
-        assert "Move" in action_data
-        move_state = self._apply_move_action(action_data["Move"])
+        self._apply_move_action(action.move)
 
-        join_action = action_data["Join"]
         # The unit that now has 0 health due to joining
-        joined_u_id = None
-        for u_id in join_action["joinID"].values():
-            if isinstance(u_id, int):
-                joined_u_id = u_id
-                break
-        assert joined_u_id is not None
-        assert joined_u_id in move_state.units
-        new_unit_info = deepcopy(move_state.units)
+        assert action.joined_id in self.units
         # Set hit points of old unit to 0 to indicate it no longer exists
-        new_unit_info[joined_u_id]["hit_points"] = 0
-        p_id = new_unit_info[joined_u_id]["players_id"]
+        self._update_unit(action.joined_id, {"hit_points": 0})
+        p_id = self.units[action.joined_id]["players_id"]
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(move_state.players)
-        for funds in join_action["newFunds"].values():
-            if isinstance(funds, int):
-                new_player_info[p_id]["funds"] = funds
-                break
+        if action.funds is not None:
+            self._update_player(p_id, {"funds": action.funds})
 
         # Unit info
         # - ammo change
         # - health change
-        unit_info = join_action["unit"]
-        for unit in unit_info.values():
-            if not isinstance(unit, dict):
-                continue
-            if "units_x" not in unit or "units_y" not in unit:
-                # Not the unit that moved, just another player's view of the unit.
-                # Because it's another player's view, it won't have the full unit info
-                # in the case where the unit moves back into the fog.
-                continue
-            u_id = unit["units_id"]
-            assert u_id in new_unit_info
+        unit = action.unit
+        if unit is not None:
+            u_id = unit["id"]
+            assert u_id in self.units
             # Overwrite every value for the unit, to be detail oriented.
             # I don't know what the answer is if two APCs carrying units try to join...
-            for k in new_unit_info[u_id]:
-                new_unit_info[u_id][k] = unit["units_" + k]
+            self._update_unit(u_id, {k: unit[k] for k in self.units[u_id]})
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
-
-    def _apply_resign_action(self, action_data):
+    def _apply_resign_action(self, action):
         """
         Helper for resign actions
         """
-        logging.debug("Resign action")
-        new_game_info = self.game_info
-        if "GameOver" in action_data:
-            new_game_info = deepcopy(self.game_info)
-            new_game_info["game_over"] = True
-
-        new_player_info = deepcopy(self.players)
-        p_id = action_data["Resign"]["playerId"]
-        new_player_info[p_id]["eliminated"] = True
+        if action.game_over:
+            self._update_game_info({"game_over": True})
 
-        # TODO: The GameOver / Resign messages actual contain usernames.
+        self._update_player(action.player_id, {"eliminated": True})
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=self.units,
-                buildings=self.buildings,
-                game_info=new_game_info)
-
-    def _apply_move_action(self, action_data):
+    def _apply_move_action(self, action):
         """
         Helper for move actions
         """
-        logging.debug("Move action")
-        new_unit_info = deepcopy(self.units)
         # Unit info
         # - position change
         # - fuel change
-        for unit in action_data["unit"].values():
-            if not isinstance(unit, dict):
-                continue
-            if not "units_x" in unit or not "units_y" in unit:
-                # Just another player's view of the unit.
-                # Because it's another player's view, it won't have the full unit info
-                # in the case where the unit moves back into the fog.
-                continue
-            u_id = unit["units_id"]
-            if u_id not in new_unit_info:
-                logging.warning("Unknown unit id %d in move info", u_id)
-                logging.debug("Creating new unit %d from move info", u_id)
-                unit_info = {}
-                unit_keys_int = [
-                        "id",
-                        "players_id",
-                        "fuel",
-                        "fuel_per_turn",
-                        "ammo",
-                        "cost",
-                        "x",
-                        "y",
-                        "hit_points"
-                ]
-                prefix = "units_"
-                unit_keys_str = ["name", "symbol", "movement_type"]
-                for k in unit_keys_int:
-                    unit_info[k] = int(unit[prefix + k])
-                for k in unit_keys_str:
-                    unit_info[k] = unit[prefix + k]
-                new_unit_info[u_id] = Unit(**unit_info)
-
-            updated_unit_data = {
-                "x" : unit["units_x"],
-                "y": unit["units_y"],
-                "moved": True,
-                "fuel": unit["units_fuel"]
-            }
-            new_unit_info[u_id] = {**new_unit_info[u_id], **updated_unit_data}
-
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=self.players,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
-
-    def _apply_build_action(self, action_data):
+        unit = action.unit
+        if unit is None:
+            # Only other players' views of the unit, which won't have the full
+            # unit info in the case where the unit moves back into the fog.
+            return
+        u_id = unit["id"]
+        if u_id not in self.units:
+            logging.warning("Unknown unit id %d in move info", u_id)
+            logging.debug("Creating new unit %d from move info", u_id)
+            self._add_unit(Unit(_replay_record_info(unit, _UNIT_REPLAY_FIELDS)))
+
+        self._update_unit(u_id, {
+            "x" : unit["x"],
+            "y": unit["y"],
+            "moved": True,
+            "fuel": unit["fuel"]
+        })
+
+    def _apply_build_action(self, action):
         """
         Helper for build actions
         """
-        logging.debug("Build action")
-
-        info = action_data["newUnit"]
         # Unit info
         # - new unit
-        built_unit = {}
-        new_unit_info = deepcopy(self.units)
-        unit_info = None
-
-        # Figure out what information is the true info for the unit
-        if "global" in info and len(info) == 1:
-            # This is a normal standard match, where the unit is not Sonja's
-            unit_info = info["global"]
-        else:
-            # This unit has special vision information (FOG or Sonja's unit)
-            for p_id, unit in info.items():
-                if p_id == "global":
-                    continue
-                p_id = int(p_id)
-                # Only pick the unit that has full information
-                # (since a player always has full view of their units)
-                if unit["units_players_id"] == p_id:
-                    unit_info = unit
-                    break
-
-        assert unit_info is not None
-
-        unit_keys_int = [
-                "id",
-                "players_id",
-                "fuel",
-                "fuel_per_turn",
-                "ammo",
-                "cost",
-                "x",
-                "y",
-                "hit_points"
-        ]
-        prefix = "units_"
-        unit_keys_str = ["name", "symbol", "movement_type"]
-        for k in unit_keys_int:
-            built_unit[k] = int(unit_info[prefix + k])
-        for k in unit_keys_str:
-            built_unit[k] = unit_info[prefix + k]
-        new_unit_info[built_unit["id"]] = Unit(**built_unit)
+        built_unit = Unit(_replay_record_info(action.unit, _UNIT_REPLAY_FIELDS))
+        self._add_unit(built_unit)
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(self.players)
         p_id = built_unit["players_id"]
         if not p_id == self.game_info["active_player_id"]:
             logging.warning("Build action for non-active player %d", p_id)
-        new_player_info[p_id]["funds"] -= built_unit["cost"]
+        self._update_player(p_id, {"funds": self.players[p_id]["funds"] - built_unit["cost"]})
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
-
-    def _apply_end_action(self, action_data):
+    def _apply_end_action(self, action):
         """
         Helper for end actions
         """
-        logging.debug("End action")
-        info = action_data["updatedInfo"]
         # GameInfo Info - new active player, turn, and day
-        updated_game_info = {
-            "active_player_id": int(info["nextPId"]),
+        self._update_game_info({
+            "active_player_id": action.next_player_id,
             "turn": self.game_info["turn"] + 1,
-            "day": int(info["day"]),
-        }
-        new_global_info = {**self.game_info, **updated_game_info}
+            "day": action.day,
+        })
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(self.players)
-        funds_info = info["nextFunds"]
-        p_id = info["nextPId"]
-        for value in funds_info.values():
-            # This is definiely weird. We have to do it this way because in Fog
-            # matches, funds are hidden from some players, and therefore there
-            # is a view on the newFunds variable, with the hidden values being ''
-            if isinstance(value, int):
-                new_player_info[p_id]["funds"] = value
-                break
-        new_player_info[p_id]["co_power_on"] = False
-        new_player_info[p_id]["super_co_power_on"] = False
+        updated_player_info = {
+            "co_power_on": False,
+            "super_co_power_on": False,
+        }
+        if action.funds is not None:
+            updated_player_info["funds"] = action.funds
+        self._update_player(action.next_player_id, updated_player_info)
 
         # Unit info
         # - TODO resupply
         # - fuel cost
         # - sank / crashed units
-        new_unit_info = deepcopy(self.units)
-        repaired_info = info["repaired"]
-        if repaired_info and isinstance(repaired_info, dict):
-            for value in repaired_info.values():
-                assert isinstance(value, list)
-                for unit in value:
-                    u_id = int(unit["units_id"])
-                    if u_id not in new_unit_info:
-                        logging.warning("Unknown unit id %d in repair info", u_id)
-                        continue
-                    new_unit_info[u_id]["hit_points"] = unit["units_hit_points"]
+        for u_id, hit_points in action.repaired:
+            if u_id not in self.units:
+                logging.warning("Unknown unit id %d in repair info", u_id)
+                continue
+            self._update_unit(u_id, {"hit_points": hit_points})
         # Unmark moved, captured, fired flags
-        for u_id, unit in new_unit_info.items():
-            unit["moved"] = False
-            unit["capture"] = False
-            unit["fired"] = False
-
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=new_global_info)
-
-    def _apply_power_action_unit_add(self, action_data, new_unit_info):
-        """
-        Helper for power actions unitAdd actions.
-
-        Modifies new_unit_info in place. Also returns another reference to new_unit_info.
-        """
-        # pylint: disable=no-self-use
-        if "unitAdd" in action_data:
-            assert action_data["coName"] == "Sensei"
-            unit_add_info = None
-            if "global" in action_data["unitAdd"]:
-                unit_add_info = action_data["unitAdd"]["global"]
-            else:
-                for p_id, info in action_data["unitAdd"].items():
-                    if p_id == "global":
-                        continue
-                    p_id = int(p_id)
-                    if p_id == info["playerId"]:
-                        unit_add_info = info
-                        break
-            assert unit_add_info is not None
-
-            # TODO: Improve unit creation from incomplete data
-            name = unit_add_info["unitName"]
-            # Infantry cost for Sensei
-            cost = 1000
-            if name == "Mech":
-                cost = 3000
-            new_unit_template = {
-                "players_id": unit_add_info["playerId"],
-                "name": name,
-                "hit_points": 9, # Sensei's power creates the units all at 9hp...
-                "cost": cost,
-            }
-            for unit in unit_add_info["units"]:
-                u_id = unit["units_id"]
-                unit_info = {
-                    "id": u_id,
-                    "x": unit["units_x"],
-                    "y": unit["units_y"],
-                }
-                new_unit_info[u_id] = Unit(new_unit_template, **unit_info)
-
-        return new_unit_info
+        cleared_flags = {"moved": False, "capture": False, "fired": False}
+        # Only units that acted this turn need a new record
+        for u_id in self._unit_ids_differing(cleared_flags):
+            self._update_unit(u_id, cleared_flags)
 
-    def _apply_power_action_hp_change(self, action_data, new_unit_info):
-        """
-        Helper for power actions hpChange actions.
-
-        Modifies new_unit_info in place. Also returns another reference to new_unit_info.
-        """
-        # pylint: disable=no-self-use
-        if "hpChange" in action_data:
-            for hp_type in ["hpGain", "hpLoss"]:
-                if (hp_type in action_data["hpChange"] and
-                    isinstance(action_data["hpChange"][hp_type], dict)):
-                    hp_gain_info = action_data["hpChange"][hp_type]
-                    hit_points = hp_gain_info["hp"]
-                    # TODO: Handle units_fuel
-                    for u_id, unit in new_unit_info.items():
-                        if unit["players_id"] in hp_gain_info:
-                            new_hp = new_unit_info[u_id]["hit_points"] + hit_points
-                            new_unit_info[u_id]["hit_points"] += max(1, min(10, new_hp))
-
-        return new_unit_info
-
-
-    def _apply_power_action_unit_replace(self, action_data, new_unit_info):
-        """
-        Helper for power actions unitReplace actions.
-
-        Modifies new_unit_info in place. Also returns another reference to new_unit_info.
-        """
-        # pylint: disable=no-self-use
-        if "unitReplace" in action_data:
-            unit_replay_info = action_data["unitReplace"]
-            # Iterate through all the values here. Since it's setting the new health
-            # it's fine if we modify the same unit multiple times due to it showing
-            # up in multiple views.
-            for units in unit_replay_info.values():
-                if not units or not units["units"]:
-                    continue
-                for unit in units["units"]:
-                    u_id = unit["units_id"]
-                    if "units_hit_points" in unit:
-                        hit_points = unit["units_hit_points"]
-                        new_unit_info[u_id]["hit_points"] = hit_points
-                    if "units_moved" in unit:
-                        new_unit_info[u_id]["moved"] = True
-
-        return new_unit_info
-
-
-    def _apply_power_action(self, action_data):
+    def _apply_power_action(self, action):
         """
         Helper for power actions
         """
-        logging.debug("Power action")
-
         # Player info
         # - power status
         # - funds change
         # - power meter change
-        p_id = action_data["playerID"]
-        co_meter = action_data["playersCOP"]
-        new_player_info = deepcopy(self.players)
-        new_player_info[p_id]["co_power"] = co_meter
-        new_player_info[p_id]["co_power_on"] = (action_data["coPower"] == "Y")
-        new_player_info[p_id]["super_co_power_on"] = (action_data["coPower"] == "S")
+        self._update_player(action.player_id, {
+            "co_power": action.co_power,
+            "co_power_on": action.co_power_on,
+            "super_co_power_on": action.super_co_power_on,
+        })
 
         # Unit info
         # - health change
         # - ammo change
         # - fuel change
         # - new unit(s)
-        new_unit_info = deepcopy(self.units)
         # Sensei's powers add units...
-        new_unit_info = self._apply_power_action_unit_add(action_data, new_unit_info)
+        if action.unit_add is not None:
+            p_id, name, cost, units = action.unit_add
+            new_unit_template = {
+                "players_id": p_id,
+                "name": name,
+                "hit_points": 9, # Sensei's power creates the units all at 9hp...
+                "cost": cost,
+            }
+            for u_id, x, y in units:
+                self._add_unit(Unit(new_unit_template, id=u_id, x=x, y=y))
+
         # Hawke, Drake, Olaf, Andy, etc... affect global health of units
-        new_unit_info = self._apply_power_action_hp_change(action_data, new_unit_info)
+        # TODO: Handle units_fuel
+        for p_ids, hit_points in action.hp_changes:
+            for u_id in self._unit_ids_of_players(p_ids):
+                unit = self.units[u_id]
+                if unit["hit_points"] <= 0:
+                    continue
+                # Powers never take a unit below 1 or above 10 hit points
+                new_hp = max(1, min(10, unit["hit_points"] + hit_points))
+                self._update_unit(u_id, {"hit_points": new_hp})
+
         # Von Bolt, Rachel, Sturm, Kindle...
         # And movement affecting abilities...
-        new_unit_info = self._apply_power_action_unit_replace(action_data, new_unit_info)
+        for u_id, hit_points, moved in action.unit_replace:
+            if hit_points is not None:
+                self._update_unit(u_id, {"hit_points": hit_points})
+            if moved:
+                self._update_unit(u_id, {"moved": True})
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
-
-    def _apply_capt_action(self, action_data):
+    def _apply_capt_action(self, action):
         """
         Helper for capt actions
         """
-        logging.debug("Capt action")
-        move_state = self
-        if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
         # Unit info
         # - position change
         # - fuel change
+        if action.move is not None:
+            self._apply_move_action(action.move)
 
         # Building info
         # - capture status
         # - ownership status
-        capt_action = action_data["Capt"]
-        building = capt_action["buildingInfo"]
-        b_id = int(building["buildings_id"])
-        assert b_id in move_state.buildings
-        new_building_info = deepcopy(move_state.buildings)
-        new_building_info[b_id]["capture"] = building["buildings_capture"]
-        new_building_info[b_id]["team"] = building["buildings_team"]
-
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=move_state.units,
-                buildings=new_building_info,
-                game_info=move_state.game_info)
-
-    def _apply_repair_action(self, action_data):
+        assert action.building_id in self.buildings
+        self._update_building(action.building_id, action.building)
+
+    def _apply_repair_action(self, action):
         """
         Helper for repair actions
         """
-        logging.debug("Repair action")
-        move_state = self
-        if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+        if action.move is not None:
+            self._apply_move_action(action.move)
         # Unit info
         # - fuel change
         # - hitpoint change
-        new_unit_info = deepcopy(move_state.units)
-
-        repair_info = action_data["Repair"]
-        p_id = None
-        for value in repair_info["repaired"].values():
-            if isinstance(value, dict):
-                new_unit_info[value["units_id"]]["hit_points"] = value["units_hit_points"]
-                p_id = new_unit_info[value["units_id"]]["players_id"]
-                break
-        assert p_id is not None
+        self._update_unit(action.unit_id, {"hit_points": action.hit_points})
+        p_id = self.units[action.unit_id]["players_id"]
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(move_state.players)
-        assert p_id in new_player_info
-        funds = None
-        for value in repair_info["funds"].values():
-            if isinstance(value, int):
-                funds = value
-                break
-        new_player_info[p_id]["funds"] = funds
-
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
-
-    def _apply_supply_action(self, action_data):
+        assert p_id in self.players
+        self._update_player(p_id, {"funds": action.funds})
+
+    def _apply_supply_action(self, action):
         """
         Helper for supply actions
         """
-        logging.debug("Supply action")
-        move_state = self
-        if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+        if action.move is not None:
+            self._apply_move_action(action.move)
 
         # No funds change on supply.
 
@@ -782,184 +862,191 @@ class AWBWGameState(game.GameState):
         # The supply data doesn't actually include the new fuel values,
         # so for now we'll only handle the move part.
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=move_state.units,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
-
-    def _apply_load_action(self, action_data):
+    def _apply_load_action(self, action):
         """
         Helper for load actions
         """
-        logging.debug("Load action")
-
-        # To load a unit into a transport, one must be moved
-        assert "Move" in action_data
-        move_state = self._apply_move_action(action_data["Move"])
+        self._apply_move_action(action.move)
 
         # Mark transport as carrying a unit, and the loaded unit as being carried
-        load_action = action_data["Load"]
-        loaded_id = 0
-        transport_id = 0
-        for u_id in load_action["loaded"].values():
-            if isinstance(u_id, int):
-                loaded_id = u_id
-                break
-        for u_id in load_action["transport"].values():
-            if isinstance(u_id, int):
-                transport_id = u_id
-                break
-
-        new_unit_info = deepcopy(move_state.units)
+        loaded_id = action.loaded_id
+        transport_id = action.transport_id
+
         # Units must already exist to be loaded / moved
-        assert (loaded_id in new_unit_info) and (transport_id in new_unit_info)
-        new_unit_info[loaded_id]["carried"] = True
-        if new_unit_info[transport_id]["cargo1_units_id"] == 0:
-            new_unit_info[transport_id]["cargo1_units_id"] = loaded_id
+        assert (loaded_id in self.units) and (transport_id in self.units)
+        self._update_unit(loaded_id, {"carried": True})
+        if self.units[transport_id]["cargo1_units_id"] == 0:
+            self._update_unit(transport_id, {"cargo1_units_id": loaded_id})
         else:
-            new_unit_info[transport_id]["cargo2_units_id"] = loaded_id
+            self._update_unit(transport_id, {"cargo2_units_id": loaded_id})
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
-
-    def _apply_unload_action(self, action_data):
+    def _apply_unload_action(self, action):
         """
         Helper for unload actions
         """
-        logging.debug("Unload action")
-
-        new_unit_info = deepcopy(self.units)
-        transport_id = action_data["transportID"]
-        unit = None
-        for value in action_data["unit"].values():
-            if isinstance(value, dict) and "units_x" in value and "units_y" in value:
-                unit = value
-                break
-        assert unit is not None
-        loaded_id = unit["units_id"]
-        if new_unit_info[transport_id]["cargo1_units_id"] == loaded_id:
-            new_unit_info[transport_id]["cargo1_units_id"] = 0
+        transport_id = action.transport_id
+        loaded_id = action.unit["id"]
+        if self.units[transport_id]["cargo1_units_id"] == loaded_id:
+            self._update_unit(transport_id, {"cargo1_units_id": 0})
         else:
-            new_unit_info[transport_id]["cargo2_units_id"] = 0
-
-        unit_keys_int = [
-                "id",
-                "players_id",
-                "fuel",
-                "fuel_per_turn",
-                "ammo",
-                "cost",
-                "x",
-                "y",
-                "hit_points"
-        ]
-        prefix = "units_"
-        unit_keys_str = ["name", "symbol", "movement_type"]
-        for k in unit_keys_int:
-            new_unit_info[loaded_id][k] = int(unit[prefix + k])
-        for k in unit_keys_str:
-            new_unit_info[loaded_id][k] = unit[prefix + k]
-        new_unit_info[loaded_id]["carried"] = False
-
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=self.players,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
-
-    def _apply_delete_action(self, action_data):
+            self._update_unit(transport_id, {"cargo2_units_id": 0})
+
+        self._update_unit(loaded_id, {
+            **_replay_record_info(action.unit, _UNIT_REPLAY_FIELDS),
+            "carried": False,
+        })
+
+    def _apply_delete_action(self, action):
         """
         Helper for delete actions
         """
-        logging.debug("Delete action")
-
-        new_unit_info = deepcopy(self.units)
-        for u_id in action_data["Delete"]["unitId"].values():
-            if isinstance(u_id, int):
-                # Set the unit's hp to zero to treat it as deleted
-                new_unit_info[u_id]["hit_points"] = 0
+        for u_id in action.unit_ids:
+            # Set the unit's hp to zero to treat it as deleted
+            self._update_unit(u_id, {"hit_points": 0})
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=self.players,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
-
-    def _apply_hide_action(self, action_data):
+    def _apply_hide_action(self, action):
         """
         Helper for hide actions
         """
-        logging.debug("Hide action")
-
-        move_state = self
-        if "Move" in action_data:
-            move_state = self._apply_move_action(action_data["Move"])
+        if action.move is not None:
+            self._apply_move_action(action.move)
 
-        hide_info = action_data["Hide"]
-        new_unit_info = deepcopy(move_state.units)
-        for u_id in hide_info["unit"].values():
-            if isinstance(u_id, int):
-                new_unit_info[u_id]["sub_dive"] = True
+        for u_id in action.unit_ids:
+            self._update_unit(u_id, {"sub_dive": True})
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
-
-    def _apply_unhide_action(self, action_data):
+    def _apply_unhide_action(self, action):
         """
         Helper for unhide actions
         """
-        logging.debug("Unhide action")
-
-        move_state = self
-        if "Move" in action_data:
-            move_state = self._apply_move_action(action_data["Move"])
-
-        unhide_info = action_data["Unhide"]
-        new_unit_info = deepcopy(move_state.units)
-        for unit in unhide_info["unit"].values():
-            if isinstance(unit, dict) and "units_x" in unit and "units_y" in unit:
-                u_id = unit["units_id"]
-                new_unit_info[u_id]["sub_dive"] = False
-
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
-
-    _ACTION_TYPE_TO_APPLY_FUNC = {
-            AWBWGameAction.Type.FIRE : _apply_fire_action,
-            AWBWGameAction.Type.JOIN : _apply_join_action,
-            AWBWGameAction.Type.RESIGN : _apply_resign_action,
-            AWBWGameAction.Type.MOVE : _apply_move_action,
-            AWBWGameAction.Type.BUILD : _apply_build_action,
-            AWBWGameAction.Type.END : _apply_end_action,
-            AWBWGameAction.Type.POWER : _apply_power_action,
-            AWBWGameAction.Type.CAPT : _apply_capt_action,
-            AWBWGameAction.Type.LOAD : _apply_load_action,
-            AWBWGameAction.Type.UNLOAD : _apply_unload_action,
-            AWBWGameAction.Type.REPAIR : _apply_repair_action,
-            AWBWGameAction.Type.SUPPLY : _apply_supply_action,
-            AWBWGameAction.Type.DELETE : _apply_delete_action,
-            AWBWGameAction.Type.HIDE : _apply_hide_action,
-            AWBWGameAction.Type.UNHIDE : _apply_unhide_action,
+        if action.move is not None:
+            self._apply_move_action(action.move)
+
+        for u_id in action.unit_ids:
+            self._update_unit(u_id, {"sub_dive": False})
+
+    _RECORD_TYPE_TO_APPLY_FUNC = {
+            actions.Fire : _apply_fire_action,
+            actions.Join : _apply_join_action,
+            actions.Resign : _apply_resign_action,
+            actions.Move : _apply_move_action,
+            actions.Build : _apply_build_action,
+            actions.End : _apply_end_action,
+            actions.Power : _apply_power_action,
+            actions.Capt : _apply_capt_action,
+            actions.Load : _apply_load_action,
+            actions.Unload : _apply_unload_action,
+            actions.Repair : _apply_repair_action,
+            actions.Supply : _apply_supply_action,
+            actions.Delete : _apply_delete_action,
+            actions.Hide : _apply_hide_action,
+            actions.Unhide : _apply_unhide_action,
             }
 
+    def _apply_compiled(self, action):
+        """Applies an AWBWGameAction or compiled action record to this state in place"""
+        if isinstance(action, AWBWGameAction):
+            action = action.compiled()
+        stats = instrument.active()
+        if stats is None:
+            self._RECORD_TYPE_TO_APPLY_FUNC[type(action)](self, action)
+        else:
+            self._apply_instrumented(action, stats)
+
+    def _apply_instrumented(self, action, stats):
+        """
+        Helper for _apply_compiled while instrument.collect() is active. Change
+        records are kept to count the units touched, so the time includes them.
+        """
+        changes = self._changes
+        if changes is None:
+            self._changes = []
+        start = len(self._changes)
+        start_time = time.perf_counter()
+        try:
+            self._RECORD_TYPE_TO_APPLY_FUNC[type(action)](self, action)
+            elapsed = time.perf_counter() - start_time
+            units = {r_id for name, r_id, *_ in self._changes[start:] if name == "units"}
+        finally:
+            self._changes = changes
+        stats.record_action(action.ACTION, elapsed, len(units))
+
     def apply_action(self, action):
-        return self._ACTION_TYPE_TO_APPLY_FUNC[action.type](self, action.info)
+        """
+        Arguments:
+        - action: An AWBWGameAction, or a record from actions.compile_action.
+          Applying compiled records skips reading the replay's views of the
+          action again.
+
+        Returns:
+        - The new state after the action
+        """
+        derived = self._derive()
+        derived._apply_compiled(action) # pylint: disable=protected-access
+        return derived
+
+    def apply_action_inplace(self, action, changes=None):
+        """
+        Applies an action directly to this state, without creating a new one.
+
+        Reaches the same state as apply_action, but earlier values are lost, so
+        use it when only the latest state is needed. The first call on a state
+        that shares records with other states (ie. one returned by apply_action)
+        copies them once; later calls don't copy anything.
+
+        Arguments:
+        - action: The AWBWGameAction or compiled action record to apply
+        - changes: Optional list to append a change record to for each value the
+          action changes. Records are (container, id, key, old value, new value)
+          tuples, with container one of "game_info" (id None), "players", "units"
+          or "buildings". A key of None means the whole record was added, with an
+          old value of None unless it replaced an existing record.
+
+        Returns:
+        - This state
+        """
+        if self._owned is not _OWNS_EVERYTHING:
+            self._take_ownership()
+        self._changes = changes
+        try:
+            self._apply_compiled(action)
+        finally:
+            self._changes = None
+        return self
+
+    def apply_changes(self, changes, inverse=False):
+        """
+        Applies change records from apply_action_inplace to a new state.
+
+        Arguments:
+        - changes: Sequence of change records, in the order they were recorded
+        - inverse: If True, undo the changes instead, going back to the state
+          before they were recorded
+
+        Returns:
+        - A new state sharing unchanged records with this one, like apply_action
+        """
+        derived = self._derive()
+        derived._apply_changes(changes, inverse) # pylint: disable=protected-access
+        return derived
+
+    def _apply_changes(self, changes, inverse):
+        """Helper for apply_changes, which modifies a derived state in place"""
+        if inverse:
+            changes = reversed(changes)
+        for name, r_id, key, old, new in changes:
+            if inverse:
+                old, new = new, old
+            if name == "game_info":
+                self._update_game_info({key: new})
+            elif key is None:
+                # Only units are added. The record is copied so later changes
+                # don't modify the one in changes.
+                if new is None:
+                    self._remove_unit(r_id)
+                else:
+                    self._add_unit(copy(new))
+            else:
+                self._update_record(name, r_id, {key: new})
 
 if __name__ == "__main__":
     import sys
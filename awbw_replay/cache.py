@@ -0,0 +1,241 @@
+"""Persistent on-disk cache of parsed AWBW replays."""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import zlib
+
+# Every cache file starts with this magic string followed by the format version.
+# Entries written with any other version are treated as a miss and removed.
+_MAGIC = b"AWBWRC"
+
+def content_hash(path):
+    """
+    Arguments:
+    - path: str or Path of a file
+
+    Returns:
+    - Hex digest of the file contents
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ReplayCache():
+    """
+    Stores the parsed game info and turns of replays in a directory, so that
+    reopening the same replay skips decompressing and decoding the archive.
+
+    Usage:
+
+    cache = ReplayCache("replay_cache", max_bytes=512 * 1024 * 1024)
+    with AWBWReplay("52963.zip", cache=cache) as replay:
+        ...
+
+    Entries are evicted least recently used first once the directory grows past
+    max_bytes, down to LOW_WATER of it so the next few stores don't evict again.
+    The size of the directory is only scanned when the cache is created and when
+    evicting, and tracked in between, so entries written by other processes are
+    only noticed by the next eviction.
+    """
+
+    # Bump whenever the pickled replay contents change shape
+    FORMAT_VERSION = 1
+
+    KEY_CONTENT = "content"
+    KEY_STAT = "stat"
+
+    # Fraction of max_bytes that eviction brings the cache down to
+    LOW_WATER = 0.8
+
+    _SUFFIX = ".replay"
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, key=KEY_CONTENT, compress=False):
+        """
+        Arguments:
+        - directory: str or Path of the cache directory. Created if it doesn't exist.
+        - max_bytes: Size cap for all cache entries combined, or None for no cap.
+        - key: KEY_CONTENT to key entries on a hash of the archive contents, or
+          KEY_STAT to key them on the archive path, modification time and size
+          (cheaper, but doesn't follow renamed or copied archives).
+        - compress: If True, zlib compress entries. About 10x smaller on disk,
+          at the cost of slower loads.
+        """
+        if key not in (self.KEY_CONTENT, self.KEY_STAT):
+            raise ValueError(f"Unsupported cache key type {key}")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.key = key
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Combined size of the entries, kept up to date by store and _remove
+        self.total_bytes = sum(size for _mtime, size, _path in self._entries())
+
+    def key_for(self, path):
+        """
+        Arguments:
+        - path: str or Path of the replay archive
+
+        Returns:
+        - The cache key string for the archive
+        """
+        if self.key == self.KEY_CONTENT:
+            return content_hash(path)
+        digest = hashlib.blake2b(digest_size=20)
+        stat = os.stat(path)
+        digest.update(os.path.abspath(path).encode())
+        digest.update(f":{stat.st_mtime_ns}:{stat.st_size}".encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + self._SUFFIX)
+
+    def contains(self, key):
+        """
+        Checks for an entry without reading it or counting a hit or miss, so it's
+        safe to call from any thread. The entry may still turn out to be stale.
+
+        Arguments:
+        - key: Cache key from key_for
+
+        Returns:
+        - True if there is an entry for key
+        """
+        return os.path.exists(self._entry_path(key))
+
+    def load(self, key):
+        """
+        Arguments:
+        - key: Cache key from key_for
+
+        Returns:
+        - The stored object, or None on a miss
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        header = _MAGIC + bytes([self.FORMAT_VERSION])
+        if not data.startswith(header):
+            logging.debug("Removing stale cache entry %s", entry_path)
+            self._remove(entry_path)
+            self.misses += 1
+            return None
+
+        try:
+            payload = data[len(header) + 1:]
+            if data[len(header)]:
+                payload = zlib.decompress(payload)
+            result = pickle.loads(payload)
+        # A truncated or corrupt pickle can raise almost any exception type
+        except Exception as e: # pylint: disable=broad-except
+            logging.warning("Removing corrupt cache entry %s: %s: %s",
+                            entry_path, type(e).__name__, e)
+            self._remove(entry_path)
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used for eviction
+        os.utime(entry_path)
+        self.hits += 1
+        return result
+
+    def store(self, key, obj):
+        """
+        Stores obj under key, then evicts old entries if over the size cap.
+
+        Arguments:
+        - key: Cache key from key_for
+        - obj: Picklable object to store
+        """
+        payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+        header = _MAGIC + bytes([self.FORMAT_VERSION, self.compress])
+
+        # Write to a temporary file first so readers never see a partial entry
+        entry_path = self._entry_path(key)
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as file:
+            file.write(header)
+            file.write(payload)
+        replaced_size = self._entry_size(entry_path)
+        os.replace(file.name, entry_path)
+        self.total_bytes += len(header) + len(payload) - replaced_size
+
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            self.evict(int(self.max_bytes * self.LOW_WATER))
+
+    def evict(self, max_bytes=None):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+
+        Arguments:
+        - max_bytes: Size to bring the cache down to, or None for self.max_bytes
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if max_bytes is None:
+            return
+
+        entries = self._entries()
+        # Rescanned, so entries added or removed by other processes are counted
+        self.total_bytes = sum(size for _mtime, size, _path in entries)
+        entries.sort()
+        for _mtime, size, entry_path in entries:
+            if self.total_bytes <= max_bytes:
+                break
+            logging.debug("Evicting cache entry %s", entry_path)
+            self._remove(entry_path, size)
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        for _mtime, size, entry_path in self._entries():
+            self._remove(entry_path, size)
+
+    def _entries(self):
+        """Returns a list of (modification time in ns, size, path) of every entry"""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith(self._SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    @staticmethod
+    def _entry_size(entry_path):
+        """Returns the size of an entry, or 0 if there isn't one"""
+        try:
+            return os.path.getsize(entry_path)
+        except FileNotFoundError:
+            return 0
+
+    def _remove(self, entry_path, size=None):
+        """
+        Arguments:
+        - entry_path: Path of the entry to remove
+        - size: Size of the entry if already known, to skip checking it
+        """
+        if size is None:
+            size = self._entry_size(entry_path)
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            return
+        self.total_bytes -= size
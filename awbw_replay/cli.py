@@ -0,0 +1,42 @@
+"""
+Command line helpers shared by the modules that run over many replays.
+"""
+
+def add_replay_files_arguments(parser, verb):
+    """
+    Adds the replay files and --file-list / -l arguments to a parser.
+
+    Arguments:
+    - parser: argparse.ArgumentParser to add the arguments to
+    - verb: What is done with the replays, for the help text (ie. "pack")
+    """
+    parser.add_argument("files", help=f"Replay files to {verb}", type=str, nargs="*")
+    parser.add_argument(
+            "--file-list",
+            "-l",
+            help=f"Text file listing replays to {verb}, one per line",
+            type=str)
+
+def read_file_list(path):
+    """
+    Arguments:
+    - path: Text file listing replays, one per line
+
+    Returns:
+    - List of the replay paths, skipping blank lines
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+def replay_files(args):
+    """
+    Arguments:
+    - args: Namespace parsed with the arguments from add_replay_files_arguments
+
+    Returns:
+    - List of the replay files given, followed by the ones in the file list
+    """
+    files = list(args.files)
+    if args.file_list:
+        files += read_file_list(args.file_list)
+    return files
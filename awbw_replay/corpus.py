@@ -0,0 +1,328 @@
+"""
+Module for packing many AWBW replays into a single memory-mappable corpus file.
+
+A corpus file is laid out as:
+- A fixed size header (see _HEADER)
+- The {game_id} and a{game_id} members of every replay, back to back
+- An index of fixed size entries (see _INDEX_ENTRY), sorted by game id
+
+Members are stored either decompressed, so they can be sliced straight out of
+the memory map, or as the original gzip members copied out of each replay
+archive without recompressing them.
+"""
+
+import argparse
+import gzip
+import logging
+import mmap
+import os
+import struct
+import sys
+import zipfile
+import zlib
+
+from awbw_replay import cli
+from awbw_replay.replay import AWBWReplay
+
+_MAGIC = b"AWBWCORP"
+
+# magic, format version, flags, replay count, index offset
+_HEADER = struct.Struct("<8sIIQQ")
+
+# games_id, game offset, game length, actions offset, actions length
+_INDEX_ENTRY = struct.Struct("<QQQQQ")
+
+FORMAT_VERSION = 1
+
+# Set when members are stored as gzip data
+FLAG_GZIP = 0x1
+
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Bytes of a gzip member read out of the memory map at a time when streaming
+_STREAM_CHUNK_SIZE = 1 << 16
+
+def _gunzip_chunks(chunks):
+    """
+    Generator decompressing gzip members one chunk at a time.
+
+    Arguments:
+    - chunks: Iterable of bytes-like objects (ie. memoryviews) holding gzip data
+
+    Returns:
+    - Generator of decompressed bytes
+    """
+    decompressor = zlib.decompressobj(_GZIP_WBITS)
+    in_member = False
+    for data in chunks:
+        while data:
+            in_member = True
+            yield decompressor.decompress(data)
+            if not decompressor.eof:
+                break
+            # Anything left is the start of another gzip member
+            in_member = False
+            data = decompressor.unused_data
+            decompressor = zlib.decompressobj(_GZIP_WBITS)
+    if in_member:
+        raise ValueError("Truncated gzip member in replay corpus")
+
+def _read_replay_members(path):
+    """
+    Arguments:
+    - path: str or Path of a replay archive
+
+    Returns:
+    - (games_id, raw {game_id} member, raw a{game_id} member), still gzipped
+    """
+    games_id = None
+    game_member = None
+    actions_member = None
+    with zipfile.ZipFile(path) as file:
+        for name in file.namelist():
+            if "a" in name:
+                actions_member = file.read(name)
+            else:
+                games_id = int(name)
+                game_member = file.read(name)
+
+    if game_member is None or actions_member is None:
+        raise ValueError(f"{path} is not a complete replay archive")
+
+    return games_id, game_member, actions_member
+
+def pack_corpus(output, replay_files, compress=False):
+    """
+    Packs replay archives into a single corpus file.
+
+    Arguments:
+    - output: str or Path of the corpus file to write
+    - replay_files: Iterable of replay archive paths. Later duplicates of a game
+      id are skipped.
+    - compress: If True, keep the members gzip compressed. Much smaller, but
+      each member must be decompressed when read.
+
+    Returns:
+    - The number of replays packed
+    """
+    flags = FLAG_GZIP if compress else 0
+    index = {}
+    with open(output, "wb") as corpus:
+        # Rewritten once the index offset is known
+        corpus.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, flags, 0, 0))
+
+        for path in replay_files:
+            try:
+                games_id, game_member, actions_member = _read_replay_members(path)
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                logging.error("Skipping replay %s: %s", path, e)
+                continue
+            if games_id in index:
+                logging.warning("Skipping duplicate game %d in %s", games_id, path)
+                continue
+
+            if not compress:
+                game_member = gzip.decompress(game_member)
+                actions_member = gzip.decompress(actions_member)
+
+            game_offset = corpus.tell()
+            corpus.write(game_member)
+            actions_offset = corpus.tell()
+            corpus.write(actions_member)
+            index[games_id] = (
+                    game_offset, len(game_member), actions_offset, len(actions_member))
+
+        index_offset = corpus.tell()
+        for games_id in sorted(index):
+            corpus.write(_INDEX_ENTRY.pack(games_id, *index[games_id]))
+
+        corpus.seek(0)
+        corpus.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, flags, len(index), index_offset))
+
+    return len(index)
+
+class ReplayCorpus():
+    """
+    Random access to the replays in a corpus file by game id.
+
+    Usage:
+
+    with ReplayCorpus("replays.awbwc") as corpus:
+        with corpus.open(52963) as replay:
+            ...
+    """
+
+    def __init__(self, path):
+        """
+        Arguments:
+        - path: str or Path of the corpus file to open
+        """
+        self._path = path
+        self._file = None
+        self._map = None
+        self._index = {}
+        self.flags = 0
+
+    def __enter__(self):
+        self._file = open(self._path, "rb") # pylint: disable=consider-using-with
+        try:
+            self._open_map()
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _open_map(self):
+        """Maps the corpus file and reads its index, raising ValueError if it's invalid"""
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size:
+            raise ValueError(f"{self._path} is not a replay corpus")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.flags, count, index_offset = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError(f"{self._path} is not a replay corpus")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported corpus format version {version}")
+
+        index_end = index_offset + count * _INDEX_ENTRY.size
+        if index_end > size:
+            raise ValueError(f"{self._path} is truncated")
+        for entry in _INDEX_ENTRY.iter_unpack(self._map[index_offset:index_end]):
+            games_id, game_offset, game_length, actions_offset, actions_length = entry
+            if max(game_offset + game_length, actions_offset + actions_length) > index_offset:
+                raise ValueError(f"{self._path} is truncated")
+            self._index[games_id] = entry[1:]
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, games_id):
+        return games_id in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def path(self):
+        """Returns the filepath of the corpus."""
+        return self._path
+
+    def open(self, games_id, stream=False):
+        """
+        Arguments:
+        - games_id: Game id of the replay to open
+        - stream: Passed on to the replay, see AWBWReplay
+
+        Returns:
+        - CorpusReplay to use as a context manager, like AWBWReplay
+        """
+        if games_id not in self._index:
+            raise KeyError(f"Game {games_id} is not in {self._path}")
+        return CorpusReplay(self, games_id, stream=stream)
+
+    def _member_slice(self, games_id, is_actions):
+        """Returns the (start, end) offsets of a stored member"""
+        game_offset, game_length, actions_offset, actions_length = self._index[games_id]
+        if is_actions:
+            return actions_offset, actions_offset + actions_length
+        return game_offset, game_offset + game_length
+
+    def _read_member(self, games_id, is_actions):
+        """Returns the decompressed contents of a stored member"""
+        start, end = self._member_slice(games_id, is_actions)
+        if self.flags & FLAG_GZIP:
+            # Decompressed straight out of the memory map, without copying the gzip data
+            with memoryview(self._map) as view:
+                return b"".join(_gunzip_chunks([view[start:end]]))
+        # The decoders need bytes, so this is the one copy of the member
+        return self._map[start:end]
+
+    def _member_lines(self, games_id, is_actions):
+        """Generator over the lines of a stored member"""
+        start, end = self._member_slice(games_id, is_actions)
+        if self.flags & FLAG_GZIP:
+            # Only a chunk of the gzip data is copied out of the map at a time
+            chunks = (self._map[chunk_start:min(chunk_start + _STREAM_CHUNK_SIZE, end)]
+                      for chunk_start in range(start, end, _STREAM_CHUNK_SIZE))
+            partial = b""
+            for data in _gunzip_chunks(chunks):
+                lines = (partial + data).split(b"\n")
+                partial = lines.pop()
+                yield from lines
+            if partial:
+                yield partial
+            return
+
+        # Read lines straight out of the memory map
+        while start < end:
+            stop = self._map.find(b"\n", start, end)
+            if stop == -1:
+                stop = end
+            yield self._map[start:stop]
+            start = stop + 1
+
+class CorpusReplay(AWBWReplay):
+    """
+    A single replay read out of a ReplayCorpus. Behaves like an AWBWReplay,
+    without touching the filesystem.
+    """
+
+    def __init__(self, corpus, games_id, stream=False):
+        """
+        Arguments:
+        - corpus: The open ReplayCorpus containing the replay
+        - games_id: Game id of the replay
+        - stream: See AWBWReplay
+        """
+        super().__init__(corpus.path(), stream=stream)
+        self._corpus = corpus
+        self._games_id = games_id
+
+    def _open(self):
+        self.namelist = [str(self._games_id), f"a{self._games_id}"]
+
+    def _read_member(self, name):
+        # pylint: disable=protected-access
+        return self._corpus._read_member(self._games_id, "a" in name)
+
+    def _member_lines(self, name):
+        # pylint: disable=protected-access
+        return self._corpus._member_lines(self._games_id, "a" in name)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # The corpus owns the underlying file
+        pass
+
+def get_args(argv=None):
+    """
+    Handles argument parsing for packing a corpus
+
+    Arguments:
+    - argv: List of string arguments, or None to use sys.argv (default)
+
+    Returns:
+    - namespace containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Pack AWBW replays into a corpus file")
+    parser.add_argument("output", help="Corpus file to write", type=str)
+    cli.add_replay_files_arguments(parser, "pack")
+    parser.add_argument(
+            "--compress",
+            "-c",
+            help="Keep replay members gzip compressed",
+            action="store_true")
+
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    _args = get_args()
+    _files = cli.replay_files(_args)
+    _count = pack_corpus(_args.output, _files, compress=_args.compress)
+    print(f"Packed {_count} replays into {_args.output}")
+    sys.exit(0)
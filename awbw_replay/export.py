@@ -0,0 +1,436 @@
+"""
+Module for exporting replay timelines to columnar files, using NumPy.
+
+Each replay is run through AWBWGameState once, streaming rows into four tables:
+- units: A row per unit alive in each snapshot of the state
+- players: A row per player in each snapshot, with their player_stats totals
+- buildings: A row per action that changed a building's capture value or owner
+- actions: A row per action, with its type, day, turn, acting player and units
+
+Snapshots are taken after every action, or at the end of every turn or day
+(see SNAPSHOTS), and of the final state of each replay. Snapshot rows have the
+number of actions applied so far, events the index of their action, so
+actions_applied == action_index + 1 joins a snapshot to the action before it.
+
+The rows of a replay are collected until all of its actions have been
+applied, so a replay that fails part way leaves none behind. They are then
+buffered per table in a preallocated NumPy array and written in row groups of
+at most row_group_size rows, so memory stays flat however many replays are
+exported.
+Each row group is a directory with an uncompressed .npy file per column:
+
+{output}/{table}/{row group:06d}/{column}.npy
+
+np.load(..., mmap_mode="r") maps a column without copying it, and the mapped
+arrays can be passed to Arrow (ie. pyarrow.array) zero-copy. Missing ids, like
+the target of a Move, are -1.
+
+with ColumnarExporter("timelines", snapshots=SNAPSHOT_DAY) as exporter:
+    exporter.export_replay("52963.zip")
+for row_group in iter_row_groups("timelines", "players", ["day", "funds"]):
+    ...
+
+Requires numpy, which the rest of the package doesn't.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import numpy as np
+
+from awbw_replay import actions, cli
+from awbw_replay.awbw import AWBWGameState, flag_is_set
+from awbw_replay.replay import AWBWReplay
+
+SNAPSHOT_ACTION = "action"
+SNAPSHOT_TURN = "turn"
+SNAPSHOT_DAY = "day"
+SNAPSHOTS = (SNAPSHOT_ACTION, SNAPSHOT_TURN, SNAPSHOT_DAY)
+
+DEFAULT_ROW_GROUP_SIZE = 1 << 16
+
+_SNAPSHOT_COLUMNS = (
+    ("games_id", np.int64),
+    ("actions_applied", np.int64),
+    ("day", np.int64),
+    ("turn", np.int64),
+)
+
+_EVENT_COLUMNS = (
+    ("games_id", np.int64),
+    ("action_index", np.int64),
+    ("day", np.int64),
+    ("turn", np.int64),
+)
+
+# Table name -> ((column, dtype), ...). Text columns are fixed width so they can
+# be memory mapped.
+TABLES = {
+    "units": _SNAPSHOT_COLUMNS + (
+        ("units_id", np.int64),
+        ("players_id", np.int64),
+        ("name", "U16"),
+        ("x", np.int64),
+        ("y", np.int64),
+        ("hit_points", np.float64),
+        ("fuel", np.int64),
+        ("ammo", np.int64),
+        ("moved", np.bool_),
+        ("capture", np.bool_),
+        ("fired", np.bool_),
+        ("carried", np.bool_),
+        ("sub_dive", np.bool_),
+    ),
+    "players": _SNAPSHOT_COLUMNS + (
+        ("players_id", np.int64),
+        ("funds", np.int64),
+        # Fractional, since Fire actions give the power meter divided by 10
+        ("co_power", np.float64),
+        ("co_power_on", np.bool_),
+        ("super_co_power_on", np.bool_),
+        ("eliminated", np.bool_),
+        ("unit_count", np.int64),
+        ("army_value", np.float64),
+        ("property_count", np.int64),
+        ("income", np.int64),
+    ),
+    "buildings": _EVENT_COLUMNS + (
+        ("buildings_id", np.int64),
+        ("terrain_id", np.int64),
+        ("x", np.int64),
+        ("y", np.int64),
+        ("capture", np.int64),
+        ("old_players_id", np.int64),
+        ("players_id", np.int64),
+    ),
+    "actions": _EVENT_COLUMNS + (
+        ("players_id", np.int64),
+        ("action", "U8"),
+        ("unit_id", np.int64),
+        ("target_id", np.int64),
+        ("units_changed", np.int64),
+    ),
+}
+
+# Building keys whose changes give a row in the buildings table
+_BUILDING_KEYS = frozenset(("capture", "players_id", "terrain_id"))
+
+def _or_missing(value):
+    return -1 if value is None else value
+
+class _TableWriter():
+    """Fills a preallocated array with the rows of one table, writing a row group whenever full"""
+
+    def __init__(self, directory, columns, row_group_size):
+        self.directory = directory
+        self.rows = np.zeros(row_group_size, dtype=list(columns))
+        self.row_groups = 0
+        self.size = 0
+        os.makedirs(directory)
+
+    def extend(self, rows):
+        """Adds a list of rows, each a tuple of values in the order of the columns"""
+        start = 0
+        while start < len(rows):
+            count = min(len(rows) - start, len(self.rows) - self.size)
+            self.rows[self.size:self.size + count] = rows[start:start + count]
+            self.size += count
+            start += count
+            if self.size == len(self.rows):
+                self.flush()
+
+    def flush(self):
+        """Writes the buffered rows as a row group, if there are any"""
+        if not self.size:
+            return
+        group_directory = os.path.join(self.directory, f"{self.row_groups:06d}")
+        os.makedirs(group_directory)
+        for name in self.rows.dtype.names:
+            # Each column is copied out of the rows, so it's contiguous on disk
+            column = np.ascontiguousarray(self.rows[name][:self.size])
+            np.save(os.path.join(group_directory, f"{name}.npy"), column)
+        self.row_groups += 1
+        self.size = 0
+
+class ColumnarExporter():
+    """
+    Streams the timelines of replays into columnar files, see the module docstring.
+
+    Usage:
+
+    with ColumnarExporter("timelines", snapshots=SNAPSHOT_ACTION) as exporter:
+        for path in replay_files:
+            exporter.export_replay(path)
+    """
+
+    def __init__(self, output, snapshots=SNAPSHOT_DAY, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        """
+        Arguments:
+        - output: Directory to write the tables to. It must not already have them.
+        - snapshots: When to snapshot units and players, one of SNAPSHOTS
+        - row_group_size: Most rows to buffer and write together, per table
+        """
+        if snapshots not in SNAPSHOTS:
+            raise ValueError(f"Unknown snapshots {snapshots}, expected one of {SNAPSHOTS}")
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be at least 1")
+        self.output = output
+        self.snapshots = snapshots
+        self.tables = {
+            table: _TableWriter(os.path.join(output, table), columns, row_group_size)
+            for table, columns in TABLES.items()
+        }
+        # Rows of the replay being exported, only handed to the writers once it
+        # has been exported without error
+        self._pending = {table: [] for table in TABLES}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Writes the rows still buffered"""
+        for writer in self.tables.values():
+            writer.flush()
+
+    def _snapshot(self, state, actions_applied):
+        """Appends a units and players row for everything in the state"""
+        game_info = state.game_info
+        key = (game_info["games_id"], actions_applied, game_info["day"], game_info["turn"])
+        units = self._pending["units"]
+        for u_id, unit in state.units.items():
+            if unit["hit_points"] <= 0:
+                continue
+            units.append(key + (
+                    u_id,
+                    unit["players_id"],
+                    unit["name"],
+                    unit["x"],
+                    unit["y"],
+                    unit["hit_points"],
+                    unit["fuel"],
+                    unit["ammo"],
+                    flag_is_set(unit["moved"]),
+                    flag_is_set(unit["capture"]),
+                    flag_is_set(unit["fired"]),
+                    flag_is_set(unit["carried"]),
+                    flag_is_set(unit["sub_dive"])))
+
+        players = self._pending["players"]
+        for p_id, player in state.players.items():
+            stats = state.player_stats[p_id]
+            players.append(key + (
+                    p_id,
+                    player["funds"],
+                    player["co_power"],
+                    player["co_power_on"],
+                    player["super_co_power_on"],
+                    player["eliminated"],
+                    stats["unit_count"],
+                    stats["army_value"],
+                    stats["property_count"],
+                    stats["income"]))
+
+    def _ends_snapshot(self, state, action):
+        """Returns whether the state before an action is the last one of a snapshot"""
+        if self.snapshots == SNAPSHOT_ACTION or not isinstance(action, actions.End):
+            return False
+        return self.snapshots == SNAPSHOT_TURN or action.day != state.game_info["day"]
+
+    def _append_events(self, state, key, players_id, action, changes):
+        """Appends the actions row of an applied action, and a row per building it changed"""
+        changed_units = set()
+        changed_buildings = {}
+        for name, r_id, r_key, old, _new in changes:
+            if name == "units":
+                changed_units.add(r_id)
+            elif name == "buildings" and r_key in _BUILDING_KEYS:
+                changed_buildings.setdefault(r_id, {}).setdefault(r_key, old)
+
+        for b_id, old_values in changed_buildings.items():
+            building = state.buildings[b_id]
+            self._pending["buildings"].append(key + (
+                    b_id,
+                    building["terrain_id"],
+                    building["x"],
+                    building["y"],
+                    building["capture"],
+                    old_values.get("players_id", building["players_id"]),
+                    building["players_id"]))
+
+        self._pending["actions"].append(key + (
+                players_id,
+                action.ACTION,
+                _or_missing(actions.acting_unit_id(action)),
+                _or_missing(actions.target_unit_id(action)),
+                len(changed_units)))
+
+    def export_compiled(self, game_info, compiled):
+        """
+        Exports a replay's rows, or none of them if applying its actions raises.
+
+        Arguments:
+        - game_info: The replay's game_info(), to construct the initial state from
+        - compiled: List of the replay's compiled actions
+
+        Returns:
+        - The final AWBWGameState
+        """
+        try:
+            state = self._buffer_replay(game_info, compiled)
+            for table, rows in self._pending.items():
+                self.tables[table].extend(rows)
+        finally:
+            for rows in self._pending.values():
+                rows.clear()
+        return state
+
+    def _buffer_replay(self, game_info, compiled):
+        """Applies a replay's actions, adding its rows to _pending and returning the final state"""
+        state = AWBWGameState(replay_initial=game_info)
+        games_id = state.game_info["games_id"]
+        if self.snapshots == SNAPSHOT_ACTION:
+            self._snapshot(state, 0)
+
+        changes = []
+        for action_index, action in enumerate(compiled):
+            if self._ends_snapshot(state, action):
+                self._snapshot(state, action_index)
+            key = (games_id, action_index, state.game_info["day"], state.game_info["turn"])
+            players_id = state.game_info["active_player_id"]
+            changes.clear()
+            state.apply_action_inplace(action, changes)
+
+            self._append_events(state, key, players_id, action, changes)
+
+            if self.snapshots == SNAPSHOT_ACTION:
+                self._snapshot(state, action_index + 1)
+
+        if self.snapshots != SNAPSHOT_ACTION:
+            self._snapshot(state, len(compiled))
+        return state
+
+    def export_replay(self, path):
+        """
+        Arguments:
+        - path: str or Path of a replay archive
+
+        Returns:
+        - The final AWBWGameState
+        """
+        with AWBWReplay(path) as replay:
+            game_info = replay.game_info()
+            compiled = replay.compiled_actions()
+        return self.export_compiled(game_info, compiled)
+
+def export_replays(output, replay_files, snapshots=SNAPSHOT_DAY,
+                   row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Exports many replays into the same tables. Replays that fail to open or
+    apply are logged and skipped, without leaving any of their rows behind.
+
+    Arguments:
+    - output: Directory to write the tables to
+    - replay_files: Iterable of replay archive paths
+    - snapshots, row_group_size: See ColumnarExporter
+
+    Returns:
+    - (number of replays exported, number that failed)
+    """
+    exported = 0
+    failed = 0
+    with ColumnarExporter(output, snapshots, row_group_size) as exporter:
+        for path in replay_files:
+            try:
+                exporter.export_replay(path)
+            except Exception as e: # pylint: disable=broad-except
+                logging.warning("Failed to export %s: %s: %s", path, type(e).__name__, e)
+                failed += 1
+                continue
+            exported += 1
+    return exported, failed
+
+def row_group_paths(output, table):
+    """Returns the sorted directories of a table's row groups"""
+    directory = os.path.join(output, table)
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+def iter_row_groups(output, table, columns=None, mmap=True):
+    """
+    Yields each row group of a table in order.
+
+    Arguments:
+    - output: Directory the tables were exported to
+    - table: Name of a table in TABLES
+    - columns: List of column names to load, or None for all of them
+    - mmap: If True, memory map the columns instead of reading them
+
+    Returns:
+    - Generator of dictionaries of column name -> array
+    """
+    if columns is None:
+        columns = [name for name, _dtype in TABLES[table]]
+    mmap_mode = "r" if mmap else None
+    for directory in row_group_paths(output, table):
+        yield {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in columns
+        }
+
+def read_table(output, table, columns=None):
+    """
+    Reads a whole table into memory, joining its row groups.
+
+    Arguments:
+    - output, table, columns: See iter_row_groups
+
+    Returns:
+    - Dictionary of column name -> array
+    """
+    if columns is None:
+        columns = [name for name, _dtype in TABLES[table]]
+    row_groups = list(iter_row_groups(output, table, columns, mmap=False))
+    return {
+        name: np.concatenate([row_group[name] for row_group in row_groups])
+        if row_groups else np.zeros(0, dtype=dtype)
+        for name, dtype in TABLES[table] if name in columns
+    }
+
+def get_args(argv=None):
+    """
+    Handles argument parsing for exporting replays
+
+    Arguments:
+    - argv: List of string arguments, or None to use sys.argv (default)
+
+    Returns:
+    - namespace containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Export AWBW replay timelines to columnar files")
+    parser.add_argument("output", help="Directory to write the tables to", type=str)
+    cli.add_replay_files_arguments(parser, "export")
+    parser.add_argument(
+            "--snapshots",
+            "-s",
+            help="When to snapshot units and players",
+            choices=SNAPSHOTS,
+            default=SNAPSHOT_DAY)
+    parser.add_argument(
+            "--row-group-size",
+            help="Most rows written together in each table",
+            type=int,
+            default=DEFAULT_ROW_GROUP_SIZE)
+
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    _args = get_args()
+    _files = cli.replay_files(_args)
+    _exported, _failed = export_replays(
+            _args.output, _files, _args.snapshots, _args.row_group_size)
+    print(f"Exported {_exported} and failed {_failed} replays to {_args.output}", file=sys.stderr)
+    sys.exit(1 if _failed else 0)
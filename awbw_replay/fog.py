@@ -0,0 +1,131 @@
+"""
+What each player could see of the units in a fog of war game.
+
+AWBW replays store every action as each player saw it: a unit that moves into
+the fog is blank in the other players' views, and a move lists the units it
+brought into view. The replay doesn't include the map's terrain, so vision isn't
+recomputed. Instead each player's view follows what the replay showed them: a
+unit stays visible to a player until an action shows it hidden from them, and
+stays hidden until an action shows it again.
+
+Usage:
+
+with AWBWReplay("52963.zip") as replay:
+    for state, hidden in fog.perspectives(replay):
+        for p_id in state.players:
+            units = fog.visible_units(state, hidden[p_id])
+"""
+
+from awbw_replay import actions
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState, flag_is_set
+
+def _on_map(unit):
+    """Returns whether a unit is on the map, not dead or carried by a transport"""
+    return unit["hit_points"] > 0 and not flag_is_set(unit["carried"])
+
+def visible_units(state, hidden):
+    """
+    Arguments:
+    - state: AWBWGameState
+    - hidden: Collection of ids of the units hidden from a player, see FogOfWar.hidden
+
+    Returns:
+    - Dictionary of unit id -> unit of the units on the map the player can see
+    """
+    return {u_id: unit for u_id, unit in state.units.items()
+            if u_id not in hidden and _on_map(unit)}
+
+class FogOfWar():
+    """
+    Tracks the units hidden from each player, updated with the sightings of each
+    compiled action (see actions) as it's applied to the omniscient game state.
+
+    Every player starts out seeing only their own units. In games without fog,
+    nothing is ever hidden.
+    """
+
+    def __init__(self, state):
+        """
+        Arguments:
+        - state: The initial AWBWGameState
+        """
+        self.fog = state.game_info["fog"]
+        # player id -> ids of the units hidden from the player
+        self._hidden = {p_id: set() for p_id in state.players}
+        # player id -> frozenset of _hidden, until it changes
+        self._frozen = {}
+
+        if self.fog:
+            for p_id, hidden in self._hidden.items():
+                hidden.update(u_id for u_id, unit in state.units.items()
+                              if unit["players_id"] != p_id)
+
+    def _set_visible(self, p_id, u_id, visible):
+        hidden = self._hidden.get(p_id)
+        if hidden is None or (u_id not in hidden) == visible:
+            return
+        if visible:
+            hidden.discard(u_id)
+        else:
+            hidden.add(u_id)
+        self._frozen.pop(p_id, None)
+
+    def update(self, action):
+        """
+        Arguments:
+        - action: The AWBWGameAction or compiled action record just applied
+        """
+        if not self.fog:
+            return
+        if isinstance(action, AWBWGameAction):
+            action = action.compiled()
+
+        for u_id, seen_by, hidden_from in action.sightings:
+            if actions.EVERYONE in seen_by:
+                seen_by = self._hidden.keys()
+            if hidden_from is None:
+                hidden_from = [p_id for p_id in self._hidden if p_id not in seen_by]
+            for p_id in seen_by:
+                self._set_visible(p_id, u_id, True)
+            for p_id in hidden_from:
+                self._set_visible(p_id, u_id, False)
+
+    def hidden(self, p_id):
+        """
+        Returns the frozenset of ids of the units hidden from a player. The same
+        set is returned until the player's view changes.
+        """
+        if p_id not in self._frozen:
+            self._frozen[p_id] = frozenset(self._hidden[p_id])
+        return self._frozen[p_id]
+
+    def masks(self):
+        """Returns a dictionary of player id -> hidden(player id)"""
+        return {p_id: self.hidden(p_id) for p_id in self._hidden}
+
+    def can_see(self, state, p_id, u_id):
+        """Returns whether a player can see a unit on the map in state"""
+        return u_id not in self._hidden[p_id] and _on_map(state.units[u_id])
+
+def perspectives(replay):
+    """
+    Applies every action of a replay once, tracking what every player could see.
+
+    Arguments:
+    - replay: An open AWBWReplay
+
+    Returns:
+    - Generator over (state, masks) for the initial state and the state after each
+      action, with masks a dictionary of player id -> frozenset of the ids of the
+      units hidden from that player. States share unchanged records like
+      AWBWGameState.apply_action, and the masks of players whose view didn't
+      change are the same frozensets, so keeping every step is cheap.
+    """
+    state = AWBWGameState(replay_initial=replay.game_info())
+    fog_of_war = FogOfWar(state)
+    yield state, fog_of_war.masks()
+
+    for action in replay.compiled_actions():
+        state = state.apply_action(action)
+        fog_of_war.update(action)
+        yield state, fog_of_war.masks()
@@ -1,6 +1,7 @@
 """Classes and code to manage game state."""
 
 import collections
+import collections.abc
 
 # Base classes
 
@@ -54,3 +55,116 @@ class DefaultDict(collections.UserDict):
                 raise KeyError(f"{key} is not supported for {self.__class__.__name__}")
 
         super().__init__({**self.ALLOWED_DATA, **data})
+
+class Record(collections.abc.MutableMapping):
+    """
+    A compact alternative to DefaultDict, with the same constructor and a dict
+    like interface over a fixed set of keys given by ALLOWED_DATA.
+
+    Values are stored in a single list, so a record is a fraction of the size of
+    a DefaultDict and copying one only copies that list. Subclasses define
+    ALLOWED_DATA and an empty __slots__:
+
+    class ColorRecord(Record):
+        ALLOWED_DATA = {"r": 0, "g": 0, "b": 0}
+        __slots__ = ()
+
+    Keys are always checked, but values are only checked by validate().
+    """
+
+    __slots__ = ("_values",)
+
+    ALLOWED_DATA = {}
+
+    # Derived from ALLOWED_DATA for each subclass
+    _INDEX = {}
+    _DEFAULTS = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._INDEX = {key: i for i, key in enumerate(cls.ALLOWED_DATA)}
+        cls._DEFAULTS = list(cls.ALLOWED_DATA.values())
+
+    def __init__(self, data=None, **kwargs):
+        self._values = self._DEFAULTS.copy()
+        if data is not None:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    def __getitem__(self, key):
+        return self._values[self._INDEX[key]]
+
+    def __setitem__(self, key, value):
+        index = self._INDEX.get(key)
+        if index is None:
+            raise KeyError(f"{key} is not supported for {self.__class__.__name__}")
+        self._values[index] = value
+
+    def __delitem__(self, key):
+        raise TypeError(f"Keys can't be removed from {self.__class__.__name__}")
+
+    def __iter__(self):
+        return iter(self.ALLOWED_DATA)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._INDEX
+
+    def get(self, key, default=None):
+        index = self._INDEX.get(key)
+        return default if index is None else self._values[index]
+
+    def update(self, other=(), /, **kwargs): # pylint: disable=arguments-differ
+        if hasattr(other, "keys"):
+            other = other.items()
+        for key, value in other:
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def __copy__(self):
+        result = self.__class__.__new__(self.__class__)
+        result._values = self._values.copy() # pylint: disable=protected-access
+        return result
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self._values == other._values # pylint: disable=protected-access
+        return super().__eq__(other)
+
+    def __or__(self, other):
+        if not isinstance(other, collections.abc.Mapping):
+            return NotImplemented
+        result = self.__copy__()
+        result.update(other)
+        return result
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __repr__(self):
+        return repr(dict(zip(self.ALLOWED_DATA, self._values)))
+
+    def validate(self):
+        """
+        Checks that every value has the same type as its default in ALLOWED_DATA,
+        where an int is also accepted for a float.
+
+        Returns:
+        - This record, so it can be chained with the constructor
+
+        Raises:
+        - TypeError for the first value of the wrong type
+        """
+        for key, value, default in zip(self.ALLOWED_DATA, self._values, self._DEFAULTS):
+            expected = type(default)
+            if expected is float and type(value) is int: # pylint: disable=unidiomatic-typecheck
+                continue
+            if type(value) is not expected: # pylint: disable=unidiomatic-typecheck
+                raise TypeError(f"{self.__class__.__name__}[{key!r}] should be a "
+                        f"{expected.__name__}, not {type(value).__name__}")
+        return self
@@ -0,0 +1,385 @@
+"""
+Module for indexing summaries of many AWBW replays in a SQLite database.
+
+Each replay is run through AWBWGameState once when it's ingested, storing:
+- replays: A row per replay, with its map, fog, length and whether it ended
+- players: A row per player of each replay, with their CO, country, whether
+  they won, and their final funds and player_stats totals
+- events: A row per action, with its type, day, turn, acting player and the
+  units involved
+
+Ingesting again skips every replay whose contents were already ingested by the
+same awbw.ENGINE_VERSION, so only new and changed replays are run. Questions
+about the whole corpus are then SQL queries on the indexed tables:
+
+with ReplayIndex("replays.sqlite") as index:
+    index.ingest(["52963.zip", ...])
+    for co_id, games, win_rate in index.co_win_rates():
+        ...
+    index.query("SELECT day, COUNT(*) FROM events WHERE action = ? GROUP BY day", ("Power",))
+"""
+
+import argparse
+import csv
+import logging
+import multiprocessing
+import sqlite3
+import sys
+import time
+import typing
+
+from awbw_replay import actions, awbw, cli
+from awbw_replay.awbw import AWBWGameState
+from awbw_replay.cache import content_hash
+from awbw_replay.replay import AWBWReplay
+
+_SCHEMA = """
+CREATE TABLE replays (
+    games_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    engine_version INTEGER NOT NULL,
+    maps_id INTEGER NOT NULL,
+    fog INTEGER NOT NULL,
+    player_count INTEGER NOT NULL,
+    days INTEGER NOT NULL,
+    turns INTEGER NOT NULL,
+    actions INTEGER NOT NULL,
+    game_over INTEGER NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE INDEX replays_content_hash ON replays (content_hash);
+CREATE INDEX replays_path ON replays (path);
+CREATE INDEX replays_maps_id ON replays (maps_id);
+
+CREATE TABLE players (
+    games_id INTEGER NOT NULL,
+    players_id INTEGER NOT NULL,
+    play_order INTEGER NOT NULL,
+    users_id INTEGER NOT NULL,
+    countries_id INTEGER NOT NULL,
+    co_id INTEGER NOT NULL,
+    eliminated INTEGER NOT NULL,
+    winner INTEGER NOT NULL,
+    funds INTEGER NOT NULL,
+    unit_count INTEGER NOT NULL,
+    army_value REAL NOT NULL,
+    property_count INTEGER NOT NULL,
+    income INTEGER NOT NULL,
+    PRIMARY KEY (games_id, players_id)
+) WITHOUT ROWID;
+CREATE INDEX players_co_id ON players (co_id);
+CREATE INDEX players_users_id ON players (users_id);
+
+CREATE TABLE events (
+    games_id INTEGER NOT NULL,
+    action_index INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    turn INTEGER NOT NULL,
+    players_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    unit_id INTEGER,
+    unit_name TEXT,
+    target_id INTEGER,
+    x INTEGER,
+    y INTEGER,
+    units_changed INTEGER NOT NULL,
+    PRIMARY KEY (games_id, action_index)
+) WITHOUT ROWID;
+CREATE INDEX events_action ON events (action, games_id);
+CREATE INDEX events_players_id ON events (players_id, action);
+CREATE INDEX events_unit_name ON events (unit_name, action);
+"""
+
+_TABLES = ("replays", "players", "events")
+
+class ReplaySummary(typing.NamedTuple):
+    """The rows of a replay, as dictionaries keyed by column"""
+    replay: dict
+    players: typing.List[dict]
+    events: typing.List[dict]
+
+class IngestResult(typing.NamedTuple):
+    """Number of replays ingested, skipped as already current, and failed"""
+    ingested: int
+    skipped: int
+    failed: int
+
+def summarize_replay(path, replay_hash=None):
+    """
+    Runs a replay through AWBWGameState once, collecting its rows.
+
+    Arguments:
+    - path: str or Path of the replay archive
+    - replay_hash: cache.content_hash of the archive, computed if None
+
+    Returns:
+    - ReplaySummary of the replay
+    """
+    if replay_hash is None:
+        replay_hash = content_hash(path)
+
+    with AWBWReplay(path) as replay:
+        state = AWBWGameState(replay_initial=replay.game_info())
+        compiled = replay.compiled_actions()
+
+    games_id = state.game_info["games_id"]
+    events = []
+    changes = []
+    for action_index, action in enumerate(compiled):
+        game_info = state.game_info
+        event = {
+            "games_id": games_id,
+            "action_index": action_index,
+            "day": game_info["day"],
+            "turn": game_info["turn"],
+            "players_id": game_info["active_player_id"],
+            "action": action.ACTION,
+        }
+        changes.clear()
+        state.apply_action_inplace(action, changes)
+
+        u_id = actions.acting_unit_id(action)
+        unit = state.units.get(u_id)
+        event["unit_id"] = u_id
+        event["unit_name"] = None if unit is None else unit["name"]
+        event["target_id"] = actions.target_unit_id(action)
+        event["x"] = None if unit is None else unit["x"]
+        event["y"] = None if unit is None else unit["y"]
+        event["units_changed"] = len({r_id for name, r_id, *_ in changes if name == "units"})
+        events.append(event)
+
+    game_over = state.game_info["game_over"]
+    players = []
+    for play_order, (p_id, player) in enumerate(state.players.items()):
+        players.append({
+            "games_id": games_id,
+            "players_id": p_id,
+            "play_order": play_order,
+            "users_id": player["users_id"],
+            "countries_id": player["countries_id"],
+            "co_id": player["co_id"],
+            "eliminated": player["eliminated"],
+            "winner": game_over and not player["eliminated"],
+            "funds": player["funds"],
+            **state.player_stats[p_id],
+        })
+
+    replay_row = {
+        "games_id": games_id,
+        "path": str(path),
+        "content_hash": replay_hash,
+        "engine_version": awbw.ENGINE_VERSION,
+        "maps_id": state.game_info["maps_id"],
+        "fog": state.game_info["fog"],
+        "player_count": len(players),
+        "days": state.game_info["day"],
+        "turns": state.game_info["turn"],
+        "actions": len(events),
+        "game_over": game_over,
+        "ingested_at": time.time(),
+    }
+    return ReplaySummary(replay_row, players, events)
+
+def _summarize_replay_safe(args):
+    """Returns (path, ReplaySummary or None, error string or None), never raising"""
+    path, replay_hash = args
+    try:
+        return path, summarize_replay(path, replay_hash), None
+    except Exception as e: # pylint: disable=broad-except
+        return path, None, f"{type(e).__name__}: {e}"
+
+def _insert(connection, table, rows):
+    if not rows:
+        return
+    columns = list(rows[0])
+    connection.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + column for column in columns)})",
+            rows)
+
+class ReplayIndex():
+    """
+    A SQLite database of replay summaries, see the module docstring.
+
+    Usage:
+
+    with ReplayIndex("replays.sqlite") as index:
+        result = index.ingest(replay_files, jobs=4)
+        rows = index.query("SELECT maps_id, AVG(days) FROM replays GROUP BY maps_id")
+    """
+
+    # Bump whenever the tables change, which drops and rebuilds the whole index
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path):
+        """
+        Arguments:
+        - path: str or Path of the database file, created if it doesn't exist
+        """
+        self._path = path
+        self.connection = None
+
+    def __enter__(self):
+        self.connection = sqlite3.connect(self._path)
+        self._create_schema()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.connection.close()
+        self.connection = None
+
+    def _create_schema(self):
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == self.SCHEMA_VERSION:
+            return
+        if version != 0:
+            logging.info("Rebuilding replay index %s from schema version %d", self._path, version)
+        with self.connection:
+            for table in _TABLES:
+                self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+            self.connection.executescript(_SCHEMA)
+            self.connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def is_current(self, replay_hash):
+        """Returns whether a replay with these contents was ingested by this ENGINE_VERSION"""
+        row = self.connection.execute(
+                "SELECT 1 FROM replays WHERE content_hash = ? AND engine_version = ?",
+                (replay_hash, awbw.ENGINE_VERSION)).fetchone()
+        return row is not None
+
+    def store(self, summary):
+        """
+        Replaces the rows of a replay, and of any replay previously ingested
+        from the same path, in a single transaction.
+
+        Arguments:
+        - summary: ReplaySummary from summarize_replay
+        """
+        games_id = summary.replay["games_id"]
+        with self.connection:
+            stale = {games_id}
+            stale.update(row[0] for row in self.connection.execute(
+                    "SELECT games_id FROM replays WHERE path = ?", (summary.replay["path"],)))
+            for stale_id in stale:
+                self.remove(stale_id)
+            _insert(self.connection, "replays", [summary.replay])
+            _insert(self.connection, "players", summary.players)
+            _insert(self.connection, "events", summary.events)
+
+    def remove(self, games_id):
+        """Removes every row of a replay"""
+        for table in _TABLES:
+            self.connection.execute(f"DELETE FROM {table} WHERE games_id = ?", (games_id,))
+
+    def ingest(self, replay_files, jobs=1):
+        """
+        Adds new and changed replays to the index. Each replay is committed as
+        soon as it's done, so an interrupted ingest keeps its progress.
+
+        Arguments:
+        - replay_files: Iterable of replay archive paths
+        - jobs: Number of worker processes to run the replays in
+
+        Returns:
+        - IngestResult
+        """
+        skipped = 0
+        failed = 0
+        # Content hash -> path of the replays to run, copies are only run once
+        pending = {}
+        for path in replay_files:
+            try:
+                replay_hash = content_hash(path)
+            except OSError as e:
+                logging.error("Could not read replay %s: %s", path, e)
+                failed += 1
+                continue
+            if replay_hash in pending or self.is_current(replay_hash):
+                skipped += 1
+            else:
+                pending[replay_hash] = path
+        pending = [(path, replay_hash) for replay_hash, path in pending.items()]
+
+        def store_results(results):
+            nonlocal failed
+            ingested = 0
+            for path, summary, error in results:
+                if summary is None:
+                    logging.error("Could not ingest replay %s: %s", path, error)
+                    failed += 1
+                    continue
+                self.store(summary)
+                ingested += 1
+            return ingested
+
+        if jobs <= 1 or len(pending) <= 1:
+            ingested = store_results(map(_summarize_replay_safe, pending))
+        else:
+            with multiprocessing.Pool(processes=jobs) as pool:
+                ingested = store_results(pool.imap_unordered(_summarize_replay_safe, pending))
+
+        return IngestResult(ingested, skipped, failed)
+
+    def query(self, sql, parameters=()):
+        """
+        Arguments:
+        - sql: SQL statement to run on the index
+        - parameters: Values of the ? placeholders in sql
+
+        Returns:
+        - List of result rows as tuples
+        """
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def co_win_rates(self):
+        """Returns a list of (co_id, finished games, fraction of them won) per CO"""
+        return self.query(
+                "SELECT co_id, COUNT(*), AVG(winner) FROM players "
+                "JOIN replays USING (games_id) WHERE game_over "
+                "GROUP BY co_id ORDER BY co_id")
+
+    def game_length_by_map(self):
+        """Returns a list of (maps_id, replays, average days, average actions) per map"""
+        return self.query(
+                "SELECT maps_id, COUNT(*), AVG(days), AVG(actions) FROM replays "
+                "GROUP BY maps_id ORDER BY maps_id")
+
+def get_args(argv=None):
+    """
+    Handles argument parsing for indexing replays
+
+    Arguments:
+    - argv: List of string arguments, or None to use sys.argv (default)
+
+    Returns:
+    - namespace containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Index AWBW replays in a SQLite database")
+    parser.add_argument("database", help="Index database file", type=str)
+    cli.add_replay_files_arguments(parser, "ingest")
+    parser.add_argument(
+            "--jobs",
+            "-j",
+            help="Number of worker processes to run replays in",
+            type=int,
+            default=1)
+    parser.add_argument(
+            "--query",
+            "-q",
+            help="SQL query to run after ingesting, printed as CSV",
+            type=str)
+
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    _args = get_args()
+    _files = cli.replay_files(_args)
+    with ReplayIndex(_args.database) as _index:
+        if _files:
+            _result = _index.ingest(_files, jobs=_args.jobs)
+            print(f"Ingested {_result.ingested}, skipped {_result.skipped} current and "
+                  f"failed {_result.failed} replays", file=sys.stderr)
+        if _args.query:
+            csv.writer(sys.stdout).writerows(_index.query(_args.query))
+    sys.exit(0)
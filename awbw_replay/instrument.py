@@ -0,0 +1,179 @@
+"""
+Opt in timing and counters for the replay engine.
+
+Usage:
+
+with instrument.collect() as stats:
+    with AWBWReplay("52963.zip") as replay:
+        state = AWBWGameState(replay_initial=replay.game_info())
+        for action in replay.compiled_actions():
+            state.apply_action_inplace(action)
+print(stats.report())
+
+Inside collect(), AWBWGameState records the count, total and max time and units
+changed of each action type, and AWBWReplay times the stages of opening a
+replay. Outside of it, the engine only checks active() once per action.
+"""
+
+import contextlib
+import time
+
+from awbw_replay import game
+
+class ActionStats(game.Record):
+    """Totals for one action type"""
+
+    ALLOWED_DATA = {
+        "count": 0,
+        # Seconds spent applying the actions
+        "total_time": 0.0,
+        "max_time": 0.0,
+        # Number of units each action changed, added up
+        "units_touched": 0,
+    }
+
+    __slots__ = ()
+
+class StageStats(game.Record):
+    """Totals for one stage of opening a replay"""
+
+    ALLOWED_DATA = {
+        "count": 0,
+        # Seconds spent in the stage
+        "total_time": 0.0,
+        "max_time": 0.0,
+    }
+
+    __slots__ = ()
+
+# Stages timed by AWBWReplay
+STAGE_DECOMPRESS = "decompress"
+STAGE_DECODE_GAME = "decode_game"
+STAGE_DECODE_ACTIONS = "decode_actions"
+STAGE_CACHE_LOAD = "cache_load"
+STAGE_CACHE_STORE = "cache_store"
+STAGE_COMPILE = "compile"
+
+def _add_time(stats, seconds):
+    stats["count"] += 1
+    stats["total_time"] += seconds
+    stats["max_time"] = max(stats["max_time"], seconds)
+
+class Instrumentation():
+    """
+    Counters collected while active, see collect(). Counters from other runs
+    (ie. other processes of a batch) are combined with merge().
+    """
+
+    def __init__(self):
+        # Action type string -> ActionStats
+        self.actions = {}
+        # Stage name -> StageStats
+        self.stages = {}
+
+    def record_action(self, action_type, seconds, units_touched):
+        """Adds one applied action to the totals of its type"""
+        stats = self.actions.get(action_type)
+        if stats is None:
+            stats = self.actions[action_type] = ActionStats()
+        _add_time(stats, seconds)
+        stats["units_touched"] += units_touched
+
+    def record_stage(self, stage_name, seconds):
+        """Adds one run of a stage to its totals"""
+        stats = self.stages.get(stage_name)
+        if stats is None:
+            stats = self.stages[stage_name] = StageStats()
+        _add_time(stats, seconds)
+
+    @contextlib.contextmanager
+    def time_stage(self, stage_name):
+        """Context manager recording the time spent inside it as one run of a stage"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage_name, time.perf_counter() - start_time)
+
+    def merge(self, other):
+        """
+        Adds the counters of another run to these.
+
+        Arguments:
+        - other: Instrumentation, or a dictionary from its summary()
+        """
+        if isinstance(other, Instrumentation):
+            other = other.summary()
+        for name, record_type, totals in [
+                ("actions", ActionStats, self.actions),
+                ("stages", StageStats, self.stages)]:
+            for key, values in other[name].items():
+                stats = totals.setdefault(key, record_type())
+                for value_key, value in values.items():
+                    if value_key == "max_time":
+                        stats[value_key] = max(stats[value_key], value)
+                    else:
+                        stats[value_key] += value
+
+    def summary(self):
+        """
+        Returns the counters as plain dictionaries, to pickle or write as JSON:
+        {"actions": {action type: {...}}, "stages": {stage: {...}}}
+        """
+        return {
+            "actions": {key: dict(stats) for key, stats in self.actions.items()},
+            "stages": {key: dict(stats) for key, stats in self.stages.items()},
+        }
+
+    def report(self):
+        """Returns a text table of the counters, slowest action types first"""
+        lines = [f"{'action':<10} {'count':>8} {'total ms':>10} {'mean us':>9} "
+                 f"{'max us':>9} {'units':>8}"]
+        for action_type, stats in sorted(
+                self.actions.items(), key=lambda item: item[1]["total_time"], reverse=True):
+            lines.append(
+                    f"{action_type:<10} {stats['count']:>8} {stats['total_time'] * 1e3:>10.2f} "
+                    f"{stats['total_time'] / stats['count'] * 1e6:>9.1f} "
+                    f"{stats['max_time'] * 1e6:>9.1f} {stats['units_touched']:>8}")
+        if self.stages:
+            lines.append("")
+            lines.append(f"{'stage':<15} {'count':>8} {'total ms':>10} {'max ms':>9}")
+            for stage_name, stats in sorted(self.stages.items()):
+                lines.append(
+                        f"{stage_name:<15} {stats['count']:>8} {stats['total_time'] * 1e3:>10.2f} "
+                        f"{stats['max_time'] * 1e3:>9.2f}")
+        return "\n".join(lines)
+
+# The Instrumentation being collected into, if any
+_ACTIVE = None
+
+def active():
+    """Returns the Instrumentation being collected into, or None"""
+    return _ACTIVE
+
+@contextlib.contextmanager
+def collect(stats=None):
+    """
+    Collects counters for everything run inside the with block.
+
+    Arguments:
+    - stats: Instrumentation to add to, or None for a new one
+
+    Returns:
+    - Context manager giving the Instrumentation
+    """
+    global _ACTIVE # pylint: disable=global-statement
+    previous = _ACTIVE
+    _ACTIVE = Instrumentation() if stats is None else stats
+    try:
+        yield _ACTIVE
+    finally:
+        _ACTIVE = previous
+
+_NOT_TIMED = contextlib.nullcontext()
+
+def stage(name):
+    """Returns a context manager timing a stage if collecting, or one that does nothing"""
+    if _ACTIVE is None:
+        return _NOT_TIMED
+    return _ACTIVE.time_stage(name)
@@ -0,0 +1,189 @@
+"""
+Module for reading replays from a file list ahead of time, on threads.
+
+Opening a replay reads its archive and decompresses both members before any
+decoding starts. File reads and zlib release the GIL, so prefetch_replays does
+that for the next few replays on a thread pool while the current one is
+decoded and applied, overlapping the wait on slow (spinning or network mounted)
+disks with the CPU bound work:
+
+for replay in prefetch_replays(replay_files, prefetch=4):
+    with replay:
+        state = AWBWGameState(replay_initial=replay.game_info())
+        ...
+
+At most prefetch replays are read ahead of the one being used, so memory is
+bounded by the few largest replays however long the file list is. Replays
+with an entry in the cache are not read ahead at all, since opening them only
+loads the entry. When streaming, only the compressed archives are read ahead
+and each one is still decompressed a line at a time as it's iterated, so
+memory is bounded by the compressed size of the prefetched replays.
+"""
+
+import collections
+import concurrent.futures
+import gzip
+import io
+import time
+import zipfile
+
+from awbw_replay import instrument
+from awbw_replay.replay import AWBWReplay
+
+DEFAULT_PREFETCH = 4
+
+def read_replay_members(path):
+    """
+    Reads and decompresses every member of a replay archive. Safe to call from any thread.
+
+    Arguments:
+    - path: str or Path of a replay archive
+
+    Returns:
+    - (dictionary of member name -> decompressed bytes, list of seconds spent
+      decompressing each member)
+    """
+    members = {}
+    decompress_times = []
+    with zipfile.ZipFile(path) as file:
+        for name in file.namelist():
+            data = file.read(name)
+            start_time = time.perf_counter()
+            members[name] = gzip.decompress(data)
+            decompress_times.append(time.perf_counter() - start_time)
+    return members, decompress_times
+
+class PrefetchedReplay(AWBWReplay):
+    """
+    A replay whose archive is read ahead by prefetch_replays. Behaves like an
+    AWBWReplay of the same path, and if reading the archive failed, entering it
+    raises the same error.
+    """
+
+    def __init__(self, path, future, stream=False, cache=None):
+        """
+        Arguments:
+        - path: str or Path of the replay archive
+        - future: concurrent.futures.Future of _read_ahead(path, stream, cache)
+        - stream, cache: See AWBWReplay
+        """
+        super().__init__(path, stream=stream, cache=cache)
+        self._future = future
+        self._prefetched_key = None
+        self._members = None
+
+    def _open(self):
+        # Waits for the reading thread, raising its error if it had one
+        read_ahead = self._future.result()
+        self._future = None
+        self._prefetched_key = read_ahead.cache_key
+        if read_ahead.members is None:
+            if read_ahead.archive is None:
+                # Cached, so the archive is only read if the entry turns out stale
+                super()._open()
+            else:
+                self.file = zipfile.ZipFile( # pylint: disable=consider-using-with
+                        io.BytesIO(read_ahead.archive))
+                self.namelist = self.file.namelist()
+            return
+
+        self._members = read_ahead.members
+        stats = instrument.active()
+        if stats is not None:
+            # Timed on the reading thread, but only recorded here so the
+            # counters are never updated from two threads at once
+            for seconds in read_ahead.decompress_times:
+                stats.record_stage(instrument.STAGE_DECOMPRESS, seconds)
+        self.namelist = list(self._members)
+
+    def _key_for_cache(self):
+        if self._prefetched_key is not None:
+            return self._prefetched_key
+        return super()._key_for_cache()
+
+    def _read_member(self, name):
+        if self._members is None:
+            return super()._read_member(name)
+        return self._members[name]
+
+    def _member_lines(self, name):
+        if self._members is None:
+            yield from super()._member_lines(name)
+        else:
+            yield from io.BytesIO(self._members[name])
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Prefetched members were read from an archive closed by the reading thread
+        self._members = None
+        if self.file is not None:
+            self.file.close()
+
+# Result of reading a replay ahead: exactly one of archive (compressed archive
+# bytes, when streaming) and members (as from read_replay_members) is set,
+# unless the replay is cached and neither is
+_ReadAhead = collections.namedtuple(
+        "_ReadAhead", ["cache_key", "archive", "members", "decompress_times"])
+
+def _read_ahead(path, stream, cache):
+    """
+    Reads a replay for a PrefetchedReplay. Safe to call from any thread.
+
+    Arguments:
+    - path: str or Path of a replay archive
+    - stream, cache: See AWBWReplay
+
+    Returns:
+    - _ReadAhead of the replay
+    """
+    if stream:
+        with open(path, "rb") as file:
+            return _ReadAhead(None, file.read(), None, None)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key_for(path)
+        if cache.contains(cache_key):
+            return _ReadAhead(cache_key, None, None, None)
+    members, decompress_times = read_replay_members(path)
+    return _ReadAhead(cache_key, None, members, decompress_times)
+
+def prefetch_replays(replay_files, prefetch=DEFAULT_PREFETCH, threads=None, stream=False,
+                     cache=None):
+    """
+    Yields a PrefetchedReplay for each replay file, in order, while the next
+    ones are read and decompressed on a thread pool. Cached replays are skipped,
+    and when streaming the archives are read but not decompressed.
+
+    Arguments:
+    - replay_files: Iterable of replay paths, only consumed as far as needed
+    - prefetch: Most replays to read ahead of the one last yielded
+    - threads: Number of reading threads, or None for one per prefetched replay
+    - stream, cache: Passed to each PrefetchedReplay, see AWBWReplay
+
+    Returns:
+    - Generator of PrefetchedReplay, each to be opened in a with block
+    """
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1")
+
+    replay_files = iter(replay_files)
+    # (path, future) of the replays read ahead, in order
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads or prefetch) as executor:
+
+        def read_next():
+            path = next(replay_files, None)
+            if path is not None:
+                pending.append((path, executor.submit(_read_ahead, path, stream, cache)))
+
+        try:
+            for _ in range(prefetch):
+                read_next()
+            while pending:
+                path, future = pending.popleft()
+                read_next()
+                yield PrefetchedReplay(path, future, stream, cache)
+        finally:
+            # Stopped early, so skip the replays that haven't started reading
+            for _path, future in pending:
+                future.cancel()
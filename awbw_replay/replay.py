@@ -3,6 +3,7 @@
 import gzip
 import json
 import logging
+import re
 import sys
 import typing
 import zipfile
@@ -10,6 +11,9 @@ import zipfile
 import parse
 import phpserialize
 
+from awbw_replay import actions as awbw_actions
+from awbw_replay import instrument
+
 # Replay files are .zip files, each of which are gzip compressed.
 # Filenames are a{game_id} and {game_id}.
 # a{game_id} file contains all the actions as csv style objects with JSON serialized
@@ -17,6 +21,87 @@ import phpserialize
 # {game_id} file contains all the remaining metadata, including the initial player funds,
 # initial buildings and units.
 
+# Every action payload written by AWBW starts with its type
+_ACTION_TYPE_PREFIX = re.compile(rb'\{"action":"(\w+)"')
+
+class RawAction(dict):
+    """
+    A single action from the replay, kept as its raw JSON payload until needed.
+
+    A dictionary holding only the "action" (type) field until anything else is
+    read, which decodes the payload once and fills in the rest. So listing action
+    types is cheap, while the action still works anywhere a dictionary does (ie.
+    find_in or json.dumps).
+    """
+
+    __slots__ = ("payload", "_decoded")
+
+    def __init__(self, payload, action_type=None):
+        """
+        Arguments:
+        - payload: bytes containing the JSON serialized action
+        - action_type: The action type string if already known
+        """
+        super().__init__()
+        self.payload = payload
+        self._decoded = False
+        if action_type is None:
+            match = _ACTION_TYPE_PREFIX.match(payload)
+            if match is not None:
+                action_type = match.group(1).decode()
+        if action_type is None:
+            self.decode()
+        else:
+            dict.__setitem__(self, "action", action_type)
+
+    def decode(self):
+        """Decodes the payload if it hasn't been yet, and returns this dictionary."""
+        if not self._decoded:
+            self._decoded = True
+            dict.update(self, json.loads(self.payload))
+        return self
+
+    def __getitem__(self, key):
+        if key == "action" or self._decoded:
+            return dict.__getitem__(self, key)
+        return dict.__getitem__(self.decode(), key)
+
+    def __contains__(self, key):
+        if key == "action" or self._decoded:
+            return dict.__contains__(self, key)
+        return dict.__contains__(self.decode(), key)
+
+    def __eq__(self, other):
+        if isinstance(other, RawAction):
+            other.decode()
+        return dict.__eq__(self.decode(), other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    # Unhashable, like dict
+    __hash__ = None
+
+    def __repr__(self):
+        return dict.__repr__(self.decode())
+
+    def __reduce__(self):
+        # Only the raw payload is worth keeping when pickling
+        return (self.__class__, (self.payload, dict.get(self, "action")))
+
+def _decoding(method):
+    """Returns a RawAction method which decodes the payload before calling the dict method"""
+    def decoding_method(self, *args, **kwargs):
+        return method(self.decode(), *args, **kwargs)
+    decoding_method.__name__ = method.__name__
+    return decoding_method
+
+# Every other dict method reading or changing the contents decodes first
+for _name in ["__iter__", "__len__", "__setitem__", "__delitem__", "get",
+              "keys", "values", "items", "copy", "update", "pop", "popitem", "setdefault",
+              "clear"]:
+    setattr(RawAction, _name, _decoding(getattr(dict, _name)))
+
 class RawTurn(typing.NamedTuple):
     """
     Contains all actions in a turn. The actual turn number is given by the
@@ -24,7 +109,7 @@ class RawTurn(typing.NamedTuple):
     """
     playerId: int
     day: int
-    actions: typing.List[typing.Dict]
+    actions: typing.List[typing.Mapping]
 
 def sanitize_phpobject(phpobj):
     """
@@ -55,52 +140,245 @@ def sanitize_phpobject(phpobj):
 
     return phpobj, set(found_types)
 
-class AWBWReplay():
+def _decode_php_value(data, pos): # pylint: disable=too-many-return-statements
+    """
+    Decodes the PHP serialized value starting at data[pos].
+
+    Returns:
+    - (value, position just after the value)
+    """
+    kind = data[pos]
+    if kind == 0x69: # i:{int};
+        end = data.index(b";", pos)
+        return int(data[pos + 2:end]), end + 1
+    if kind == 0x73: # s:{len}:"{bytes}";
+        colon = data.index(b":", pos + 2)
+        start = colon + 2
+        end = start + int(data[pos + 2:colon])
+        return data[start:end].decode(), end + 2
+    if kind == 0x4e: # N;
+        return None, pos + 2
+    if kind == 0x64: # d:{float};
+        end = data.index(b";", pos)
+        return float(data[pos + 2:end]), end + 1
+    if kind == 0x62: # b:{0|1};
+        end = data.index(b";", pos)
+        return bool(int(data[pos + 2:end])), end + 1
+    if kind == 0x61: # a:{count}:{{key};{value};...}
+        colon = data.index(b":", pos + 2)
+        count = int(data[pos + 2:colon])
+        return _decode_php_members(data, colon + 2, count, False)
+    if kind == 0x4f: # O:{len}:"{class}":{count}:{{member};{value};...}
+        colon = data.index(b":", pos + 2)
+        pos = colon + 2 + int(data[pos + 2:colon]) + 2
+        colon = data.index(b":", pos)
+        count = int(data[pos:colon])
+        return _decode_php_members(data, colon + 2, count, True)
+
+    raise ValueError(f"Unexpected PHP serialized type {chr(kind)!r} at {pos}")
+
+def _decode_php_members(data, pos, count, is_object):
+    """Decodes count key / value pairs of an array or object into a dict"""
+    result = {}
+    for _ in range(count):
+        key, pos = _decode_php_value(data, pos)
+        if is_object and key[:1] == " ":
+            # Same member name translation as phpserialize.phpobject._asdict
+            key = key.split(None, 2)[-1]
+        result[key], pos = _decode_php_value(data, pos)
+    # Skip the closing brace
+    return result, pos + 1
+
+def decode_php(data):
+    """
+    Decodes PHP serialized data in a single pass, straight to python types.
+
+    Arrays and objects both become dicts (objects lose their class name), so the
+    result is the same as sanitize_phpobject applied to phpserialize.loads output,
+    without building any intermediate phpobjects.
+
+    Arguments:
+    - data: bytes of PHP serialized data
+
+    Returns:
+    - The decoded value
+    """
+    return _decode_php_value(data, 0)[0]
+
+# Layout of a single a{game_id} line, as written by AWBW:
+# p:{playerId};d:{day};a:a:3:{i:0;i:{playerId};i:1;i:{day};i:2;a:{n}:{i:0;s:{len}:"{json}";...}}
+_TURN_LINE_HEADER = re.compile(
+        rb"p:(-?\d+);d:(-?\d+);a:a:3:\{i:0;i:-?\d+;i:1;i:-?\d+;i:2;a:(\d+):\{")
+_TURN_LINE_ENTRY = re.compile(rb'i:\d+;s:(\d+):"')
+
+def decode_turn_line(line):
+    """
+    Decodes a single line of the a{game_id} file straight from bytes.
+
+    PHP strings are prefixed with their length in bytes, so each action's JSON
+    payload is sliced out of the line without any intermediate str conversion.
+    Payloads are kept as RawActions, so no JSON is decoded here.
+
+    Arguments:
+    - line: bytes for a single line (turn) of the a{game_id} file
+
+    Returns:
+    - RawTurn for the line, or None if the line doesn't match the expected layout
+    """
+    header = _TURN_LINE_HEADER.match(line)
+    if header is None:
+        return None
+
+    pos = header.end()
+    actions = []
+    for _ in range(int(header.group(3))):
+        entry = _TURN_LINE_ENTRY.match(line, pos)
+        if entry is None:
+            return None
+        start = entry.end()
+        end = start + int(entry.group(1))
+        if line[end:end + 2] != b'";':
+            return None
+        pos = end + 2
+
+        payload = line[start:end]
+        if not b"action" in payload:
+            logging.debug("Skipping invalid action string")
+            continue
+        actions.append(RawAction(payload))
+
+    if line[pos:].rstrip() != b"}}":
+        return None
+
+    return RawTurn(playerId=int(header.group(1)), day=int(header.group(2)), actions=actions)
+
+class AWBWReplay(): # pylint: disable=too-many-instance-attributes
     """
     Usage:
 
     with AWBWReplay("52963.zip") as replay:
         ...
+
+    Pass stream=True to decode turns lazily while iterating turns() / actions()
+    instead of parsing the whole action file up front:
+
+    with AWBWReplay("52963.zip", stream=True) as replay:
+        for turn in replay.turns():
+            ...
+
+    Pass a cache.ReplayCache to reuse the parsed game info and turns the next
+    time the same replay is opened.
     """
 
     _ACTION_PARSE_STR = "p:{playerId:d};d:{day:d};a:{phpobj}"
 
-    def __init__(self, file):
+    def __init__(self, file, stream=False, cache=None):
         """
         Arguments:
         - file: str or Path object to open read-only to extract the replay.
+        - stream: If True, turns() and actions() are generators that decompress
+          and decode the action file one line at a time. No decompressed data is
+          retained, so memory use doesn't grow with the length of the replay.
+        - cache: Optional cache.ReplayCache to load the parsed replay from, or
+          store it in after parsing. Not used when streaming.
         """
         self._path = file
+        self._stream = stream
+        self._cache = cache
         self.file = None
         # Replay archive name list
         self.namelist = []
+        # Decompressed archive contents (left empty when streaming)
         self.filedata = []
+        self._actions_name = None
 
         self._turns = None
-        self._game_data = None
+        self._action_index = None
+        self._compiled_actions = None
+        self._cache_key = None
         self._game = None
 
     def __enter__(self):
         logging.debug("Opening %s", self._path)
-        self.file = zipfile.ZipFile(self._path)
-        self.namelist = self.file.namelist()
+        self._open()
+
+        cache_key = None
+        if self._cache is not None and not self._stream:
+            cache_key = self._key_for_cache()
+            self._cache_key = cache_key
+            with instrument.stage(instrument.STAGE_CACHE_LOAD):
+                cached = self._cache.load(cache_key)
+            if cached is not None:
+                logging.debug("Loaded %s from cache", self._path)
+                self._game, self._turns = cached
+                return self
+
         for name in self.namelist:
-            self.filedata.append(gzip.decompress(self.file.read(name)))
             if "a" in name:
+                self._actions_name = name
+                if self._stream:
+                    # Decoded on demand by _stream_turns
+                    continue
+                self.filedata.append(self._read_member(name))
                 # actions is a csv (sep = ;) of playerId, day, and php array of the actions made
-                self._turns = self._parse_actions(self.filedata[-1])
+                with instrument.stage(instrument.STAGE_DECODE_ACTIONS):
+                    self._turns = self._parse_actions(self.filedata[-1])
             else:
-                self._game_data = self._parse_game(self.filedata[-1])
-                self._game, _ = sanitize_phpobject(self._game_data)
+                data = self._read_member(name)
+                if not self._stream:
+                    self.filedata.append(data)
+                with instrument.stage(instrument.STAGE_DECODE_GAME):
+                    self._game = self._parse_game(data)
+
+        if cache_key is not None:
+            with instrument.stage(instrument.STAGE_CACHE_STORE):
+                self._cache.store(cache_key, (self._game, self._turns))
 
         return self
 
+    def _key_for_cache(self):
+        """Returns the cache key of the replay archive."""
+        return self._cache.key_for(self._path)
+
+    def _open(self):
+        """Opens the replay archive and lists its members."""
+        self.file = zipfile.ZipFile(self._path) # pylint: disable=consider-using-with
+        self.namelist = self.file.namelist()
+
+    def _read_member(self, name):
+        """Returns the decompressed contents of the named archive member."""
+        with instrument.stage(instrument.STAGE_DECOMPRESS):
+            return gzip.decompress(self.file.read(name))
+
+    def _member_lines(self, name):
+        """Generator over the lines of the named archive member, decompressed on the fly."""
+        with self.file.open(name) as member:
+            with gzip.GzipFile(fileobj=member) as data:
+                yield from data
+
     def _parse_game(self, data): # pylint: disable=no-self-use
         """
         Arguments:
         - data: The decompressed contents of the (non-prefixed) {game_id} gzip file
+
+        Returns:
+        - The game info dictionary
+        """
+        return decode_php(data)
+
+    def _parse_game_generic(self, data): # pylint: disable=no-self-use
+        """
+        Reference parser for the game info using phpserialize and sanitize_phpobject.
+
+        Arguments:
+        - data: The decompressed contents of the (non-prefixed) {game_id} gzip file
+
+        Returns:
+        - The game info dictionary
         """
-        return phpserialize.loads(data, object_hook=phpserialize.phpobject, decode_strings=True)
+        game_data = phpserialize.loads(
+                data, object_hook=phpserialize.phpobject, decode_strings=True)
+        return sanitize_phpobject(game_data)[0]
 
     def _parse_actions(self, data):
         """
@@ -108,22 +386,64 @@ class AWBWReplay():
         - data: The decompressed contents of the a{game_id} gzip file
         """
         result = []
-        for line in data.decode().strip().split("\n"):
-            parsed = parse.parse(self._ACTION_PARSE_STR, line).named
-            phpobj = phpserialize.loads(
-                    bytes(parsed["phpobj"], encoding="utf-8"),
-                    decode_strings=True)
-            phpactions = phpobj[2]
-            actions = []
-            for jsonstr in phpactions.values():
-                if not "action" in jsonstr:
-                    logging.debug("Skipping invalid action string")
-                    continue
-                actions.append(json.loads(jsonstr))
-            result.append(RawTurn(playerId=parsed["playerId"], day=parsed["day"], actions=actions))
+        for line in data.strip().split(b"\n"):
+            result.append(self._parse_turn(line))
 
         return result
 
+    def _parse_turn(self, line):
+        """
+        Arguments:
+        - line: bytes for a single line of the a{game_id} file, describing one turn
+
+        Returns:
+        - RawTurn for the line
+        """
+        turn = decode_turn_line(line)
+        if turn is None:
+            logging.debug("Falling back to the generic parser for an unexpected turn line")
+            turn = self._parse_turn_generic(line.decode())
+        return turn
+
+    def _parse_turn_generic(self, line):
+        """
+        Reference parser for a turn line using parse and phpserialize.
+
+        Much slower than decode_turn_line, but doesn't assume the exact layout.
+
+        Arguments:
+        - line: str for a single line of the a{game_id} file, describing one turn
+
+        Returns:
+        - RawTurn for the line
+        """
+        parsed = parse.parse(self._ACTION_PARSE_STR, line).named
+        phpobj = phpserialize.loads(
+                bytes(parsed["phpobj"], encoding="utf-8"),
+                decode_strings=True)
+        phpactions = phpobj[2]
+        actions = []
+        for jsonstr in phpactions.values():
+            if not "action" in jsonstr:
+                logging.debug("Skipping invalid action string")
+                continue
+            actions.append(json.loads(jsonstr))
+        return RawTurn(playerId=parsed["playerId"], day=parsed["day"], actions=actions)
+
+    def _stream_turns(self):
+        """
+        Generator decoding the a{game_id} file one line (turn) at a time,
+        straight out of the archive.
+        """
+        for line in self._member_lines(self._actions_name):
+            line = line.strip()
+            if not line:
+                continue
+            # Decompression is interleaved with reading lines, so only decoding is timed
+            with instrument.stage(instrument.STAGE_DECODE_ACTIONS):
+                turn = self._parse_turn(line)
+            yield turn
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.file.close()
 
@@ -136,21 +456,93 @@ class AWBWReplay():
         return self._game
 
     def turns(self):
-        """Returns the list of turns in the game."""
+        """
+        Returns the list of turns in the game.
+
+        When streaming, returns a generator over the turns instead. Each call
+        starts a new pass over the archive.
+        """
+        if self._stream:
+            return self._stream_turns()
         return self._turns
 
-    def actions(self):
-        """Generator over every action in the game."""
+    def actions(self, action_types=None):
+        """
+        Generator over every action in the game.
+
+        Arguments:
+        - action_types: Optional collection of action type strings (ie. {"Power"})
+          to only yield actions of those types
+        """
+        if action_types is None:
+            for _turn in self.turns():
+                yield from _turn.actions
+            return
+
         for _turn in self.turns():
-            yield from _turn.actions
+            for _action in _turn.actions:
+                if _action["action"] in action_types:
+                    yield _action
+
+    def compiled_actions(self):
+        """
+        Returns the list of every action compiled with actions.compile_action,
+        which AWBWGameState.apply_action applies without reading the replay's
+        views of each action again.
+
+        The list is kept for later calls, and stored in the cache (if any) so
+        reopening the replay doesn't compile it again. When streaming, each call
+        compiles a new list.
+        """
+        if self._compiled_actions is not None:
+            return self._compiled_actions
+
+        cache_key = None
+        if self._cache_key is not None:
+            cache_key = f"{self._cache_key}-actions{awbw_actions.FORMAT_VERSION}"
+            with instrument.stage(instrument.STAGE_CACHE_LOAD):
+                result = self._cache.load(cache_key)
+            if result is not None:
+                self._compiled_actions = result
+                return result
+
+        with instrument.stage(instrument.STAGE_COMPILE):
+            result = awbw_actions.compile_actions(self)
+        if cache_key is not None:
+            with instrument.stage(instrument.STAGE_CACHE_STORE):
+                self._cache.store(cache_key, result)
+        if not self._stream:
+            self._compiled_actions = result
+        return result
 
     def action_summaries(self):
         """Generator over every action type in the game."""
         for _action in self.actions():
             yield _action["action"]
 
+    def action_index(self):
+        """
+        Returns a dictionary mapping each action type string to the positions
+        of those actions in actions(). Built without decoding any actions.
+        """
+        if self._action_index is not None:
+            return self._action_index
+
+        index = {}
+        for i, action_type in enumerate(self.action_summaries()):
+            index.setdefault(action_type, []).append(i)
+
+        if not self._stream:
+            self._action_index = index
+        return index
+
 def find_in(collection, obj):
-    """Return all instances where some string appears"""
+    """
+    Return all instances where some string appears
+
+    Walks the whole collection on every call. Use search.ReplayIndex to run
+    many queries against a replay.
+    """
     result = []
     if isinstance(collection, list):
         for entry in collection:
@@ -185,7 +577,8 @@ def find_in(collection, obj):
 # Basic test code for opening a replay file
 if __name__ == "__main__":
     with AWBWReplay(sys.argv[1]) as replay:
-        action_types = list(replay.action_summaries())
-        print(f"There were {len(action_types)} actions. The action types were {set(action_types)}")
+        _action_types = list(replay.action_summaries())
+        print(f"There were {len(_action_types)} actions. "
+              f"The action types were {set(_action_types)}")
 
         print(" ".join(replay.action_summaries()))
@@ -0,0 +1,168 @@
+"""Module for searching a replay's game info and actions."""
+
+import typing
+
+# Substring queries are looked up by the n-grams they contain
+_NGRAM = 3
+
+class SearchHit(typing.NamedTuple):
+    """
+    A single place a searched value appears.
+
+    The path is the sequence of keys / list indices from the index root, which
+    has "game_info" and "actions" entries. For a key match, the path ends at the
+    key itself.
+    """
+    path: typing.Tuple
+    is_key: bool
+
+    def action_index(self):
+        """Returns the position in the replay's actions, or None for game info hits."""
+        if self.path[0] == "actions":
+            return self.path[1]
+        return None
+
+    def json_path(self):
+        """Returns the path formatted like $.actions[3].Move.unit.units_id"""
+        result = "$"
+        for part in self.path:
+            if isinstance(part, int):
+                result += f"[{part}]"
+            else:
+                result += f".{part}"
+        return result
+
+def _normalize(value):
+    """Returns the text a leaf value is indexed under"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def _hit_sort_key(hit):
+    # Order list indices numerically, and before any dictionary keys
+    return tuple((0, part) if isinstance(part, int) else (1, str(part)) for part in hit.path)
+
+def _ngrams(text):
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+class ReplayIndex():
+    """
+    Index over every key and value in a replay's game info and actions, built once.
+
+    Usage:
+
+    with AWBWReplay("52963.zip") as replay:
+        index = ReplayIndex.from_replay(replay)
+    for hit in index.find(98284944):
+        print(hit.json_path(), index.resolve(hit.path[:-1]))
+
+    Values are compared by their text, so 98284944 also matches "98284944".
+    """
+
+    def __init__(self, game_info, actions):
+        """
+        Arguments:
+        - game_info: The replay's game info dictionary
+        - actions: List of the replay's action dictionaries
+        """
+        self.root = {"game_info": game_info, "actions": actions}
+
+        # Normalized text -> list of SearchHits
+        self._exact = {}
+        # n-gram -> set of normalized texts containing it
+        self._ngrams = {}
+
+        self._build()
+
+    @classmethod
+    def from_replay(cls, replay):
+        """
+        Arguments:
+        - replay: An open AWBWReplay
+
+        Returns:
+        - ReplayIndex over the replay's game info and (decoded) actions
+        """
+        actions = []
+        for action in replay.actions():
+            actions.append(action.decode() if hasattr(action, "decode") else action)
+        return cls(replay.game_info(), actions)
+
+    def _add(self, value, path, is_key):
+        text = _normalize(value)
+        hits = self._exact.get(text)
+        if hits is None:
+            hits = self._exact[text] = []
+            for ngram in _ngrams(text):
+                self._ngrams.setdefault(ngram, set()).add(text)
+        hits.append(SearchHit(path, is_key))
+
+    def _build(self):
+        # Iterative walk, since action payloads can nest deeply
+        pending = [(value, (key,)) for key, value in self.root.items()]
+        while pending:
+            collection, path = pending.pop()
+            if isinstance(collection, dict):
+                for key, value in collection.items():
+                    child_path = path + (key,)
+                    self._add(key, child_path, True)
+                    pending.append((value, child_path))
+            elif isinstance(collection, list):
+                for i, value in enumerate(collection):
+                    pending.append((value, path + (i,)))
+            else:
+                self._add(collection, path, False)
+
+    def _matching_texts(self, text):
+        """Returns every indexed text containing text"""
+        if len(text) < _NGRAM:
+            return [candidate for candidate in self._exact if text in candidate]
+
+        candidates = None
+        # Intersect the smallest posting sets first
+        for posting in sorted((self._ngrams.get(ngram, set()) for ngram in _ngrams(text)),
+                key=len):
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return []
+        return [candidate for candidate in candidates if text in candidate]
+
+    def find(self, obj, substring=False, keys=True, values=True):
+        """
+        Arguments:
+        - obj: The value to search for
+        - substring: If True, also match keys and values containing obj's text
+        - keys: Include matches on dictionary keys
+        - values: Include matches on values
+
+        Returns:
+        - Sorted list of unique SearchHits
+        """
+        text = _normalize(obj)
+        if substring:
+            texts = self._matching_texts(text)
+        else:
+            texts = [text] if text in self._exact else []
+
+        result = set()
+        for match in texts:
+            for hit in self._exact[match]:
+                if (keys and hit.is_key) or (values and not hit.is_key):
+                    result.add(hit)
+        return sorted(result, key=_hit_sort_key)
+
+    def find_actions(self, obj, substring=False):
+        """Returns the sorted positions of every action that contains obj."""
+        result = set()
+        for hit in self.find(obj, substring=substring):
+            action_index = hit.action_index()
+            if action_index is not None:
+                result.add(action_index)
+        return sorted(result)
+
+    def resolve(self, path):
+        """Returns the object at a path (a SearchHit path, or any prefix of one)."""
+        result = self.root
+        for part in path:
+            result = result[part]
+        return result
@@ -0,0 +1,1120 @@
+"""
+Module for generating synthetic AWBW replays, to test and benchmark at scale.
+
+generate_replay writes a replay archive in the same layout as the ones AWBW
+exports, a gzipped {game_id} PHP serialized game and a gzipped a{game_id} file of
+turn lines, so AWBWReplay opens it like any other:
+
+state = generate_replay("big.zip", seed=1, days=40, units=200, fog=True)
+with AWBWReplay("big.zip") as replay:
+    ...
+
+The game is played with random actions picked by the weights of an action mix:
+units move, attack, capture, join, load and so on. Each action is compiled and
+applied to an AWBWGameState as it's generated, so later actions follow from the
+state so far, and the returned state is the state at the end of the replay. The
+map has no terrain, so any unit can go anywhere and damage is random. The same
+arguments always write the same archive.
+"""
+# pylint: disable=too-many-lines
+
+import argparse
+import gzip
+import json
+import math
+import random
+import sys
+import typing
+import zipfile
+
+import phpserialize
+
+from awbw_replay import actions, terrain
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState, flag_is_set
+from awbw_replay.fog import FogOfWar
+from awbw_replay.replay import decode_php
+
+class UnitType(typing.NamedTuple):
+    """Values shared by every unit of a type"""
+    symbol: str
+    movement_type: str
+    cost: int
+    movement_points: int
+    vision: int
+    fuel: int
+    fuel_per_turn: int
+    ammo: int
+    short_range: int
+    long_range: int
+    second_weapon: str
+    # Whether the unit can attack at all
+    attacks: bool
+
+# Unit name -> UnitType of the units built by the generator
+UNIT_TYPES = {
+    "Infantry": UnitType("A", "F", 1000, 3, 2, 99, 0, 0, 0, 0, "N", True),
+    "Mech": UnitType("B", "B", 3000, 2, 2, 70, 0, 3, 0, 0, "Y", True),
+    "Recon": UnitType("E", "W", 4000, 8, 5, 80, 0, 0, 0, 0, "N", True),
+    "APC": UnitType("P", "T", 5000, 6, 1, 70, 0, 0, 0, 0, "N", False),
+    "Artillery": UnitType("R", "T", 6000, 5, 1, 50, 0, 9, 2, 3, "N", True),
+    "Tank": UnitType("T", "T", 7000, 6, 3, 70, 0, 9, 0, 0, "Y", True),
+    "Black Boat": UnitType("K", "L", 7500, 7, 1, 60, 1, 0, 0, 0, "N", False),
+    "Sub": UnitType("S", "S", 20000, 5, 5, 60, 1, 6, 0, 0, "N", True),
+}
+
+# Unit name -> relative chance of building it, when affordable
+_BUILD_WEIGHTS = {
+    "Infantry": 30,
+    "Mech": 10,
+    "Recon": 8,
+    "APC": 8,
+    "Artillery": 10,
+    "Tank": 15,
+    "Black Boat": 5,
+    "Sub": 4,
+}
+
+_CAPTURING_UNITS = frozenset(("Infantry", "Mech"))
+_TRANSPORT = "APC"
+_REPAIRING_UNIT = "Black Boat"
+_HIDING_UNIT = "Sub"
+
+_MAX_VISION = max(unit_type.vision for unit_type in UNIT_TYPES.values())
+
+# Relative chance of each action type while playing a turn. Each turn ends with
+# an End, and the last turn of the game with a Resign, so those aren't weighted.
+DEFAULT_ACTION_MIX = {
+    AWBWGameAction.Type.MOVE: 30,
+    AWBWGameAction.Type.FIRE: 25,
+    AWBWGameAction.Type.BUILD: 20,
+    AWBWGameAction.Type.CAPT: 10,
+    AWBWGameAction.Type.LOAD: 3,
+    AWBWGameAction.Type.UNLOAD: 3,
+    AWBWGameAction.Type.JOIN: 2,
+    AWBWGameAction.Type.SUPPLY: 2,
+    AWBWGameAction.Type.REPAIR: 2,
+    AWBWGameAction.Type.POWER: 2,
+    AWBWGameAction.Type.HIDE: 2,
+    AWBWGameAction.Type.UNHIDE: 2,
+    AWBWGameAction.Type.DELETE: 1,
+}
+
+_PLACED_ACTION_TYPES = frozenset((AWBWGameAction.Type.END, AWBWGameAction.Type.RESIGN))
+
+# countries_id -> (country name, countries_code)
+_COUNTRIES = {
+    terrain.NEUTRAL: ("Neutral", ""),
+    1: ("Orange Star", "os"),
+    2: ("Blue Moon", "bm"),
+    3: ("Green Earth", "ge"),
+    4: ("Yellow Comet", "yc"),
+    5: ("Black Hole", "bh"),
+    6: ("Red Fire", "rf"),
+    7: ("Grey Sky", "gs"),
+    8: ("Brown Desert", "bd"),
+    9: ("Amber Blaze", "ab"),
+    10: ("Jade Sun", "js"),
+}
+
+_KIND_NAMES = {
+    terrain.CITY: "City",
+    terrain.BASE: "Base",
+    terrain.AIRPORT: "Airport",
+    terrain.PORT: "Port",
+    terrain.HQ: "HQ",
+    terrain.COM_TOWER: "Com Tower",
+    terrain.LAB: "Lab",
+}
+
+# (countries_id, kind) -> terrain id
+_TERRAIN_IDS = {info: terrain_id for terrain_id, info in terrain.PROPERTIES.items()}
+
+_FUNDS_PER_PROPERTY = 1000
+_CO_ID = 1 # Andy, whose powers repair units
+_CO_MAX_POWER = 90000
+_CO_MAX_SPOWER = 180000
+_FIRST_PLAYER_ID = 1000001
+_FIRST_USER_ID = 2001
+_FIRST_BUILDING_ID = 3000001
+_FIRST_UNIT_ID = 4000001
+_DATE = "2022-01-01 00:00:00"
+# Fixed archive member dates, so the same arguments write the same bytes
+_ARCHIVE_DATE = (2022, 1, 1, 0, 0, 0)
+# Number of random units or tiles tried before giving up on an action
+_ATTEMPTS = 4
+
+def _distance(x1, y1, x2, y2):
+    return abs(x1 - x2) + abs(y1 - y2)
+
+def _yes_no(value):
+    """Converts a unit flag to the "Y" / "N" of the replay"""
+    return "Y" if flag_is_set(value) else "N"
+
+def _action_weights(action_mix):
+    """Returns the action mix as a dictionary of AWBWGameAction.Type -> weight"""
+    weights = {}
+    for action_type, weight in action_mix.items():
+        action_type = AWBWGameAction.Type(action_type)
+        if action_type in _PLACED_ACTION_TYPES:
+            raise ValueError(f"{action_type.value} actions are placed by the generator")
+        if weight > 0:
+            weights[action_type] = weight
+    return weights
+
+def _turn_line(p_id, day, payloads):
+    """Returns the a{game_id} line of a turn, see replay.decode_turn_line"""
+    php = phpserialize.dumps([p_id, day, dict(enumerate(payloads))])
+    return b"p:%d;d:%d;a:" % (p_id, day) + php
+
+class _ReplayGenerator(): # pylint: disable=too-many-instance-attributes
+    """Plays a random game, see generate_replay"""
+
+    def __init__(self, seed, players, units, fog, action_mix, game_id):
+        self.rng = random.Random(seed)
+        self.game_id = game_id
+        self.fog = fog
+        self.action_mix = _action_weights(action_mix)
+        self.player_ids = [_FIRST_PLAYER_ID + i for i in range(players)]
+        self.country_codes = {
+            p_id: _COUNTRIES[i + 1][1] for i, p_id in enumerate(self.player_ids)}
+        self.max_player_units = max(1, units // players)
+
+        # Properties per player, and left neutral to capture
+        self.bases = max(1, self.max_player_units // 10)
+        self.cities = max(2, self.max_player_units // 8)
+        building_count = players * (2 + 2 * self.cities + 2 * self.bases)
+        self.size = max(8, math.ceil(math.sqrt(4 * (building_count + units))))
+
+        self.next_unit_id = _FIRST_UNIT_ID
+        # Ids of the units that already acted this turn
+        self.acted = set()
+        self.state = None
+        self.fog_of_war = None
+
+    def _building(self, b_id, countries_id, kind, tile):
+        return phpserialize.phpobject("awbwBuilding", {
+            "id": b_id,
+            "games_id": self.game_id,
+            "terrain_id": _TERRAIN_IDS[(countries_id, kind)],
+            "x": tile[0],
+            "y": tile[1],
+            "capture": 20,
+            "last_capture": 20,
+            "last_updated": _DATE,
+        })
+
+    def _initial_unit(self, p_id, name, tile):
+        unit_type = UNIT_TYPES[name]
+        u_id = self.next_unit_id
+        self.next_unit_id += 1
+        return phpserialize.phpobject("awbwUnit", {
+            "id": u_id,
+            "games_id": self.game_id,
+            "players_id": p_id,
+            "name": name,
+            "movement_points": unit_type.movement_points,
+            "vision": unit_type.vision,
+            "fuel": unit_type.fuel,
+            "fuel_per_turn": unit_type.fuel_per_turn,
+            "sub_dive": "N",
+            "ammo": unit_type.ammo,
+            "short_range": unit_type.short_range,
+            "long_range": unit_type.long_range,
+            "second_weapon": unit_type.second_weapon,
+            "symbol": unit_type.symbol,
+            "cost": unit_type.cost,
+            "movement_type": unit_type.movement_type,
+            "x": tile[0],
+            "y": tile[1],
+            "moved": 0,
+            "capture": 0,
+            "fired": 0,
+            "hit_points": 10.0,
+            "cargo1_units_id": 0,
+            "cargo2_units_id": 0,
+            "carried": "N",
+        })
+
+    def _player(self, order, p_id, funds):
+        return phpserialize.phpobject("awbwPlayer", {
+            "id": p_id,
+            "users_id": _FIRST_USER_ID + order,
+            "games_id": self.game_id,
+            "countries_id": order + 1,
+            "co_id": _CO_ID,
+            "funds": funds,
+            "turn": None,
+            "email": None,
+            "uniq_id": None,
+            "eliminated": "N",
+            "last_read": _DATE,
+            "last_read_broadcasts": None,
+            "emailpress": None,
+            "signature": None,
+            "co_power": 0,
+            "co_power_on": "N",
+            "order": order,
+            "accept_draw": "N",
+            "co_max_power": _CO_MAX_POWER,
+            "co_max_spower": _CO_MAX_SPOWER,
+            "co_image": "andy.png",
+            "team": str(p_id),
+            "aet_count": 0,
+            "turn_start": _DATE,
+            "turn_clock": 1036800,
+            "tags_co_id": None,
+            "tags_co_power": None,
+            "tags_co_max_power": None,
+            "tags_co_max_spower": None,
+            "interface": "N",
+        })
+
+    def game(self):
+        """Returns the PHP serialized {game_id} member, and sets up the initial state"""
+        tiles = [(x, y) for x in range(self.size) for y in range(self.size)]
+        self.rng.shuffle(tiles)
+
+        buildings = []
+        units = []
+        for order, p_id in enumerate(self.player_ids):
+            countries_id = order + 1
+            hq_tile = tiles.pop()
+            buildings.append((countries_id, terrain.HQ, hq_tile))
+            buildings += [(countries_id, terrain.BASE, tiles.pop()) for _ in range(self.bases)]
+            buildings += [(countries_id, terrain.CITY, tiles.pop()) for _ in range(self.cities)]
+            buildings += [(terrain.NEUTRAL, terrain.BASE, tiles.pop()) for _ in range(self.bases)]
+            buildings += [(terrain.NEUTRAL, terrain.CITY, tiles.pop()) for _ in range(self.cities)]
+            buildings.append((terrain.NEUTRAL, terrain.COM_TOWER, tiles.pop()))
+            units.append(self._initial_unit(p_id, "Infantry", hq_tile))
+
+        # The first player's income is already paid, the others get theirs when
+        # their turn starts
+        income = (1 + self.bases + self.cities) * _FUNDS_PER_PROPERTY
+        players = [self._player(order, p_id, income if order == 0 else 0)
+                   for order, p_id in enumerate(self.player_ids)]
+
+        game = phpserialize.phpobject("awbwGame", {
+            "id": self.game_id,
+            "name": f"Synthetic game {self.game_id}",
+            "password": None,
+            "creator": _FIRST_USER_ID,
+            "start_date": _DATE,
+            "end_date": None,
+            "activity_date": _DATE,
+            "maps_id": 0,
+            "weather_type": "Clear",
+            "weather_start": None,
+            "weather_code": "C",
+            "win_condition": None,
+            "turn": self.player_ids[0],
+            "day": 1,
+            "active": "Y",
+            "funds": _FUNDS_PER_PROPERTY,
+            "capture_win": 1000,
+            "fog": "Y" if self.fog else "N",
+            "comment": None,
+            "type": "L",
+            "boot_interval": -1,
+            "starting_funds": 0,
+            "official": "N",
+            "min_rating": 0,
+            "max_rating": None,
+            "league": None,
+            "team": "N",
+            "aet_interval": -1,
+            "aet_date": _DATE,
+            "use_powers": "Y",
+            "players": dict(enumerate(players)),
+            "buildings": {
+                i: self._building(_FIRST_BUILDING_ID + i, *building)
+                for i, building in enumerate(buildings)},
+            "units": dict(enumerate(units)),
+            "timers_initial": 14400,
+            "timers_increment": 2880,
+            "timers_max_turn": 10080,
+        })
+        data = phpserialize.dumps(game)
+        self.state = AWBWGameState(replay_initial=decode_php(data))
+        self.fog_of_war = FogOfWar(self.state)
+        return data
+
+    def apply(self, payloads, action_data):
+        """Applies a generated action to the state, and adds its JSON to the turn's payloads"""
+        payload = json.dumps(action_data, separators=(",", ":"))
+        # Applied from the JSON, exactly as it will be read back
+        action = actions.compile_action(json.loads(payload))
+        self.state.apply_action_inplace(action)
+        self.fog_of_war.update(action)
+        payloads.append(payload)
+
+    # Lookups on the current state
+
+    def _in_bounds(self, x, y):
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def _own_units(self, p_id, names=None):
+        """Returns the list of a player's units on the map that can still act this turn"""
+        return [unit for u_id, unit in self.state.units.items()
+                if unit["players_id"] == p_id and u_id not in self.acted
+                and unit["hit_points"] > 0 and not flag_is_set(unit["carried"])
+                and (names is None or unit["name"] in names)]
+
+    def _reach(self, unit):
+        """Returns how far a unit can move"""
+        return min(UNIT_TYPES[unit["name"]].movement_points, unit["fuel"])
+
+    def _free_tile(self, x, y, distance):
+        """Returns a random empty tile within distance of (x, y) other than (x, y), or None"""
+        for _ in range(_ATTEMPTS):
+            dx = self.rng.randint(-distance, distance)
+            span = distance - abs(dx)
+            dy = self.rng.randint(-span, span)
+            tile = (x + dx, y + dy)
+            if (dx or dy) and self._in_bounds(*tile) and not self.state.is_occupied(*tile):
+                return tile
+        return None
+
+    def _units_near(self, x, y, distance, select):
+        """Returns the list of units on the map within distance of (x, y) that select accepts"""
+        units = [self.state.units[u_id] for u_id in self.state.units_near(x, y, distance)]
+        return [unit for unit in units if select(unit)]
+
+    def _seen_by(self, x, y, dived=False):
+        """
+        Returns the set of ids of the players who can see a tile: the owner of a
+        building on it, and the players with a unit in vision range. Dived subs
+        are only seen from next to them.
+        """
+        if not self.fog:
+            return set(self.player_ids)
+        seen_by = set()
+        for u_id in self.state.units_near(x, y, 1 if dived else _MAX_VISION):
+            unit = self.state.units[u_id]
+            vision = 1 if dived else UNIT_TYPES[unit["name"]].vision
+            if _distance(unit["x"], unit["y"], x, y) <= vision:
+                seen_by.add(unit["players_id"])
+        b_id = self.state.building_at(x, y)
+        if b_id is not None:
+            seen_by.add(self.state.buildings[b_id]["players_id"])
+        return seen_by
+
+    def _views(self, seen_by, value, hidden=""):
+        """
+        Returns every player's view of a value: value for the players in
+        seen_by and hidden for the others, or a single global view without fog.
+        """
+        if not self.fog:
+            return {actions.EVERYONE: value}
+        return {str(p_id): value if p_id in seen_by else hidden for p_id in self.player_ids}
+
+    def _unit_view(self, unit, **changes):
+        """Returns the full replay view of a unit, with some values changed"""
+        values = {**unit, **changes}
+        unit_type = UNIT_TYPES[values["name"]]
+        return {
+            "0": values["id"],
+            "units_id": values["id"],
+            "units_games_id": self.game_id,
+            "units_players_id": values["players_id"],
+            "units_name": values["name"],
+            "units_movement_points": unit_type.movement_points,
+            "units_vision": unit_type.vision,
+            "units_fuel": values["fuel"],
+            "units_fuel_per_turn": unit_type.fuel_per_turn,
+            "units_sub_dive": _yes_no(values["sub_dive"]),
+            "units_ammo": values["ammo"],
+            "units_short_range": unit_type.short_range,
+            "units_long_range": unit_type.long_range,
+            "units_second_weapon": unit_type.second_weapon,
+            "units_symbol": unit_type.symbol,
+            "units_cost": unit_type.cost,
+            "units_movement_type": unit_type.movement_type,
+            "units_x": values["x"],
+            "units_y": values["y"],
+            "units_moved": int(flag_is_set(values["moved"])),
+            "units_capture": int(flag_is_set(values["capture"])),
+            "units_fired": int(flag_is_set(values["fired"])),
+            "units_hit_points": values["hit_points"],
+            "units_cargo1_units_id": values["cargo1_units_id"],
+            "units_cargo2_units_id": values["cargo2_units_id"],
+            "units_carried": _yes_no(values["carried"]),
+            "countries_code": self.country_codes[values["players_id"]],
+        }
+
+    def _try_units(self, units, attempt):
+        """Returns the first action data attempt(unit) gives for a few random units, or None"""
+        for unit in self.rng.sample(units, min(len(units), _ATTEMPTS)):
+            action_data = attempt(unit)
+            if action_data is not None:
+                self.acted.add(unit["id"])
+                return action_data
+        return None
+
+    def _move(self, unit, x, y):
+        """
+        Returns the Move action data of a unit moving to (x, y), or the empty
+        list other actions have when the unit stays in place.
+        """
+        if (x, y) == (unit["x"], unit["y"]):
+            return []
+        p_id = unit["players_id"]
+        dist = _distance(unit["x"], unit["y"], x, y)
+        view = self._unit_view(unit, x=x, y=y, fuel=unit["fuel"] - dist, moved=True)
+        seen_by = self._seen_by(x, y, flag_is_set(unit["sub_dive"])) | {p_id}
+
+        # Along x, then along y
+        step_x = 1 if x > unit["x"] else -1
+        step_y = 1 if y > unit["y"] else -1
+        path = [(path_x, unit["y"]) for path_x in range(unit["x"], x + step_x, step_x)]
+        path += [(x, path_y) for path_y in range(unit["y"] + step_y, y + step_y, step_y)]
+
+        discovered = None
+        if self.fog:
+            hidden = self.fog_of_war.hidden(p_id)
+            units = self._units_near(
+                    x, y, UNIT_TYPES[unit["name"]].vision,
+                    lambda other: other["id"] in hidden)
+            if units:
+                discovered = {"units": [self._unit_view(other) for other in units]}
+
+        return {
+            "action": "Move",
+            "unit": self._views(seen_by, view),
+            "paths": self._views(
+                    seen_by,
+                    [{"unit_visible": True, "x": path_x, "y": path_y} for path_x, path_y in path],
+                    []),
+            "dist": dist,
+            "trapped": False,
+            "discovered": {str(p_id): discovered},
+        }
+
+    # Action generators, each returns the action data of a random action of its
+    # type for the active player, or None if the player can't make one
+
+    def _fire(self, p_id):
+        units = [unit for unit in self._own_units(p_id) if UNIT_TYPES[unit["name"]].attacks]
+        return self._try_units(units, self._fire_with)
+
+    def _fire_with(self, unit): # pylint: disable=too-many-locals
+        p_id = unit["players_id"]
+        unit_type = UNIT_TYPES[unit["name"]]
+        hidden = self.fog_of_war.hidden(p_id)
+
+        def is_target(other):
+            return other["players_id"] != p_id and other["id"] not in hidden
+
+        x, y = unit["x"], unit["y"]
+        if unit_type.long_range:
+            # Indirect units fire without moving
+            targets = [other for other in self._units_near(x, y, unit_type.long_range, is_target)
+                       if _distance(x, y, other["x"], other["y"]) >= unit_type.short_range]
+        else:
+            targets = self._units_near(x, y, self._reach(unit) + 1, is_target)
+        if not targets:
+            return None
+        target = self.rng.choice(targets)
+
+        if not unit_type.long_range:
+            tiles = [(target["x"] + dx, target["y"] + dy)
+                     for dx, dy in [(1, 0), (-1, 0), (0, 1), (0, -1)]]
+            tiles = [tile for tile in tiles
+                     if tile == (x, y) or (self._in_bounds(*tile)
+                     and not self.state.is_occupied(*tile)
+                     and _distance(x, y, *tile) <= self._reach(unit))]
+            if not tiles:
+                return None
+            x, y = self.rng.choice(tiles)
+
+        target_type = UNIT_TYPES[target["name"]]
+        target_hp = max(0, target["hit_points"] - self.rng.randint(1, 5))
+        target_ammo = target["ammo"]
+        unit_hp = unit["hit_points"]
+        if target_hp > 0 and target_type.attacks and not target_type.long_range \
+                and not unit_type.long_range:
+            unit_hp = max(0, unit_hp - self.rng.randint(0, 3))
+            target_ammo = max(0, target_ammo - 1)
+
+        # Players charge their power meter with the value of the damage they
+        # take, and half the value of the damage they deal
+        target_loss = (target["hit_points"] - target_hp) * target_type.cost // 10
+        unit_loss = (unit["hit_points"] - unit_hp) * unit_type.cost // 10
+        co_values = {}
+        for role, player_id, gain in [
+                ("attacker", p_id, unit_loss + target_loss // 2),
+                ("defender", target["players_id"], target_loss + unit_loss // 2)]:
+            co_value = int(self.state.players[player_id]["co_power"] * 10) + gain
+            co_values[role] = {
+                "playerId": player_id,
+                "copValue": min(co_value, _CO_MAX_SPOWER),
+                "tagValue": None,
+            }
+
+        attacker = {
+            "units_ammo": max(0, unit["ammo"] - 1),
+            "units_hit_points": unit_hp,
+            "units_id": unit["id"],
+            "units_x": x,
+            "units_y": y,
+        }
+        defender = {
+            "units_ammo": target_ammo,
+            "units_hit_points": target_hp,
+            "units_id": target["id"],
+            "units_x": target["x"],
+            "units_y": target["y"],
+        }
+        sees_attacker = self._seen_by(x, y) | {p_id}
+        sees_defender = self._seen_by(target["x"], target["y"]) | {p_id, target["players_id"]}
+
+        def combat_info(viewer):
+            return {"hasVision": True, "combatInfo": {
+                "attacker": attacker if viewer in sees_attacker else "?",
+                "defender": defender if viewer in sees_defender else "?",
+            }}
+
+        if self.fog:
+            combat_info_vision = {str(viewer): combat_info(viewer) for viewer in self.player_ids}
+        else:
+            combat_info_vision = {actions.EVERYONE: combat_info(p_id)}
+
+        return {
+            "action": "Fire",
+            "Move": self._move(unit, x, y),
+            "Fire": {
+                "action": "Fire",
+                "combatInfoVision": combat_info_vision,
+                "copValues": co_values,
+            },
+        }
+
+    def _build(self, p_id):
+        if self.state.player_stats[p_id]["unit_count"] >= self.max_player_units:
+            return None
+        funds = self.state.players[p_id]["funds"]
+        names = [name for name in _BUILD_WEIGHTS if UNIT_TYPES[name].cost <= funds]
+        bases = [building for building in self.state.buildings.values()
+                 if building["players_id"] == p_id
+                 and terrain.property_info(building["terrain_id"])[1] == terrain.BASE
+                 and not self.state.is_occupied(building["x"], building["y"])]
+        if not names or not bases:
+            return None
+
+        base = self.rng.choice(bases)
+        name = self.rng.choices(names, [_BUILD_WEIGHTS[name] for name in names])[0]
+        unit_type = UNIT_TYPES[name]
+        unit = {
+            "id": self.next_unit_id,
+            "players_id": p_id,
+            "name": name,
+            "fuel": unit_type.fuel,
+            "sub_dive": False,
+            "ammo": unit_type.ammo,
+            "x": base["x"],
+            "y": base["y"],
+            "moved": True,
+            "capture": False,
+            "fired": True,
+            "hit_points": 10,
+            "cargo1_units_id": 0,
+            "cargo2_units_id": 0,
+            "carried": False,
+        }
+        self.next_unit_id += 1
+        self.acted.add(unit["id"])
+
+        view = self._unit_view(unit)
+        if self.fog:
+            # Only the players who can see the new unit have a view of it
+            seen_by = self._seen_by(base["x"], base["y"]) | {p_id}
+            new_unit = {str(viewer): view for viewer in self.player_ids if viewer in seen_by}
+        else:
+            new_unit = {actions.EVERYONE: view}
+        return {
+            "action": "Build",
+            "newUnit": new_unit,
+            "discovered": {str(p_id): None},
+        }
+
+    def _move_unit(self, p_id):
+        units = [unit for unit in self._own_units(p_id) if unit["fuel"] > 0]
+
+        def move_with(unit):
+            tile = self._free_tile(unit["x"], unit["y"], self._reach(unit))
+            return None if tile is None else self._move(unit, *tile)
+
+        return self._try_units(units, move_with)
+
+    def _destination(self, unit):
+        """Returns a random tile to move to before acting, or the unit's own tile half the time"""
+        if self.rng.random() < 0.5:
+            return unit["x"], unit["y"]
+        tile = self._free_tile(unit["x"], unit["y"], self._reach(unit))
+        return (unit["x"], unit["y"]) if tile is None else tile
+
+    def _capt(self, p_id):
+        return self._try_units(self._own_units(p_id, _CAPTURING_UNITS), self._capt_with)
+
+    def _capt_with(self, unit):
+        p_id = unit["players_id"]
+        x, y = unit["x"], unit["y"]
+        buildings = []
+        for b_id in self.state.buildings_near(x, y, self._reach(unit)):
+            building = self.state.buildings[b_id]
+            tile = (building["x"], building["y"])
+            # Taking an HQ would end the game
+            if building["players_id"] != p_id \
+                    and terrain.property_info(building["terrain_id"])[1] != terrain.HQ \
+                    and (tile == (x, y) or not self.state.is_occupied(*tile)):
+                buildings.append(building)
+        if not buildings:
+            return None
+
+        building = self.rng.choice(buildings)
+        b_x, b_y = building["x"], building["y"]
+        capture = building["capture"] - unit["hit_points"]
+        building_info = {
+            "buildings_capture": capture,
+            "buildings_id": building["id"],
+            "buildings_x": b_x,
+            "buildings_y": b_y,
+            "buildings_team": None,
+        }
+        income = None
+        if capture <= 0:
+            kind = terrain.property_info(building["terrain_id"])[1]
+            countries_id = self.player_ids.index(p_id) + 1
+            building_info = {
+                "0": building["id"],
+                **building_info,
+                "buildings_capture": 20,
+                "terrain_id": _TERRAIN_IDS[(countries_id, kind)],
+                "terrain_name": f"{_COUNTRIES[countries_id][0]} {_KIND_NAMES[kind]}",
+                "terrain_defense": 3,
+                "buildings_players_id": p_id,
+                "buildings_team": str(p_id),
+            }
+            player_income = self.state.player_stats[p_id]["income"]
+            if kind in terrain.INCOME_KINDS:
+                player_income += _FUNDS_PER_PROPERTY
+            income = {str(p_id): {"player": p_id, "income": player_income}}
+
+        return {
+            "action": "Capt",
+            "Move": self._move(unit, b_x, b_y),
+            "Capt": {
+                "action": "Capt",
+                "buildingInfo": building_info,
+                "vision": self._views(
+                        self._seen_by(b_x, b_y) | {p_id},
+                        {"onCapture": {"x": b_x, "y": b_y}},
+                        {"onCapture": "?"}),
+                "income": income,
+            },
+        }
+
+    def _partners(self, unit, select):
+        """Returns the list of the player's other units within reach that select accepts"""
+        def is_partner(other):
+            return other["id"] != unit["id"] and other["players_id"] == unit["players_id"] \
+                    and select(other)
+        return self._units_near(unit["x"], unit["y"], self._reach(unit), is_partner)
+
+    def _join(self, p_id):
+        units = [unit for unit in self._own_units(p_id)
+                 if not unit["cargo1_units_id"] and not unit["cargo2_units_id"]]
+        return self._try_units(units, self._join_with)
+
+    def _join_with(self, unit):
+        partners = self._partners(unit, lambda other: (
+                other["name"] == unit["name"]
+                and not other["cargo1_units_id"] and not other["cargo2_units_id"]
+                and min(unit["hit_points"], other["hit_points"]) < 10))
+        if not partners:
+            return None
+
+        p_id = unit["players_id"]
+        partner = self.rng.choice(partners)
+        self.acted.add(partner["id"])
+        hit_points = unit["hit_points"] + partner["hit_points"]
+        # Hit points over 10 are refunded
+        funds = self.state.players[p_id]["funds"]
+        funds += max(0, hit_points - 10) * UNIT_TYPES[unit["name"]].cost // 10
+        joined = self._unit_view(
+                partner,
+                hit_points=min(10, hit_points),
+                fuel=max(unit["fuel"], partner["fuel"]),
+                ammo=max(unit["ammo"], partner["ammo"]),
+                moved=True)
+        return {
+            "action": "Join",
+            "Move": self._move(unit, partner["x"], partner["y"]),
+            "Join": {
+                "action": "Join",
+                "playerId": p_id,
+                "newFunds": self._views({p_id}, funds),
+                "unit": self._views(
+                        self._seen_by(partner["x"], partner["y"]) | {p_id}, joined),
+                "joinID": self._views(self.player_ids, unit["id"]),
+            },
+        }
+
+    def _load(self, p_id):
+        return self._try_units(self._own_units(p_id, _CAPTURING_UNITS), self._load_with)
+
+    def _load_with(self, unit):
+        transports = self._partners(unit, lambda other: (
+                other["name"] == _TRANSPORT
+                and not other["cargo1_units_id"] and not other["cargo2_units_id"]))
+        if not transports:
+            return None
+
+        transport = self.rng.choice(transports)
+        seen_by = self._seen_by(transport["x"], transport["y"]) | {unit["players_id"]}
+        return {
+            "action": "Load",
+            "Move": self._move(unit, transport["x"], transport["y"]),
+            "Load": {
+                "action": "Load",
+                "loaded": self._views(seen_by, unit["id"]),
+                "transport": self._views(seen_by, transport["id"]),
+            },
+        }
+
+    def _unload(self, p_id):
+        units = [unit for unit in self._own_units(p_id, {_TRANSPORT})
+                 if unit["cargo1_units_id"]]
+
+        def unload_with(transport):
+            tile = self._free_tile(transport["x"], transport["y"], 1)
+            if tile is None:
+                return None
+            cargo = self.state.units[transport["cargo1_units_id"]]
+            self.acted.add(cargo["id"])
+            view = self._unit_view(cargo, x=tile[0], y=tile[1], moved=True, carried=False)
+            return {
+                "action": "Unload",
+                "transportID": transport["id"],
+                "unit": self._views(self._seen_by(*tile) | {p_id}, view),
+                "discovered": {str(p_id): None},
+            }
+
+        return self._try_units(units, unload_with)
+
+    def _supply(self, p_id):
+        def supply_with(transport):
+            x, y = self._destination(transport)
+            supplied = [other["id"] for other in self._units_near(
+                    x, y, 1, lambda other: other["players_id"] == p_id)
+                        if other["id"] != transport["id"]]
+            seen_by = self._seen_by(x, y) | {p_id}
+            return {
+                "action": "Supply",
+                "Move": self._move(transport, x, y),
+                "Supply": {
+                    "action": "Supply",
+                    "unit": self._views(seen_by, transport["id"]),
+                    "supplied": self._views(seen_by, supplied, []),
+                },
+            }
+
+        return self._try_units(self._own_units(p_id, {_TRANSPORT}), supply_with)
+
+    def _repair(self, p_id):
+        def repair_with(boat):
+            funds = self.state.players[p_id]["funds"]
+            damaged = self._units_near(boat["x"], boat["y"], 1, lambda other: (
+                    other["players_id"] == p_id and other["id"] != boat["id"]
+                    and other["hit_points"] < 10
+                    and UNIT_TYPES[other["name"]].cost // 10 <= funds))
+            if not damaged:
+                return None
+            unit = self.rng.choice(damaged)
+            repaired = {"units_id": unit["id"], "units_hit_points": unit["hit_points"] + 1}
+            return {
+                "action": "Repair",
+                "Move": [],
+                "Repair": {
+                    "action": "Repair",
+                    "unit": self._views(self._seen_by(boat["x"], boat["y"]) | {p_id}, boat["id"]),
+                    "repaired": self._views(
+                            self._seen_by(unit["x"], unit["y"]) | {p_id}, repaired),
+                    "funds": self._views({p_id}, funds - UNIT_TYPES[unit["name"]].cost // 10),
+                },
+            }
+
+        return self._try_units(self._own_units(p_id, {_REPAIRING_UNIT}), repair_with)
+
+    def _delete(self, p_id):
+        units = [unit for unit in self._own_units(p_id)
+                 if not unit["cargo1_units_id"] and not unit["cargo2_units_id"]]
+
+        def delete_with(unit):
+            seen_by = self._seen_by(unit["x"], unit["y"], flag_is_set(unit["sub_dive"]))
+            return {
+                "action": "Delete",
+                "Delete": {
+                    "action": "Delete",
+                    "unitId": self._views(seen_by | {p_id}, unit["id"]),
+                },
+            }
+
+        return self._try_units(units, delete_with)
+
+    def _hide(self, p_id):
+        units = [unit for unit in self._own_units(p_id, {_HIDING_UNIT})
+                 if not flag_is_set(unit["sub_dive"]) and unit["fuel"] > 0]
+
+        def hide_with(unit):
+            x, y = self._destination(unit)
+            return {
+                "action": "Hide",
+                "Move": self._move(unit, x, y),
+                "Hide": {
+                    "action": "Hide",
+                    # Only players next to the sub still see it
+                    "unit": self._views(self._seen_by(x, y, True) | {p_id}, unit["id"]),
+                },
+            }
+
+        return self._try_units(units, hide_with)
+
+    def _unhide(self, p_id):
+        units = [unit for unit in self._own_units(p_id, {_HIDING_UNIT})
+                 if flag_is_set(unit["sub_dive"])]
+
+        def unhide_with(unit):
+            x, y = self._destination(unit)
+            view = self._unit_view(
+                    unit, x=x, y=y, fuel=unit["fuel"] - _distance(unit["x"], unit["y"], x, y),
+                    sub_dive=False)
+            return {
+                "action": "Unhide",
+                "Move": self._move(unit, x, y),
+                "Unhide": {
+                    "action": "Unhide",
+                    "unit": self._views(self._seen_by(x, y) | {p_id}, view),
+                },
+            }
+
+        return self._try_units(units, unhide_with)
+
+    def _power(self, p_id):
+        player = self.state.players[p_id]
+        co_value = player["co_power"] * 10
+        if player["co_power_on"] or player["super_co_power_on"] or co_value < _CO_MAX_POWER:
+            return None
+
+        is_super = co_value >= _CO_MAX_SPOWER
+        repair = 5 if is_super else 2
+        units = [{"units_id": u_id, "units_hit_points": min(10, unit["hit_points"] + repair)}
+                 for u_id, unit in self.state.units.items()
+                 if unit["players_id"] == p_id and 0 < unit["hit_points"] < 10]
+        return {
+            "action": "Power",
+            "playerID": p_id,
+            "coName": "Andy",
+            "coPower": "S" if is_super else "Y",
+            "powerName": "Hyper Upgrade" if is_super else "Hyper Repair",
+            "playersCOP": 0,
+            "unitReplace": self._views({p_id}, {"units": units}, {"units": []}),
+        }
+
+    def end(self, p_id):
+        """Returns the action data of the active player ending their turn"""
+        order = self.player_ids.index(p_id)
+        next_ids = [player_id
+                    for player_id in self.player_ids[order + 1:] + self.player_ids[:order + 1]
+                    if not self.state.players[player_id]["eliminated"]]
+        next_id = next_ids[0]
+        day = self.state.game_info["day"]
+        if self.player_ids.index(next_id) <= order:
+            day += 1
+
+        # Units on their own properties are repaired for 10% of their cost per hit point
+        funds = self.state.players[next_id]["funds"] + self.state.player_stats[next_id]["income"]
+        repaired = []
+        for u_id, unit in self.state.units.items():
+            if unit["players_id"] != next_id or not 0 < unit["hit_points"] < 10 \
+                    or flag_is_set(unit["carried"]):
+                continue
+            b_id = self.state.building_at(unit["x"], unit["y"])
+            if b_id is None or self.state.buildings[b_id]["players_id"] != next_id:
+                continue
+            repair = min(2, 10 - unit["hit_points"])
+            cost = repair * UNIT_TYPES[unit["name"]].cost // 10
+            if cost <= funds:
+                funds -= cost
+                repaired.append({
+                    "units_id": str(u_id),
+                    "units_hit_points": unit["hit_points"] + repair,
+                })
+
+        return {
+            "action": "End",
+            "updatedInfo": {
+                "event": "NextTurn",
+                "nextPId": next_id,
+                "nextFunds": self._views({next_id}, funds),
+                "nextTimer": 1036800,
+                "nextWeather": "C",
+                "supplied": self._views(self.player_ids, [], []),
+                "repaired": self._views({next_id}, repaired, []),
+                "day": day,
+            },
+        }
+
+    def resign(self, p_id):
+        """Returns the action data of the active player resigning"""
+        message = f"Player {p_id} has resigned!"
+        action_data = {
+            "action": "Resign",
+            "Resign": {"action": "Resign", "playerId": p_id, "message": message},
+        }
+        winners = [player_id for player_id, player in self.state.players.items()
+                   if player_id != p_id and not player["eliminated"]]
+        if len(winners) == 1:
+            action_data["GameOver"] = {
+                "day": self.state.game_info["day"],
+                "gameEndDate": _DATE,
+                "losers": [p_id],
+                "message": message,
+                "winners": winners,
+            }
+        return action_data
+
+    _TYPE_TO_GENERATE_FUNC = {
+        AWBWGameAction.Type.FIRE: _fire,
+        AWBWGameAction.Type.JOIN: _join,
+        AWBWGameAction.Type.MOVE: _move_unit,
+        AWBWGameAction.Type.BUILD: _build,
+        AWBWGameAction.Type.POWER: _power,
+        AWBWGameAction.Type.CAPT: _capt,
+        AWBWGameAction.Type.LOAD: _load,
+        AWBWGameAction.Type.UNLOAD: _unload,
+        AWBWGameAction.Type.REPAIR: _repair,
+        AWBWGameAction.Type.SUPPLY: _supply,
+        AWBWGameAction.Type.DELETE: _delete,
+        AWBWGameAction.Type.HIDE: _hide,
+        AWBWGameAction.Type.UNHIDE: _unhide,
+    }
+
+    def play_turn(self, p_id, payloads):
+        """
+        Applies random actions for the active player, until every unit and base
+        had the chance to act or no action type is possible anymore.
+        """
+        self.acted = set()
+        weights = dict(self.action_mix)
+        remaining = len(self._own_units(p_id)) + self.bases
+        while weights and remaining > 0:
+            action_type = self.rng.choices(list(weights), list(weights.values()))[0]
+            action_data = self._TYPE_TO_GENERATE_FUNC[action_type](self, p_id)
+            if action_data is None:
+                del weights[action_type]
+                continue
+            self.apply(payloads, action_data)
+            remaining -= 1
+
+def generate_replay(path, seed=0, days=20, players=2, units=50, fog=False,
+                    action_mix=None, resign=True, game_id=None):
+    """
+    Writes a synthetic replay archive.
+
+    Arguments:
+    - path: File to write the replay archive to
+    - seed: Seed of the random game, the same arguments always write the same archive
+    - days: Number of days played
+    - players: Number of players, from 2 to 10
+    - units: Most units alive at once, split evenly between the players. The
+      number of properties and the size of the map grow with it.
+    - fog: Whether the game has fog of war, giving every action a view per player
+    - action_mix: Dictionary of AWBWGameAction.Type (or type string) -> relative
+      chance of the action type, DEFAULT_ACTION_MIX by default. Every turn ends
+      with an End, so End and Resign can't be weighted.
+    - resign: Whether the last turn ends with the player resigning instead of an End
+    - game_id: Game id of the replay, 900000 + seed by default
+
+    Returns:
+    - The AWBWGameState at the end of the replay
+    """
+    if not 2 <= players <= 10:
+        raise ValueError(f"Expected 2 to 10 players, got {players}")
+    if game_id is None:
+        game_id = 900000 + seed
+    generator = _ReplayGenerator(
+            seed, players, units, fog, DEFAULT_ACTION_MIX if action_mix is None else action_mix,
+            game_id)
+
+    game_data = generator.game()
+    lines = []
+    for turn in range(days * players):
+        p_id = generator.state.game_info["active_player_id"]
+        day = generator.state.game_info["day"]
+        payloads = []
+        generator.play_turn(p_id, payloads)
+        if resign and turn == days * players - 1:
+            generator.apply(payloads, generator.resign(p_id))
+        else:
+            generator.apply(payloads, generator.end(p_id))
+        lines.append(_turn_line(p_id, day, payloads))
+
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in [(str(game_id), game_data), (f"a{game_id}", b"\n".join(lines))]:
+            info = zipfile.ZipInfo(name, date_time=_ARCHIVE_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, gzip.compress(data, mtime=0))
+
+    return generator.state
+
+def _action_weight(value):
+    action_type, _, weight = value.partition("=")
+    try:
+        return AWBWGameAction.Type(action_type), float(weight)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f"Expected TYPE=WEIGHT, got {value}") from error
+
+def get_args(argv=None):
+    """
+    Handles argument parsing for generating a replay
+
+    Arguments:
+    - argv: List of string arguments, or None to use sys.argv (default)
+
+    Returns:
+    - namespace containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic AWBW replay")
+    parser.add_argument("output", help="Replay archive to write", type=str)
+    parser.add_argument("--seed", help="Seed of the random game", type=int, default=0)
+    parser.add_argument("--days", help="Number of days played", type=int, default=20)
+    parser.add_argument("--players", help="Number of players", type=int, default=2)
+    parser.add_argument("--units", help="Most units alive at once", type=int, default=50)
+    parser.add_argument("--fog", help="Play with fog of war", action="store_true")
+    parser.add_argument(
+            "--mix",
+            help="Relative chance of an action type, ie. Fire=40 (repeatable)",
+            type=_action_weight,
+            action="append",
+            default=[])
+    parser.add_argument(
+            "--no-resign",
+            help="End the last turn instead of resigning",
+            action="store_true")
+
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    _args = get_args()
+    _state = generate_replay(
+            _args.output,
+            seed=_args.seed,
+            days=_args.days,
+            players=_args.players,
+            units=_args.units,
+            fog=_args.fog,
+            action_mix={**DEFAULT_ACTION_MIX, **dict(_args.mix)},
+            resign=not _args.no_resign)
+    print(f"Wrote {_args.output}: {_state.game_info['turn']} turns, "
+          f"{len(_state.units)} units built")
+    sys.exit(0)
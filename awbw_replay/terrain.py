@@ -0,0 +1,51 @@
+"""AWBW terrain ids of properties, and which country owns them."""
+
+CITY = "city"
+BASE = "base"
+AIRPORT = "airport"
+PORT = "port"
+HQ = "hq"
+COM_TOWER = "com_tower"
+LAB = "lab"
+
+# Properties that earn their owner funds each turn
+INCOME_KINDS = frozenset((CITY, BASE, AIRPORT, PORT, HQ))
+
+NEUTRAL = 0
+
+# countries_id -> terrain ids of (city, base, airport, port, HQ, com tower, lab)
+_COUNTRY_PROPERTIES = {
+    NEUTRAL: (34, 35, 36, 37, None, 133, 145),
+    1: (38, 39, 40, 41, 42, 134, 146), # Orange Star
+    2: (43, 44, 45, 46, 47, 129, 140), # Blue Moon
+    3: (48, 49, 50, 51, 52, 131, 142), # Green Earth
+    4: (53, 54, 55, 56, 57, 136, 148), # Yellow Comet
+    5: (91, 92, 93, 94, 95, 128, 139), # Black Hole
+    6: (81, 82, 83, 84, 85, 135, 147), # Red Fire
+    7: (86, 87, 88, 89, 90, 137, 143), # Grey Sky
+    8: (96, 97, 98, 99, 100, 130, 141), # Brown Desert
+    9: (119, 118, 117, 121, 120, 127, 138), # Amber Blaze
+    10: (124, 123, 122, 126, 125, 132, 144), # Jade Sun
+}
+
+_KINDS = (CITY, BASE, AIRPORT, PORT, HQ, COM_TOWER, LAB)
+
+# terrain id -> (countries_id, kind)
+PROPERTIES = {
+    terrain_id: (countries_id, kind)
+    for countries_id, terrain_ids in _COUNTRY_PROPERTIES.items()
+    for terrain_id, kind in zip(terrain_ids, _KINDS)
+    if terrain_id is not None
+}
+
+def property_info(terrain_id):
+    """
+    Arguments:
+    - terrain_id: AWBW terrain id of a building
+
+    Returns:
+    - (countries_id, kind) of the property, with countries_id NEUTRAL for
+      unowned properties, or None if the terrain isn't a known property (ie. a
+      missile silo or pipe seam, or a newer country missing from this table)
+    """
+    return PROPERTIES.get(terrain_id)
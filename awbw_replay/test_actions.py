@@ -0,0 +1,119 @@
+"""
+Basic unit tests for the actions module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from awbw_replay import actions
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.cache import ReplayCache
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.unit_store import UnitStore
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestCompiledActions(unittest.TestCase):
+    """Tests for compiling replay actions"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_same_states(self):
+        """Test that compiled actions reach the same states as replay actions"""
+        for name in ["basic_replay.zip", "standard_replay.zip"]:
+            with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, name)) as replay:
+                state = AWBWGameState(replay_initial=replay.game_info())
+                compiled_state = AWBWGameState(replay_initial=replay.game_info())
+                compiled = replay.compiled_actions()
+                assert len(compiled) == len(list(replay.actions()))
+
+                for action, record in zip(replay.actions(), compiled):
+                    assert isinstance(record, actions.RECORD_TYPES)
+                    assert record.ACTION == action["action"]
+                    state = state.apply_action(AWBWGameAction(action))
+                    compiled_state = compiled_state.apply_action(record)
+                    assert repr(compiled_state.units) == repr(state.units)
+                    assert compiled_state.players == state.players
+                    assert compiled_state.buildings == state.buildings
+                    assert compiled_state.game_info == state.game_info
+
+    def test_reuse(self):
+        """Test that compiled actions can be pickled and applied again"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            compiled = replay.compiled_actions()
+            assert replay.compiled_actions() is compiled
+            initial = AWBWGameState(replay_initial=replay.game_info())
+
+        final_states = []
+        for records in [compiled, pickle.loads(pickle.dumps(compiled))]:
+            state = initial
+            for record in records:
+                state = state.apply_action(record)
+            final_states.append(state)
+        assert final_states[0].units == final_states[1].units
+        assert final_states[0].players == final_states[1].players
+
+    def test_cache(self):
+        """Test that compiled actions are stored in and loaded from the replay cache"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        cache = ReplayCache(self.tempdir)
+        with AWBWReplay(example_replay, cache=cache) as replay:
+            expected = replay.compiled_actions()
+        assert cache.hits == 0
+
+        with AWBWReplay(example_replay, cache=cache) as replay:
+            assert replay.compiled_actions() == expected
+        assert cache.hits == 2
+
+    def test_power_hp_changes(self):
+        """Test that global hit point changes of powers are compiled and applied"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            game_info = replay.game_info()
+            compiled = replay.compiled_actions()
+            raw_actions = list(replay.actions())
+        power_index = next(i for i, record in enumerate(compiled) if record.ACTION == "Power")
+
+        gainer, loser = (int(p_id) for p_id in list(game_info["players"])[:2])
+        power = dict(raw_actions[power_index])
+        power["hpChange"] = {
+            "hpGain": {str(gainer): gainer, "hp": 2, "units_fuel": 0},
+            "hpLoss": {str(loser): loser, "hp": -3, "units_fuel": 0},
+        }
+        record = actions.compile_action(power)
+        assert record.hp_changes == (((gainer,), 2), ((loser,), -3))
+
+        for units_type in [dict, UnitStore]:
+            state = AWBWGameState(replay_initial=game_info, units_type=units_type)
+            for action in compiled[:power_index]:
+                state.apply_action_inplace(action)
+            before = {u_id: (unit["players_id"], unit["hit_points"])
+                      for u_id, unit in state.units.items()}
+            state.apply_action_inplace(record)
+            for u_id, (p_id, hit_points) in before.items():
+                expected = hit_points
+                if p_id in (gainer, loser) and hit_points > 0:
+                    change = 2 if p_id == gainer else -3
+                    expected = max(1, min(10, hit_points + change))
+                assert state.units[u_id]["hit_points"] == expected
+
+    def test_unsupported_action(self):
+        """Test that unknown action types are rejected"""
+        with self.assertRaises(ValueError):
+            actions.compile_action({"action": "Teleport"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,12 +9,18 @@ import os
 import unittest
 
 from awbw_replay.replay import AWBWReplay
-from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState, Building, GameInfo, Player, Unit
+from awbw_replay.awbw import PlayerStats, flag_is_set
+from awbw_replay import terrain
 
 # pylint: disable=no-self-use
 
 TEST_REPLAYS_DIR = "replays"
 
+def _snapshot(state):
+    """Returns a string capturing every value (and type) in a state"""
+    return repr((state.game_info, state.players, state.units, state.buildings))
+
 class TestAWBWGameState(unittest.TestCase):
     """Tests for the AWBWGame* classes"""
 
@@ -54,5 +60,145 @@ class TestAWBWGameState(unittest.TestCase):
             assert len(replay.turns()) == states[-1].game_info["turn"] + 1
             assert all((len(state.players) == 2 for state in states))
 
+    def test_structural_sharing(self):
+        """Test that states share unchanged records and never modify earlier states."""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            states = [AWBWGameState(replay_initial=replay.game_info())]
+            snapshots = [_snapshot(states[0])]
+
+            for action in replay.actions():
+                states.append(states[-1].apply_action(AWBWGameAction(action)))
+                snapshots.append(_snapshot(states[-1]))
+
+        # Earlier states are unchanged by later actions
+        for state, snapshot in zip(states, snapshots):
+            assert _snapshot(state) == snapshot
+
+        shared = 0
+        for before, after in zip(states, states[1:]):
+            assert after.game_map is before.game_map
+            for u_id, unit in before.units.items():
+                if after.units[u_id] is unit:
+                    shared += 1
+        # Most actions only touch one or two units
+        assert shared > 0.9 * sum(len(state.units) for state in states[:-1])
+
+    def test_apply_action_inplace(self):
+        """Test that the in-place engine reaches the same states as apply_action."""
+        for replay_file in ["short_replay.zip", "basic_replay.zip", "standard_replay.zip"]:
+            with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, replay_file)) as replay:
+                actions = [AWBWGameAction(action) for action in replay.actions()]
+                initial = AWBWGameState(replay_initial=replay.game_info())
+
+            state = initial
+            for action in actions:
+                state = state.apply_action(action)
+
+            inplace = AWBWGameState(replay_initial=replay.game_info())
+            changes = []
+            for action in actions:
+                assert inplace.apply_action_inplace(action, changes) is inplace
+            assert _snapshot(inplace) == _snapshot(state)
+
+            # Replaying the change records onto the initial state gives the final state
+            for name, r_id, key, _old, new in changes:
+                if name == "game_info":
+                    initial.game_info[key] = new
+                elif key is None:
+                    getattr(initial, name)[r_id] = new
+                else:
+                    getattr(initial, name)[r_id][key] = new
+            assert _snapshot(initial) == _snapshot(state)
+
+    def test_apply_action_inplace_after_apply_action(self):
+        """Test that modifying a state in place leaves states it shares records with alone."""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "short_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            actions = [AWBWGameAction(action) for action in replay.actions()]
+            initial = AWBWGameState(replay_initial=replay.game_info())
+
+        state = initial.apply_action(actions[0])
+        snapshot = _snapshot(state)
+        initial.apply_action_inplace(actions[0])
+        for action in actions[1:]:
+            initial.apply_action_inplace(action)
+        assert _snapshot(state) == snapshot
+
+    def test_record_types(self):
+        """Test that every action keeps the record types of the state."""
+        for replay_file in ["basic_replay.zip", "standard_replay.zip"]:
+            with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, replay_file)) as replay:
+                state = AWBWGameState(replay_initial=replay.game_info())
+                for action in replay.actions():
+                    state.apply_action_inplace(AWBWGameAction(action))
+                    assert isinstance(state.game_info, GameInfo)
+                    assert all(isinstance(player, Player) for player in state.players.values())
+                    assert all(isinstance(unit, Unit) for unit in state.units.values())
+                    assert all(isinstance(building, Building)
+                            for building in state.buildings.values())
+
+    def test_grid(self):
+        """Test that the position queries match a scan of the units and buildings."""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            states = [AWBWGameState(replay_initial=replay.game_info())]
+            inplace = AWBWGameState(replay_initial=replay.game_info())
+            for action in replay.actions():
+                action = AWBWGameAction(action)
+                states.append(states[-1].apply_action(action))
+                inplace.apply_action_inplace(action)
+        states.append(inplace)
+
+        for state in states:
+            on_map = {}
+            for u_id, unit in state.units.items():
+                if unit["hit_points"] > 0 and not flag_is_set(unit["carried"]):
+                    on_map[(unit["x"], unit["y"])] = u_id
+            for (x, y), u_id in on_map.items():
+                assert state.unit_at(x, y) == u_id
+                assert state.units_at(x, y) == (u_id,)
+                assert state.is_occupied(x, y)
+                near = sorted(other for (other_x, other_y), other in on_map.items()
+                        if abs(other_x - x) + abs(other_y - y) <= 2)
+                assert sorted(state.units_near(x, y, 2)) == near
+
+        state = states[-1]
+        assert state.unit_at(-1, -1) is None and not state.is_occupied(-1, -1)
+        for b_id, building in state.buildings.items():
+            assert state.building_at(building["x"], building["y"]) == b_id
+            assert b_id in state.buildings_near(building["x"] + 1, building["y"])
+
+    def test_player_stats(self):
+        """Test the per player totals against a scan of the state and the replay's incomes."""
+        for replay_file in ["basic_replay.zip", "standard_replay.zip"]:
+            with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, replay_file)) as replay:
+                state = AWBWGameState(replay_initial=replay.game_info())
+                inplace = AWBWGameState(replay_initial=replay.game_info())
+                for action in replay.actions():
+                    action = AWBWGameAction(action)
+                    state = state.apply_action(action)
+                    inplace.apply_action_inplace(action)
+                    assert repr(inplace.player_stats) == repr(state.player_stats)
+
+                    expected = {p_id: PlayerStats() for p_id in state.players}
+                    for unit in state.units.values():
+                        if unit["hit_points"] > 0:
+                            expected[unit["players_id"]]["unit_count"] += 1
+                            expected[unit["players_id"]]["army_value"] += (
+                                    unit["cost"] * unit["hit_points"] / 10)
+                    for building in state.buildings.values():
+                        if building["players_id"] in expected:
+                            info = terrain.property_info(building["terrain_id"])
+                            expected[building["players_id"]]["property_count"] += 1
+                            if info[1] in terrain.INCOME_KINDS:
+                                expected[building["players_id"]]["income"] += 1000
+                    assert state.player_stats == expected
+
+                    if action.type == AWBWGameAction.Type.CAPT and action.info["Capt"]["income"]:
+                        for income in action.info["Capt"]["income"].values():
+                            stats = state.player_stats[income["player"]]
+                            assert stats["income"] == income["income"]
+
 if __name__ == "__main__":
     unittest.main()
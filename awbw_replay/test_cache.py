@@ -0,0 +1,146 @@
+"""
+Basic unit tests for the cache module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from awbw_replay import cache as cache_module
+from awbw_replay.cache import _MAGIC, ReplayCache
+from awbw_replay.replay import AWBWReplay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestReplayCache(unittest.TestCase):
+    """Tests for the ReplayCache class"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_reopen(self):
+        """Test that a reopened replay comes from the cache and matches the parsed replay"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        for key in [ReplayCache.KEY_CONTENT, ReplayCache.KEY_STAT]:
+            for compress in [False, True]:
+                cache = ReplayCache(os.path.join(self.tempdir, f"{key}{compress}"),
+                        key=key, compress=compress)
+                with AWBWReplay(example_replay, cache=cache) as replay:
+                    expected_info = replay.game_info()
+                    expected_turns = replay.turns()
+                assert cache.hits == 0 and cache.misses == 1
+
+                with AWBWReplay(example_replay, cache=cache) as replay:
+                    assert replay.game_info() == expected_info
+                    assert replay.turns() == expected_turns
+                    assert not replay.filedata
+                assert cache.hits == 1
+
+    def test_format_version(self):
+        """Test that entries from another format version are invalidated"""
+        cache = ReplayCache(self.tempdir)
+        cache.store("entry", [1, 2, 3])
+        assert cache.load("entry") == [1, 2, 3]
+
+        class NewerReplayCache(ReplayCache):
+            """A cache with a newer format version"""
+            FORMAT_VERSION = ReplayCache.FORMAT_VERSION + 1
+
+        assert NewerReplayCache(self.tempdir).load("entry") is None
+        assert not os.listdir(self.tempdir)
+
+    def test_eviction(self):
+        """Test that the least recently used entries are evicted first"""
+        cache = ReplayCache(self.tempdir, max_bytes=None)
+        for key in ["a", "b", "c"]:
+            cache.store(key, bytes(1000))
+            # Make sure every entry gets a distinct modification time
+            entry_time = len(os.listdir(self.tempdir))
+            os.utime(os.path.join(self.tempdir, key + ".replay"), ns=(0, entry_time))
+
+        # Using "a" makes "b" the least recently used entry
+        assert cache.load("a") is not None
+        cache.max_bytes = 2500
+        cache.evict()
+        assert cache.load("b") is None
+        assert cache.load("a") is not None
+        assert cache.load("c") is not None
+
+    def test_store_scans(self):
+        """Test that stores only scan the directory once over max_bytes, evicting to LOW_WATER"""
+        cache = ReplayCache(self.tempdir, max_bytes=10000)
+        with mock.patch.object(cache_module.os, "scandir", wraps=os.scandir) as scandir:
+            for i in range(9):
+                cache.store(str(i), bytes(1000))
+            assert scandir.call_count == 0
+            assert cache.total_bytes == sum(
+                    os.path.getsize(os.path.join(self.tempdir, name))
+                    for name in os.listdir(self.tempdir))
+
+            # Replacing an entry only counts its new size
+            cache.store("0", bytes(500))
+            assert scandir.call_count == 0
+
+            cache.store("9", bytes(2000))
+            assert scandir.call_count == 1
+        assert cache.total_bytes <= cache.max_bytes * ReplayCache.LOW_WATER
+        assert cache.total_bytes == sum(
+                os.path.getsize(os.path.join(self.tempdir, name))
+                for name in os.listdir(self.tempdir))
+        assert cache.load("9") is not None
+
+        # A new cache over the same directory starts from its size
+        assert ReplayCache(self.tempdir).total_bytes == cache.total_bytes
+        cache.clear()
+        assert cache.total_bytes == 0
+
+    def test_corrupt_entry(self):
+        """Test that truncated or corrupt entries are removed and count as misses"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        header_size = len(_MAGIC) + 1
+        corruptions = [
+            lambda data: data[:len(data) // 2],
+            lambda data: data[:len(data) // 2] + bytes(len(data) - len(data) // 2),
+            lambda data: data[:header_size + 1],
+            lambda data: data[:header_size],
+        ]
+        entry_path = os.path.join(self.tempdir, "entry.replay")
+        for compress in [False, True]:
+            cache = ReplayCache(self.tempdir, compress=compress)
+            for corrupt in corruptions:
+                cache.store("entry", list(range(1000)))
+                with open(entry_path, "rb") as file:
+                    data = file.read()
+                with open(entry_path, "wb") as file:
+                    file.write(corrupt(data))
+                misses = cache.misses
+                assert cache.load("entry") is None
+                assert cache.misses == misses + 1
+                assert not os.path.exists(entry_path)
+
+            # Replays are parsed again and cached afresh
+            with AWBWReplay(example_replay, cache=cache) as replay:
+                expected_info = replay.game_info()
+            for name in os.listdir(self.tempdir):
+                with open(os.path.join(self.tempdir, name), "r+b") as file:
+                    file.truncate(os.path.getsize(file.name) - 10)
+            with AWBWReplay(example_replay, cache=cache) as replay:
+                assert replay.game_info() == expected_info
+            with AWBWReplay(example_replay, cache=cache) as replay:
+                assert replay.game_info() == expected_info
+                assert not replay.filedata
+            shutil.rmtree(self.tempdir)
+            os.mkdir(self.tempdir)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Basic unit tests for the corpus module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import glob
+import os
+import tempfile
+import unittest
+
+from awbw_replay.corpus import ReplayCorpus, pack_corpus
+from awbw_replay.replay import AWBWReplay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestReplayCorpus(unittest.TestCase):
+    """Tests for packing and reading a ReplayCorpus"""
+
+    def test_pack_and_open(self):
+        """Test that every packed replay reads back the same as its archive"""
+        replay_files = sorted(glob.glob(os.path.join(TEST_REPLAYS_DIR, "*.zip")))
+        expected = {}
+        for filename in replay_files:
+            with AWBWReplay(filename) as replay:
+                expected.setdefault(replay.game_info()["id"], (replay.game_info(), replay.turns()))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            for compress in [False, True]:
+                corpus_path = os.path.join(tempdir, f"corpus{compress}.awbwc")
+                # Two of the sample archives are the same game, only the first is kept
+                assert pack_corpus(corpus_path, replay_files, compress=compress) == len(expected)
+
+                with ReplayCorpus(corpus_path) as corpus:
+                    assert sorted(corpus) == sorted(expected)
+                    for games_id, (game_info, turns) in expected.items():
+                        with corpus.open(games_id) as replay:
+                            assert replay.game_info() == game_info
+                            assert replay.turns() == turns
+                        with corpus.open(games_id, stream=True) as replay:
+                            assert list(replay.turns()) == turns
+
+                    with self.assertRaises(KeyError):
+                        corpus.open(0)
+
+    def test_open_invalid(self):
+        """Test that opening a file which isn't a corpus fails"""
+        with self.assertRaises(ValueError):
+            with ReplayCorpus(os.path.join(TEST_REPLAYS_DIR, "short_replay.zip")):
+                pass
+
+    def test_open_truncated(self):
+        """Test that truncated corpus files fail with ValueError when opened"""
+        replay_files = sorted(glob.glob(os.path.join(TEST_REPLAYS_DIR, "*.zip")))
+        with tempfile.TemporaryDirectory() as tempdir:
+            corpus_path = os.path.join(tempdir, "corpus.awbwc")
+            pack_corpus(corpus_path, replay_files, compress=True)
+            with open(corpus_path, "rb") as file:
+                data = file.read()
+
+            truncated_path = os.path.join(tempdir, "truncated.awbwc")
+            for length in [0, 10, len(data) - 10, len(data) // 2]:
+                with open(truncated_path, "wb") as file:
+                    file.write(data[:length])
+                with self.assertRaises(ValueError):
+                    with ReplayCorpus(truncated_path):
+                        pass
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+Basic unit tests for the export module.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from awbw_replay import export
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.timeseries import ReplaySeries
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestColumnarExport(unittest.TestCase):
+    """Tests for exporting replay timelines"""
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.output = os.path.join(self._tmp_dir.name, "timelines")
+        self.replay_path = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_day_snapshots(self):
+        """Test that day snapshots hold the same player values as ReplaySeries.per_day"""
+        with export.ColumnarExporter(self.output, export.SNAPSHOT_DAY) as exporter:
+            state = exporter.export_replay(self.replay_path)
+        with AWBWReplay(self.replay_path) as replay:
+            series = ReplaySeries.from_replay(replay)
+            action_count = len(replay.compiled_actions())
+
+        players = export.read_table(self.output, "players")
+        assert list(players["players_id"][:len(series.player_ids)]) == series.player_ids
+        for metric in ["funds", "co_power", "unit_count", "army_value", "property_count", "income"]:
+            np.testing.assert_array_equal(
+                    players[metric].reshape(-1, len(series.player_ids)), series.per_day(metric))
+        np.testing.assert_array_equal(players["day"][::len(series.player_ids)], series.days())
+
+        units = export.read_table(self.output, "units")
+        last = units["actions_applied"] == action_count
+        assert sorted(units["units_id"][last]) == sorted(
+                u_id for u_id, unit in state.units.items() if unit["hit_points"] > 0)
+
+        actions = export.read_table(self.output, "actions")
+        np.testing.assert_array_equal(actions["action_index"], np.arange(action_count))
+        assert set(actions["action"]) <= {action_type.value for action_type in AWBWGameAction.Type}
+
+        buildings = export.read_table(self.output, "buildings")
+        captured = buildings["old_players_id"] != buildings["players_id"]
+        assert captured.any()
+        for b_id, p_id in zip(buildings["buildings_id"][captured],
+                              buildings["players_id"][captured]):
+            assert p_id in series.player_ids
+            assert b_id in state.buildings
+
+    def test_row_groups(self):
+        """Test that tables are split into memory mapped row groups of bounded size"""
+        with export.ColumnarExporter(self.output, export.SNAPSHOT_ACTION, 100) as exporter:
+            exporter.export_replay(self.replay_path)
+
+        assert len(export.row_group_paths(self.output, "units")) > 1
+        for row_group in export.iter_row_groups(self.output, "units", ["units_id", "name"]):
+            assert isinstance(row_group["units_id"], np.memmap)
+            assert 0 < len(row_group["units_id"]) <= 100
+            assert row_group["name"].dtype == np.dtype("U16")
+
+        # Every state after each action is a snapshot, with a row per unit alive
+        units = export.read_table(self.output, "units", ["actions_applied"])
+        players = export.read_table(self.output, "players")
+        actions = export.read_table(self.output, "actions", ["action_index"])
+        unit_counts = np.bincount(players["actions_applied"], weights=players["unit_count"])
+        np.testing.assert_array_equal(np.bincount(units["actions_applied"]), unit_counts)
+        assert len(unit_counts) == len(actions["action_index"]) + 1
+
+    def test_fractional_co_power(self):
+        """Test that the tenths of a power meter aren't truncated"""
+        with AWBWReplay(self.replay_path) as replay:
+            game_info = replay.game_info()
+            compiled = replay.compiled_actions()
+        fire_index = next(i for i, action in enumerate(compiled) if action.ACTION == "Fire")
+        fire = compiled[fire_index]
+        compiled[fire_index] = fire._replace(
+                co_powers=tuple((p_id, 12.5) for p_id, _co_power in fire.co_powers))
+
+        with export.ColumnarExporter(self.output, export.SNAPSHOT_ACTION) as exporter:
+            exporter.export_compiled(game_info, compiled)
+        players = export.read_table(self.output, "players", ["actions_applied", "co_power"])
+        assert players["co_power"].dtype == np.float64
+        assert (players["co_power"][players["actions_applied"] == fire_index + 1] == 12.5).any()
+
+    def test_export_replays(self):
+        """Test exporting a file list into the same tables, skipping broken replays"""
+        broken = os.path.join(self._tmp_dir.name, "broken.zip")
+        with open(broken, "wb") as file:
+            file.write(b"not a zip")
+        files = [os.path.join(TEST_REPLAYS_DIR, name)
+                 for name in ["basic_replay.zip", "short_replay.zip"]]
+        assert export.export_replays(self.output, files + [broken]) == (2, 1)
+
+        actions = export.read_table(self.output, "actions", ["games_id"])
+        games = set()
+        for path in files:
+            with AWBWReplay(path) as replay:
+                games.add(replay.game_info()["id"])
+                assert (actions["games_id"] == replay.game_info()["id"]).sum() == len(
+                        replay.compiled_actions())
+        assert set(actions["games_id"]) == games
+
+        with self.assertRaises(FileExistsError):
+            export.ColumnarExporter(self.output)
+        with self.assertRaises(ValueError):
+            export.ColumnarExporter(os.path.join(self._tmp_dir.name, "other"), snapshots="week")
+
+    def test_apply_error(self):
+        """Test that a replay failing part way through leaves none of its rows behind"""
+        files = [os.path.join(TEST_REPLAYS_DIR, name)
+                 for name in ["basic_replay.zip", "short_replay.zip"]]
+        with AWBWReplay(files[0]) as replay:
+            broken_id = replay.game_info()["id"]
+        apply_action_inplace = AWBWGameState.apply_action_inplace
+
+        def apply_or_raise(state, action, changes):
+            if state.game_info["games_id"] == broken_id and action.ACTION == "End":
+                raise KeyError("broken")
+            return apply_action_inplace(state, action, changes)
+
+        # A row group size of 1 writes every row that reaches the writers
+        with mock.patch.object(AWBWGameState, "apply_action_inplace", apply_or_raise):
+            assert export.export_replays(self.output, files, export.SNAPSHOT_ACTION, 1) == (1, 1)
+        for table in export.TABLES:
+            assert broken_id not in export.read_table(self.output, table, ["games_id"])["games_id"]
+        assert len(export.read_table(self.output, "actions", ["games_id"])["games_id"]) > 0
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Basic unit tests for the fog module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import unittest
+
+from awbw_replay import fog
+from awbw_replay.replay import AWBWReplay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestFogOfWar(unittest.TestCase):
+    """Tests for tracking each player's view of a fog game"""
+
+    def test_without_fog(self):
+        """Test that nothing is hidden in a game without fog"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            for state, masks in fog.perspectives(replay):
+                assert not state.game_info["fog"]
+                assert not any(masks.values())
+
+    def test_perspectives(self):
+        """Test that each player's view follows what the replay showed them"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            steps = list(fog.perspectives(replay))
+            actions = replay.compiled_actions()
+        assert len(steps) == len(actions) + 1
+        assert steps[0][0].game_info["fog"]
+
+        hidden_moves = 0
+        for (state, masks), action, (_last_state, last_masks) in zip(
+                steps[1:], actions, steps):
+            for p_id, hidden in masks.items():
+                # Players always see their own units
+                assert not any(state.units[u_id]["players_id"] == p_id
+                               for u_id in hidden if u_id in state.units)
+                # Unchanged views share the same set
+                if hidden == last_masks[p_id]:
+                    assert hidden is last_masks[p_id]
+
+            # A unit moving into the fog is hidden from the players that lost it
+            if action.ACTION == "Move":
+                for u_id, _seen_by, hidden_from in action.sightings:
+                    for p_id in hidden_from:
+                        assert u_id in masks[p_id]
+                        assert u_id not in fog.visible_units(state, masks[p_id])
+                        hidden_moves += 1
+        assert hidden_moves > 0
+
+        # Not every enemy unit is visible at the end of the game
+        state, masks = steps[-1]
+        for p_id, hidden in masks.items():
+            visible = fog.visible_units(state, hidden)
+            assert any(unit["players_id"] == p_id for unit in visible.values())
+        assert any(len(fog.visible_units(state, hidden)) < len(fog.visible_units(state, ()))
+                   for hidden in masks.values())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,7 +7,9 @@ python -m unittest -v
 
 import unittest
 
-from .game import DefaultDict
+from copy import copy
+
+from .game import DefaultDict, Record
 
 # pylint: disable=no-self-use
 
@@ -60,3 +62,72 @@ class TestDefaultDict(unittest.TestCase):
             TestDefaultDict.ColorDict(pi=3.1415)
         with self.assertRaises(KeyError):
             TestDefaultDict.ColorDict({"pi":3.1415})
+
+class TestRecord(unittest.TestCase):
+    """Tests for the Record class"""
+
+    class ColorRecord(Record):
+        """Example Record"""
+
+        ALLOWED_DATA = {
+            "r": 0,
+            "g": 0,
+            "b": 0,
+            "name": "",
+        }
+
+        __slots__ = ()
+
+    def test_color_record(self):
+        """Test that we can create and use ColorRecord as a dict"""
+        test_record = TestRecord.ColorRecord(r=100)
+        assert test_record["r"] == 100
+        assert test_record["b"] == 0
+        assert test_record["g"] == 0
+        assert dict(test_record) == {"r": 100, "g": 0, "b": 0, "name": ""}
+        assert repr(test_record) == repr(dict(test_record))
+
+        test_record = test_record | { "r": 255, "b": 255 }
+        assert isinstance(test_record, TestRecord.ColorRecord)
+        assert test_record["r"] == 255
+        assert test_record["b"] == 255
+        assert test_record["g"] == 0
+
+        test_record = TestRecord.ColorRecord({"r": 15, "b": 22}, g=81)
+        assert test_record == {"r": 15, "g": 81, "b": 22, "name": ""}
+        assert test_record.get("pi", 3) == 3
+        assert "r" in test_record and "pi" not in test_record
+
+        # No per instance dictionary
+        assert not hasattr(test_record, "__dict__")
+
+    def test_copy(self):
+        """Test that copies are independent"""
+        test_record = TestRecord.ColorRecord(r=1)
+        copied = copy(test_record)
+        copied["r"] = 2
+        assert isinstance(copied, TestRecord.ColorRecord)
+        assert test_record["r"] == 1
+        assert copied != test_record
+
+    def test_bad_keys(self):
+        """Test that an exception is raised when an invalid key is used"""
+        with self.assertRaises(KeyError):
+            TestRecord.ColorRecord(pi=3.1415)
+        with self.assertRaises(KeyError):
+            TestRecord.ColorRecord({"pi":3.1415})
+        test_record = TestRecord.ColorRecord()
+        with self.assertRaises(KeyError):
+            test_record["pi"] = 3.1415
+        with self.assertRaises(KeyError):
+            _ = test_record["pi"]
+        with self.assertRaises(TypeError):
+            del test_record["r"]
+
+    def test_validate(self):
+        """Test that validate checks value types"""
+        test_record = TestRecord.ColorRecord(r=100, name="red")
+        assert test_record.validate() is test_record
+        test_record["g"] = "0"
+        with self.assertRaises(TypeError):
+            test_record.validate()
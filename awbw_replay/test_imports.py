@@ -0,0 +1,62 @@
+"""
+Import checks, so short batch runs and worker processes start quickly.
+
+Each check runs in a fresh interpreter, since this one has already imported
+everything the other tests use. They look at what gets imported rather than
+timing it, so a slow or busy machine can't fail them.
+
+To run:
+python -m unittest -v
+"""
+
+import json
+import subprocess
+import sys
+import textwrap
+import unittest
+
+# Modules the core modules and the batch mode of main.py must never import:
+# the plotting libraries, and the package modules that require numpy
+HEAVY_MODULES = (
+    "numpy",
+    "matplotlib",
+    "awbw_replay.export",
+    "awbw_replay.timeseries",
+    "awbw_replay.unit_store",
+)
+
+def _heavy_imports(statement):
+    """
+    Arguments:
+    - statement: Python code to run in a new interpreter
+
+    Returns:
+    - List of HEAVY_MODULES in sys.modules after running the statement
+    """
+    code = textwrap.dedent(f"""
+        import json, sys
+        {statement}
+        print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))
+        """)
+    output = subprocess.run(
+            [sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+class TestImports(unittest.TestCase):
+    """Tests that importing the package stays cheap"""
+
+    def test_core_modules(self):
+        """Test that the package, replay and game state modules don't import numpy or plotting"""
+        for module in ["awbw_replay", "awbw_replay.replay", "awbw_replay.awbw"]:
+            heavy = _heavy_imports(f"import {module}")
+            assert heavy == [], f"{module} imports {heavy}"
+
+    def test_batch_mode(self):
+        """Test that summarizing a file list never imports the plotting modules"""
+        heavy = _heavy_imports(
+                "import io, main; "
+                "main.summarize_replays(['replays/short_replay.zip'], io.StringIO(), prefetch=1)")
+        assert heavy == []
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Basic unit tests for the index module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from awbw_replay import awbw
+from awbw_replay.index import IngestResult, ReplayIndex
+from awbw_replay.replay import AWBWReplay
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestReplayIndex(unittest.TestCase):
+    """Tests for the ReplayIndex class"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.database = os.path.join(self.tempdir, "index.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_ingest(self):
+        """Test the rows of ingested replays, and that ingesting again skips them"""
+        replay_files = sorted(glob.glob(os.path.join(TEST_REPLAYS_DIR, "*.zip")))
+        with ReplayIndex(self.database) as index:
+            # Two of the sample replays are copies of the same archive
+            assert index.ingest(replay_files) == IngestResult(3, 1, 0)
+
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            games_id = replay.game_info()["id"]
+            action_types = list(replay.action_summaries())
+
+        with ReplayIndex(self.database) as index:
+            assert index.ingest(replay_files, jobs=2) == IngestResult(0, 4, 0)
+            assert index.query("SELECT COUNT(*) FROM replays") == [(3,)]
+            assert index.query(
+                    "SELECT actions, game_over FROM replays WHERE games_id = ?",
+                    (games_id,)) == [(len(action_types), 1)]
+            events = index.query(
+                    "SELECT action FROM events WHERE games_id = ? ORDER BY action_index",
+                    (games_id,))
+            assert [event[0] for event in events] == action_types
+            assert index.query(
+                    "SELECT SUM(winner), SUM(eliminated) FROM players WHERE games_id = ?",
+                    (games_id,)) == [(1, 1)]
+            assert sum(games for _co_id, games, _win_rate in index.co_win_rates()) == 6
+            assert len(index.game_length_by_map()) == 3
+
+            plan = index.query(
+                    "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM events WHERE action = ?", ("Fire",))
+            assert "events_action" in plan[0][-1]
+
+    def test_reingest(self):
+        """Test that changed replays and engine versions are ingested again"""
+        path = os.path.join(self.tempdir, "replay.zip")
+        shutil.copy(os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip"), path)
+        with ReplayIndex(self.database) as index:
+            assert index.ingest([path]) == IngestResult(1, 0, 0)
+
+            # Replacing the archive replaces every row of the old replay
+            shutil.copy(os.path.join(TEST_REPLAYS_DIR, "short_replay.zip"), path)
+            assert index.ingest([path]) == IngestResult(1, 0, 0)
+            assert index.query("SELECT games_id FROM replays") == [(526302,)]
+            assert index.query("SELECT DISTINCT games_id FROM events") == [(526302,)]
+            assert index.ingest([path]) == IngestResult(0, 1, 0)
+
+            with mock.patch.object(awbw, "ENGINE_VERSION", awbw.ENGINE_VERSION + 1):
+                assert index.ingest([path]) == IngestResult(1, 0, 0)
+            assert index.ingest([path, os.path.join(self.tempdir, "missing.zip")]) \
+                    == IngestResult(1, 0, 1)
+
+        # A new schema starts over
+        with mock.patch.object(ReplayIndex, "SCHEMA_VERSION", ReplayIndex.SCHEMA_VERSION + 1):
+            with ReplayIndex(self.database) as index:
+                assert index.query("SELECT COUNT(*) FROM replays") == [(0,)]
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Basic unit tests for the instrument module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import collections
+import json
+import os
+import unittest
+
+from awbw_replay import instrument
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.replay import AWBWReplay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+def _run_replay(path):
+    """Opens a replay and applies every action, returning the count of each action type"""
+    with AWBWReplay(path) as replay:
+        state = AWBWGameState(replay_initial=replay.game_info())
+        counts = collections.Counter()
+        for action in replay.actions():
+            state = state.apply_action(AWBWGameAction(action))
+            counts[action["action"]] += 1
+    return counts
+
+class TestInstrumentation(unittest.TestCase):
+    """Tests for collecting engine counters"""
+
+    def test_off(self):
+        """Test that nothing is collected outside of collect()"""
+        with instrument.collect() as stats:
+            _run_replay(os.path.join(TEST_REPLAYS_DIR, "short_replay.zip"))
+        collected = stats.summary()
+        assert collected["actions"] and collected["stages"]
+
+        assert instrument.active() is None
+        _run_replay(os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip"))
+        assert instrument.active() is None
+        assert stats.summary() == collected
+
+    def test_collect(self):
+        """Test the per action type and stage counters"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with instrument.collect() as stats:
+            assert instrument.active() is stats
+            counts = _run_replay(example_replay)
+        assert instrument.active() is None
+
+        assert {action_type: s["count"] for action_type, s in stats.actions.items()} == counts
+        for action_stats in stats.actions.values():
+            assert 0 < action_stats["max_time"] <= action_stats["total_time"]
+        assert stats.actions["Move"]["units_touched"] == counts["Move"]
+        assert stats.actions["Build"]["units_touched"] == counts["Build"]
+        for stage in [instrument.STAGE_DECOMPRESS, instrument.STAGE_DECODE_GAME,
+                      instrument.STAGE_DECODE_ACTIONS]:
+            assert stats.stages[stage]["count"] >= 1
+        assert "Move" in stats.report()
+
+    def test_merge(self):
+        """Test combining the counters of separate runs"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        runs = []
+        for _ in range(2):
+            with instrument.collect() as stats:
+                _run_replay(example_replay)
+            runs.append(stats)
+
+        total = instrument.Instrumentation()
+        total.merge(runs[0])
+        # Summaries are what worker processes send back
+        total.merge(json.loads(json.dumps(runs[1].summary())))
+        for action_type, action_stats in total.actions.items():
+            counts = [run.actions[action_type] for run in runs]
+            assert action_stats["count"] == sum(c["count"] for c in counts)
+            assert action_stats["max_time"] == max(c["max_time"] for c in counts)
+        assert total.stages[instrument.STAGE_DECOMPRESS]["count"] == 2 * len(runs)
+
+if __name__ == "__main__":
+    unittest.main()
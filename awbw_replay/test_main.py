@@ -0,0 +1,130 @@
+"""
+Basic unit tests for the batch mode of main.py on select sample replays.
+
+To run (from the repository root):
+python -m unittest -v
+"""
+
+import contextlib
+import csv
+import io
+import os
+import sys
+import tempfile
+import logging
+import unittest
+from unittest import mock
+
+import main
+from awbw_replay.awbw import AWBWGameState
+from awbw_replay.replay import AWBWReplay
+
+TEST_REPLAYS_DIR = "replays"
+
+# Columns that differ between runs of the same replay
+_MEASURED_FIELDS = ("wall_time_s", "peak_rss_kb")
+
+def _read_rows(summary_file):
+    """Returns the header and rows of a CSV summary, keyed by file"""
+    reader = csv.DictReader(io.StringIO(summary_file.getvalue()))
+    rows = {}
+    for row in reader:
+        if sys.platform.startswith("linux"):
+            assert int(row["peak_rss_kb"]) > 0
+        for field in _MEASURED_FIELDS:
+            row.pop(field)
+        rows[row["file"]] = row
+    return reader.fieldnames, rows
+
+class TestSummarizeReplays(unittest.TestCase):
+    """Tests for summarizing a list of replays as CSV"""
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.missing = os.path.join(self._tmp_dir.name, "does_not_exist.zip")
+        self.replay_files = [
+            os.path.join(TEST_REPLAYS_DIR, "short_replay.zip"),
+            os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip"),
+        ]
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_summary(self):
+        """Test the columns of each row, including the row of a replay that fails"""
+        summary_file = io.StringIO()
+        main.summarize_replays(self.replay_files + [self.missing], summary_file)
+        fieldnames, rows = _read_rows(summary_file)
+        assert fieldnames == main.SUMMARY_FIELDS
+        assert sorted(rows) == sorted(self.replay_files + [self.missing])
+
+        for path in self.replay_files:
+            with AWBWReplay(path) as replay:
+                assert rows[path]["games_id"] == str(replay.game_info()["id"])
+                assert rows[path]["actions"] == str(len(list(replay.actions())))
+            assert rows[path]["exception"] == ""
+            assert int(rows[path]["days"]) > 0
+            assert rows[path]["final_funds"]
+
+        assert rows[self.missing]["exception"].startswith("FileNotFoundError")
+        assert rows[self.missing]["games_id"] == ""
+
+    def test_jobs(self):
+        """Test that more jobs and prefetching give the same rows as one job"""
+        files = self.replay_files + [self.missing]
+        expected = io.StringIO()
+        main.summarize_replays(files, expected)
+        for kwargs in [{"jobs": 2, "max_tasks_per_child": 1}, {"prefetch": 2}]:
+            summary_file = io.StringIO()
+            main.summarize_replays(files, summary_file, **kwargs)
+            assert _read_rows(summary_file) == _read_rows(expected)
+
+        # Prefetching only happens with one job, so asking for both is an error
+        with self.assertRaises(ValueError):
+            main.summarize_replays(files, io.StringIO(), jobs=2, prefetch=2)
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                main.get_args(["replays.txt", "-l", "--jobs", "2", "--prefetch", "2"])
+
+    def test_file_list(self):
+        """Test that blank lines in a file list are skipped"""
+        file_list = os.path.join(self._tmp_dir.name, "replays.txt")
+        summary = os.path.join(self._tmp_dir.name, "summary.csv")
+        with open(file_list, "w", encoding="utf-8") as file:
+            file.write("\n" + "\n\n".join(self.replay_files) + "\n  \n")
+
+        args = main.get_args([file_list, "--file-list", "--summary", summary])
+        assert main.main(args) == main.EXIT_SUCCESS
+        with open(summary, "r", encoding="utf-8", newline="") as file:
+            rows = list(csv.DictReader(file))
+        assert [row["file"] for row in rows] == sorted(
+                self.replay_files, key=os.path.getsize, reverse=True)
+        assert all(row["exception"] == "" for row in rows)
+
+    def test_warnings_above_level(self):
+        """Test that warnings are counted even when the logging level hides them"""
+        apply_action_inplace = AWBWGameState.apply_action_inplace
+
+        def apply_and_warn(state, action, changes=None):
+            logging.warning("Applying %s", action)
+            return apply_action_inplace(state, action, changes)
+
+        root = logging.getLogger()
+        output = io.StringIO()
+        handler = logging.StreamHandler(output)
+        level = root.level
+        root.addHandler(handler)
+        root.setLevel(logging.ERROR)
+        try:
+            with mock.patch.object(AWBWGameState, "apply_action_inplace", apply_and_warn):
+                row = main.summarize_replay(self.replay_files[0])
+        finally:
+            root.setLevel(level)
+            root.removeHandler(handler)
+        assert row["warnings"] == row["actions"] > 0
+        assert output.getvalue() == ""
+        assert not handler.filters
+        assert root.level == level
+
+if __name__ == "__main__":
+    unittest.main()
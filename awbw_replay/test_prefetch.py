@@ -0,0 +1,117 @@
+"""
+Basic unit tests for the prefetch module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import glob
+import os
+import tempfile
+import unittest
+
+from awbw_replay import instrument
+from awbw_replay.cache import ReplayCache
+from awbw_replay.prefetch import prefetch_replays
+from awbw_replay.replay import AWBWReplay
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestPrefetchReplays(unittest.TestCase):
+    """Tests for reading replays ahead of time"""
+
+    def setUp(self):
+        self.replay_files = sorted(glob.glob(os.path.join(TEST_REPLAYS_DIR, "*.zip")))
+
+    def test_same_as_replay(self):
+        """Test that prefetched replays read the same as AWBWReplay, in order"""
+        for stream in [False, True]:
+            paths = []
+            for replay in prefetch_replays(self.replay_files, prefetch=2, stream=stream):
+                paths.append(replay.path())
+                with replay:
+                    with AWBWReplay(replay.path()) as expected:
+                        assert replay.game_info() == expected.game_info()
+                        assert list(replay.turns()) == expected.turns()
+            assert paths == self.replay_files
+
+    def test_read_ahead(self):
+        """Test that only prefetch replays are read ahead of the one in use"""
+        taken = []
+
+        def replay_files():
+            for path in self.replay_files:
+                taken.append(path)
+                yield path
+
+        replays = prefetch_replays(replay_files(), prefetch=2)
+        first = next(replays)
+        assert taken == self.replay_files[:3]
+        with instrument.collect() as stats:
+            with first:
+                assert first.game_info() is not None
+        assert stats.stages[instrument.STAGE_DECOMPRESS]["count"] == 2
+        replays.close()
+        assert taken == self.replay_files[:3]
+
+        with self.assertRaises(ValueError):
+            next(prefetch_replays(self.replay_files, prefetch=0))
+
+    def test_cache_hits(self):
+        """Test that replays in the cache are loaded from it without being read ahead"""
+        with tempfile.TemporaryDirectory() as tempdir:
+            # Some sample replays have the same contents, so key them by path
+            cache = ReplayCache(tempdir, key=ReplayCache.KEY_STAT)
+            expected = {}
+            for replay in prefetch_replays(self.replay_files, cache=cache):
+                with replay:
+                    expected[replay.path()] = replay.game_info()
+            assert cache.misses == len(self.replay_files)
+
+            with instrument.collect() as stats:
+                for replay in prefetch_replays(self.replay_files, cache=cache):
+                    with replay:
+                        assert replay.game_info() == expected[replay.path()]
+                        assert not replay.filedata
+            assert cache.hits == len(self.replay_files)
+            assert instrument.STAGE_DECOMPRESS not in stats.stages
+
+            # A stale entry falls back to reading the archive when it's opened
+            cache.clear()
+            for path in self.replay_files[:1]:
+                cache.store(cache.key_for(path), None)
+            for replay in prefetch_replays(self.replay_files[:1], cache=cache):
+                with replay:
+                    assert replay.game_info() == expected[replay.path()]
+
+    def test_stream(self):
+        """Test that streaming only reads the compressed archives ahead"""
+        replays = prefetch_replays(self.replay_files, prefetch=2, stream=True)
+        first = next(replays)
+        # pylint: disable=protected-access
+        read_ahead = first._future.result()
+        assert read_ahead.members is None
+        with open(self.replay_files[0], "rb") as file:
+            assert read_ahead.archive == file.read()
+        with first:
+            assert not first.filedata
+            with AWBWReplay(first.path()) as expected:
+                assert list(first.turns()) == expected.turns()
+        replays.close()
+
+    def test_read_error(self):
+        """Test that a replay which can't be read raises when it's opened, not before"""
+        with tempfile.TemporaryDirectory() as tempdir:
+            missing = os.path.join(tempdir, "does_not_exist.zip")
+            opened = []
+            for replay in prefetch_replays([missing] + self.replay_files[:1]):
+                try:
+                    with replay:
+                        opened.append(replay.game_info()["id"])
+                except FileNotFoundError:
+                    opened.append(None)
+        assert opened[0] is None
+        assert opened[1] is not None
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,11 +5,14 @@ To run:
 python -m unittest -v
 """
 
+import glob
+import gzip
+import json
 import os
 import unittest
 import tempfile
 
-from awbw_replay.replay import AWBWReplay
+from awbw_replay.replay import AWBWReplay, decode_php, decode_turn_line, find_in
 
 # pylint: disable=no-self-use
 
@@ -27,6 +30,78 @@ class TestAWBWReplay(unittest.TestCase):
             assert isinstance(replay.turns(), list)
             assert isinstance(replay.game_info(), dict)
 
+    def test_stream(self):
+        """Test that streaming gives the same turns without retaining the file contents"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            expected_turns = replay.turns()
+        with AWBWReplay(example_replay, stream=True) as replay:
+            assert not replay.filedata
+            assert isinstance(replay.game_info(), dict)
+            assert not isinstance(replay.turns(), list)
+            assert list(replay.turns()) == expected_turns
+            # Every call starts a new pass over the archive
+            assert len(list(replay.actions())) == sum(len(turn.actions) for turn in expected_turns)
+
+    def test_decode_turn_line(self):
+        """Test that the dedicated turn decoder matches the generic parser on every replay"""
+        for example_replay in glob.glob(os.path.join(TEST_REPLAYS_DIR, "*.zip")):
+            with AWBWReplay(example_replay) as replay:
+                data = gzip.decompress(replay.file.read(f"a{replay.game_info()['id']}"))
+                for line in data.strip().split(b"\n"):
+                    # pylint: disable=protected-access
+                    expected = replay._parse_turn_generic(line.decode())
+                    assert decode_turn_line(line) == expected
+
+        # Lines that don't match the expected layout are left to the generic parser
+        assert decode_turn_line(b"p:1;d:1;a:N;") is None
+        assert decode_turn_line(b'p:1;d:1;a:a:3:{i:0;i:1;i:1;i:1;i:2;a:1:{i:0;s:99:"{}";}}') is None
+
+    def test_decode_php(self):
+        """Test that the game info decoder matches phpserialize and sanitize_phpobject"""
+        for example_replay in glob.glob(os.path.join(TEST_REPLAYS_DIR, "*.zip")):
+            with AWBWReplay(example_replay) as replay:
+                data = gzip.decompress(replay.file.read(str(replay.game_info()["id"])))
+                # pylint: disable=protected-access
+                expected = replay._parse_game_generic(data)
+                assert decode_php(data) == expected
+                # Including the types of every value
+                assert repr(decode_php(data)) == repr(expected)
+
+        members = b'O:1:"A":2:{s:4:" A b";b:1;s:4:" * c";d:0.5;}'
+        assert decode_php(members) == {"b": True, "c": 0.5}
+        assert decode_php(b'a:2:{i:0;N;s:1:"k";s:3:"\xc3\xa9!";}') == {0: None, "k": "\u00e9!"}
+
+    def test_action_index(self):
+        """Test that the action type index matches the decoded actions"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            index = replay.action_index()
+            actions = list(replay.actions())
+            # Building the index doesn't need to decode any payloads
+            assert not any(action._decoded for action in actions) # pylint: disable=protected-access
+            assert sum(len(positions) for positions in index.values()) == len(actions)
+            for action_type, positions in index.items():
+                assert all(actions[i].decode()["action"] == action_type for i in positions)
+
+            power_actions = list(replay.actions(action_types={"Power"}))
+            assert len(power_actions) == len(index["Power"])
+            assert all(action["playerID"] for action in power_actions)
+
+    def test_actions_are_dicts(self):
+        """Test that undecoded actions work like the dictionaries they decode to"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            actions = list(replay.actions())
+        decoded = [json.loads(action.payload) for action in actions]
+
+        assert len(find_in(actions, "Move")) == len(find_in(decoded, "Move")) > 0
+        assert json.dumps(actions) == json.dumps(decoded)
+        with AWBWReplay(example_replay) as replay:
+            actions = list(replay.actions())
+        assert all(isinstance(action, dict) for action in actions)
+        assert actions == decoded and dict(actions[0]) == decoded[0]
+
     @unittest.expectedFailure
     def test_open_nonexistent(self):
         """Test that an error is raised when a nonexistent file is opened"""
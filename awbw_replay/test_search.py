@@ -0,0 +1,60 @@
+"""
+Basic unit tests for the search module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import unittest
+
+from awbw_replay.replay import AWBWReplay, find_in
+from awbw_replay.search import ReplayIndex
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestReplayIndex(unittest.TestCase):
+    """Tests for the ReplayIndex class"""
+
+    @classmethod
+    def setUpClass(cls):
+        with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")) as replay:
+            cls.index = ReplayIndex.from_replay(replay)
+            cls.actions = list(replay.actions())
+
+    def test_exact(self):
+        """Test that exact matches agree with find_in, without duplicates"""
+        unit_id = 98284944
+        hits = self.index.find(unit_id)
+        assert hits
+        assert len(hits) == len(set(hits))
+        for hit in hits:
+            assert str(self.index.resolve(hit.path)) == str(unit_id) or hit.is_key
+
+        # Every action containing the unit id (as a number or a string) is found
+        expected = [i for i, action in enumerate(self.actions)
+                if find_in(action, unit_id) or find_in(action, str(unit_id))]
+        assert self.index.find_actions(unit_id) == expected
+
+        # The starting unit is also in the game info
+        assert any(hit.action_index() is None for hit in hits)
+        assert self.index.find("not a value in the replay") == []
+
+    def test_substring(self):
+        """Test substring matches on usernames"""
+        hits = self.index.find("segfault", substring=True)
+        assert hits
+        assert all("segfault" in str(self.index.resolve(hit.path)) for hit in hits)
+        assert self.index.find("segfault") == []
+        # Short queries work too
+        assert self.index.find("gf", substring=True, keys=False) == hits
+
+    def test_json_path(self):
+        """Test formatting a hit as a JSON path"""
+        hit = self.index.find("Resign", keys=False)[0]
+        assert hit.json_path().startswith(f"$.actions[{len(self.actions) - 1}]")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Basic unit tests for the synthetic module.
+
+To run:
+python -m unittest -v
+"""
+
+import gzip
+import os
+import tempfile
+import unittest
+import zipfile
+
+from awbw_replay import fog, synthetic
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.replay import AWBWReplay, decode_turn_line
+
+class TestSyntheticReplay(unittest.TestCase):
+    """Tests for generating synthetic replays"""
+
+    def setUp(self):
+        self._tmp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.path = os.path.join(self._tmp_dir.name, "synthetic.zip")
+
+    def tearDown(self):
+        self._tmp_dir.cleanup()
+
+    def test_layout(self):
+        """Test that the archive has the same members as an AWBW replay"""
+        synthetic.generate_replay(self.path, seed=1, days=5, game_id=1234)
+        with zipfile.ZipFile(self.path) as archive:
+            assert archive.namelist() == ["1234", "a1234"]
+            lines = gzip.decompress(archive.read("a1234")).split(b"\n")
+        assert len(lines) == 10
+        assert all(decode_turn_line(line) is not None for line in lines)
+
+        with AWBWReplay(self.path) as replay:
+            assert replay.game_info()["id"] == 1234
+            # pylint: disable=protected-access
+            assert replay._parse_game_generic(replay.filedata[0]) == replay.game_info()
+
+    def test_state(self):
+        """Test that the replay reaches the returned state, and every action type is generated"""
+        expected = synthetic.generate_replay(self.path, days=25, units=80, fog=True)
+        action_types = set()
+        with AWBWReplay(self.path) as replay:
+            state = AWBWGameState(replay_initial=replay.game_info())
+            for action in replay.actions():
+                state.apply_action_inplace(AWBWGameAction(action))
+                action_types.add(action["action"])
+
+        assert action_types == {action_type.value for action_type in AWBWGameAction.Type}
+        for name in ["game_info", "players", "units", "buildings"]:
+            assert dict(getattr(state, name)) == dict(getattr(expected, name))
+        assert state.game_info["game_over"]
+
+    def test_same_seed(self):
+        """Test that the same arguments write the same archive"""
+        archives = []
+        for seed in [3, 3, 4]:
+            synthetic.generate_replay(self.path, seed=seed, days=4, fog=True, game_id=1)
+            with open(self.path, "rb") as file:
+                archives.append(file.read())
+        assert archives[0] == archives[1]
+        assert archives[0] != archives[2]
+
+    def test_fog(self):
+        """Test that fog games give each player their own view"""
+        synthetic.generate_replay(self.path, days=10, players=3, fog=True)
+        with AWBWReplay(self.path) as replay:
+            assert replay.game_info()["fog"] == "Y"
+            hidden = [sum(map(len, masks.values())) for _state, masks in fog.perspectives(replay)]
+        assert max(hidden) > 0
+
+        synthetic.generate_replay(self.path, days=10)
+        with AWBWReplay(self.path) as replay:
+            for action in replay.actions():
+                if action["action"] == "Move":
+                    assert list(action["unit"]) == ["global"]
+            assert not any(any(masks.values()) for _state, masks in fog.perspectives(replay))
+
+    def test_action_mix(self):
+        """Test limiting the generated action types"""
+        synthetic.generate_replay(self.path, days=5, action_mix={"Move": 1}, resign=False)
+        with AWBWReplay(self.path) as replay:
+            assert set(replay.action_summaries()) == {"Move", "End"}
+
+        with self.assertRaises(ValueError):
+            synthetic.generate_replay(self.path, action_mix={AWBWGameAction.Type.END: 1})
+        with self.assertRaises(ValueError):
+            synthetic.generate_replay(self.path, action_mix={"Attack": 1})
+
+if __name__ == "__main__":
+    unittest.main()
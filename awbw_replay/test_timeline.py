@@ -0,0 +1,72 @@
+"""
+Tests for the ReplayTimeline class
+"""
+
+import os
+import unittest
+
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.timeline import ReplayTimeline
+
+TEST_REPLAYS_DIR = "replays"
+
+def _snapshot(state):
+    """Returns a string capturing every value (and type) in a state"""
+    return repr((state.game_info, state.players, state.units, state.buildings))
+
+class TestReplayTimeline(unittest.TestCase):
+    """Tests for the ReplayTimeline class"""
+
+    @classmethod
+    def setUpClass(cls):
+        with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")) as replay:
+            cls.timeline = ReplayTimeline(replay, keyframe_interval=16)
+            cls.states = [AWBWGameState(replay_initial=replay.game_info())]
+            for action in map(AWBWGameAction, replay.actions()):
+                cls.states.append(cls.states[-1].apply_action(action))
+        cls.snapshots = [_snapshot(state) for state in cls.states]
+
+    def test_state_at(self):
+        """Test seeking to every state, from both neighbouring keyframes."""
+        assert len(self.timeline) == len(self.states) - 1
+        for i, snapshot in enumerate(self.snapshots):
+            assert _snapshot(self.timeline.state_at(i)) == snapshot
+        assert _snapshot(self.timeline.state_at(-1)) == self.snapshots[-1]
+        with self.assertRaises(IndexError):
+            self.timeline.state_at(len(self.states))
+        # Seeking never modifies the stored states
+        assert _snapshot(self.timeline.state_at(17)) == self.snapshots[17]
+
+    def test_step(self):
+        """Test stepping backward and forward from the final state."""
+        self.timeline.seek(-1)
+        assert self.timeline.position == len(self.timeline)
+        for i in reversed(range(len(self.states) - 1)):
+            state = self.timeline.step_backward()
+            assert _snapshot(state) == self.snapshots[i]
+            # The unit grid is restored along with the units
+            for u_id, unit in self.states[i].units.items():
+                if unit["hit_points"] > 0 and not unit["carried"]:
+                    assert state.unit_at(unit["x"], unit["y"]) == u_id
+        with self.assertRaises(IndexError):
+            self.timeline.step_backward()
+        for i in range(1, 40):
+            assert _snapshot(self.timeline.step_forward()) == self.snapshots[i]
+        assert _snapshot(self.timeline.state()) == self.snapshots[39]
+
+    def test_state_at_day(self):
+        """Test seeking to the start of each turn."""
+        for i, state in enumerate(self.states):
+            if i == 0 or self.states[i - 1].game_info["turn"] != state.game_info["turn"]:
+                day = state.game_info["day"]
+                player = state.game_info["active_player_id"]
+                assert self.timeline.index_at_day(day, player) == i
+                assert _snapshot(self.timeline.state_at_day(day, player)) == self.snapshots[i]
+
+        assert self.timeline.index_at_day(1) == 0
+        with self.assertRaises(KeyError):
+            self.timeline.state_at_day(1000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Tests for the ReplaySeries class
+"""
+
+import os
+import unittest
+
+import numpy as np
+
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.timeseries import PLAYER_METRICS, ReplaySeries
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestReplaySeries(unittest.TestCase):
+    """Tests for the ReplaySeries class"""
+
+    def test_series(self):
+        """Test the arrays against the metrics of every state."""
+        for replay_file in ["short_replay.zip", "basic_replay.zip", "standard_replay.zip"]:
+            with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, replay_file)) as replay:
+                series = ReplaySeries.from_replay(replay)
+                states = [AWBWGameState(replay_initial=replay.game_info())]
+                for action in replay.actions():
+                    states.append(states[-1].apply_action(AWBWGameAction(action)))
+
+            assert series.player_ids == list(states[0].players)
+            assert len(series.action_types) == len(states) - 1
+            for metric, (attribute, key) in PLAYER_METRICS.items():
+                expected = [[getattr(state, attribute)[p_id][key] for p_id in series.player_ids]
+                        for state in states]
+                assert series.per_action(metric).shape == (len(states), len(series.player_ids))
+                assert series.per_action(metric).tolist() == expected
+
+            # The last state of each day, like the loop main.test_replay used to do
+            days = [state.game_info["day"] for state in states]
+            day_ends = [i for i, day in enumerate(days) if i + 1 == len(days) or days[i + 1] != day]
+            assert series.day_ends.tolist() == day_ends
+            assert series.day.tolist() == days
+            assert series.days().tolist() == list(range(1, len(day_ends) + 1))
+            column = series.column(series.player_ids[-1])
+            assert np.array_equal(series.per_day("funds")[:, column],
+                    [states[i].players[series.player_ids[-1]]["funds"] for i in day_ends])
+
+            turns = [state.game_info["turn"] for state in states]
+            turn_ends = [i for i, turn in enumerate(turns)
+                    if i + 1 == len(turns) or turns[i + 1] != turn]
+            assert series.turn_ends.tolist() == turn_ends
+            assert series.per_turn("income").shape == (len(turn_ends), len(series.player_ids))
+
+    def test_metrics(self):
+        """Test only extracting some metrics."""
+        with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")) as replay:
+            series = ReplaySeries.from_replay(replay, metrics=["army_value"])
+        assert list(series.metrics) == ["army_value"]
+        assert series.per_action("army_value").dtype == np.float64
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Tests for the UnitStore class
+"""
+
+import os
+import unittest
+from copy import copy
+
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState, Unit
+from awbw_replay.unit_store import UnitStore
+
+TEST_REPLAYS_DIR = "replays"
+
+FLAGS = ("sub_dive", "second_weapon", "moved", "capture", "fired", "carried")
+
+def _normalized_units(units):
+    """Returns plain dictionaries of the units, with flags converted like UnitStore"""
+    result = {}
+    for u_id, unit in units.items():
+        result[u_id] = dict(unit)
+        for key in FLAGS:
+            value = unit[key]
+            result[u_id][key] = value == "Y" if isinstance(value, str) else bool(value)
+    return result
+
+class TestUnitStore(unittest.TestCase):
+    """Tests for the UnitStore class"""
+
+    def test_replays(self):
+        """Test that columnar states match the dictionary states for every action."""
+        for replay_file in ["short_replay.zip", "standard_replay.zip"]:
+            with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, replay_file)) as replay:
+                expected = AWBWGameState(replay_initial=replay.game_info())
+                inplace = AWBWGameState(replay_initial=replay.game_info(), units_type=UnitStore)
+                states = [AWBWGameState(replay_initial=replay.game_info(), units_type=UnitStore)]
+                snapshots = []
+
+                for action in replay.actions():
+                    action = AWBWGameAction(action)
+                    expected = expected.apply_action(action)
+                    inplace.apply_action_inplace(action)
+                    states.append(states[-1].apply_action(action))
+                    snapshots.append(_normalized_units(expected.units))
+
+                    assert isinstance(inplace.units, UnitStore)
+                    assert _normalized_units(inplace.units) == snapshots[-1]
+                    assert repr(inplace.players) == repr(expected.players)
+
+            # Earlier states keep their own copy of the units
+            for state, snapshot in zip(states[1:], snapshots):
+                assert _normalized_units(state.units) == snapshot
+
+    def test_undo_build(self):
+        """Test that inverting the changes of a Build removes the unit from a UnitStore."""
+        with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")) as replay:
+            state = AWBWGameState(replay_initial=replay.game_info(), units_type=UnitStore)
+            compiled = replay.compiled_actions()
+
+        build_index = next(i for i, action in enumerate(compiled) if action.ACTION == "Build")
+        for action in compiled[:build_index]:
+            state.apply_action_inplace(action)
+        before = _normalized_units(state.units)
+        stats = repr(state.player_stats)
+
+        changes = []
+        state.apply_action_inplace(compiled[build_index], changes)
+        assert len(state.units) == len(before) + 1
+        undone = state.apply_changes(changes, inverse=True)
+        assert isinstance(undone.units, UnitStore)
+        assert _normalized_units(undone.units) == before
+        assert repr(undone.player_stats) == stats
+
+    def test_mapping(self):
+        """Test adding, modifying and removing units."""
+        store = UnitStore(capacity=1)
+        store[1] = Unit(id=1, players_id=10, cost=1000, hit_points=5, moved="Y")
+        store[2] = Unit(id=2, players_id=11, cost=7000)
+        store[3] = Unit(id=3, players_id=10, cost=3000, hit_points=0)
+        assert len(store) == 3 and list(store) == [1, 2, 3]
+        assert store[1]["moved"] is True and store[1]["name"] == "Unit"
+        assert store[1] == Unit(id=1, players_id=10, cost=1000, hit_points=5, moved=True)
+
+        store[2]["x"] = 4
+        store[2].update({"hit_points": 7, "fired": 1})
+        assert store[2]["x"] == 4 and store[2]["hit_points"] == 7 and store[2]["fired"] is True
+        with self.assertRaises(KeyError):
+            store[2]["not_a_key"] = 1
+
+        detached = copy(store[2])
+        copied = copy(store)
+        store[2]["x"] = 5
+        assert detached["x"] == 4 and copied[2]["x"] == 4
+
+        # The removed unit's row is reused
+        del store[1]
+        assert 1 not in store
+        store[4] = Unit(id=4, players_id=11, cost=1000)
+        assert len(store.columns()) == 3
+        assert sorted(store) == [2, 3, 4]
+
+        assert store.ids_differing({"fired": False}) == [2]
+        assert sorted(store.ids_of_players({11: None, "10": None})) == [2, 4]
+        assert store.count_by_player() == {11: 2}
+        assert store.value_by_player() == {11: 7000 * 7 / 10 + 1000}
+
+if __name__ == "__main__":
+    unittest.main()
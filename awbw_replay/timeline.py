@@ -0,0 +1,149 @@
+"""Module for seeking through the game states of a replay without keeping every state."""
+
+import itertools
+from copy import copy
+
+from awbw_replay import actions
+from awbw_replay.awbw import AWBWGameState
+
+class ReplayTimeline():
+    """
+    Every game state of a replay, stored as full keyframe states every
+    keyframe_interval actions plus the changes made by each action.
+
+    Usage:
+
+    with AWBWReplay("52963.zip") as replay:
+        timeline = ReplayTimeline(replay, keyframe_interval=50)
+    state = timeline.state_at(100)
+    state = timeline.step_backward()
+
+    State i is the state after the first i actions, so state 0 is the initial
+    state and state len(timeline) is the final state, like indexing a list of
+    every state. A smaller keyframe_interval uses more memory for faster seeks:
+    seeking applies at most keyframe_interval / 2 actions' worth of changes,
+    forwards from the keyframe before or backwards from the keyframe after.
+    """
+
+    def __init__(self, replay, keyframe_interval=100):
+        """
+        Arguments:
+        - replay: An open AWBWReplay
+        - keyframe_interval: Number of actions between stored full states
+        """
+        if keyframe_interval < 1:
+            raise ValueError(f"Invalid keyframe interval {keyframe_interval}")
+        self.keyframe_interval = keyframe_interval
+
+        # State index -> full state
+        self._keyframes = {}
+        # Change records of each action, see AWBWGameState.apply_action_inplace
+        self._deltas = []
+        # (day, player id) -> index of the state at the start of that turn
+        self._turn_starts = {}
+        # day -> index of the state at the start of the day
+        self._day_starts = {}
+
+        self._build(replay)
+
+        self.position = 0
+        self._state = self.state_at(0)
+
+    def _add_turn_start(self, index, state):
+        day = state.game_info["day"]
+        self._turn_starts.setdefault((day, state.game_info["active_player_id"]), index)
+        self._day_starts.setdefault(day, index)
+
+    def _build(self, replay):
+        state = AWBWGameState(replay_initial=replay.game_info())
+        self._add_turn_start(0, state)
+
+        for action in replay.compiled_actions():
+            index = len(self._deltas)
+            if index % self.keyframe_interval == 0:
+                # Shares records with state, which copies them before its next change
+                self._keyframes[index] = state.apply_changes(())
+
+            changes = []
+            state.apply_action_inplace(action, changes)
+            # state keeps modifying records it adds, so keep a copy of them
+            self._deltas.append(tuple(
+                    (name, r_id, key, old, copy(new) if key is None else new)
+                    for name, r_id, key, old, new in changes))
+
+            if isinstance(action, actions.End):
+                self._add_turn_start(index + 1, state)
+
+        self._keyframes[len(self._deltas)] = state
+
+    def __len__(self):
+        """Returns the number of actions in the timeline"""
+        return len(self._deltas)
+
+    def state_at(self, index):
+        """
+        Arguments:
+        - index: State index, from 0 (initial state) to len(self) (final state).
+          Negative indices count back from the final state.
+
+        Returns:
+        - AWBWGameState after the first index actions
+        """
+        if index < 0:
+            index += len(self) + 1
+        if not 0 <= index <= len(self):
+            raise IndexError(f"State {index} is outside the timeline")
+
+        before = index - index % self.keyframe_interval
+        after = min(before + self.keyframe_interval, len(self))
+        if index - before <= after - index:
+            changes = itertools.chain.from_iterable(self._deltas[before:index])
+            return self._keyframes[before].apply_changes(list(changes))
+        changes = itertools.chain.from_iterable(self._deltas[index:after])
+        return self._keyframes[after].apply_changes(list(changes), inverse=True)
+
+    def state_at_day(self, day, player=None):
+        """
+        Arguments:
+        - day: The day number
+        - player: Player id, or None for the first player of the day
+
+        Returns:
+        - AWBWGameState at the start of the player's turn on that day
+        """
+        index = self.index_at_day(day, player)
+        if index is None:
+            raise KeyError(f"No turn for player {player} on day {day}")
+        return self.state_at(index)
+
+    def index_at_day(self, day, player=None):
+        """Returns the state index used by state_at_day, or None if there's no such turn."""
+        if player is None:
+            return self._day_starts.get(day)
+        return self._turn_starts.get((day, player))
+
+    def seek(self, index):
+        """Moves the position stepped from by step_forward / step_backward and returns its state."""
+        self._state = self.state_at(index)
+        self.position = index if index >= 0 else index + len(self) + 1
+        return self._state
+
+    def state(self):
+        """Returns the state at the current position."""
+        return self._state
+
+    def step_forward(self):
+        """Moves forward one action and returns the new state."""
+        if self.position >= len(self):
+            raise IndexError("Already at the final state")
+        self._state = self._state.apply_changes(self._deltas[self.position])
+        self.position += 1
+        return self._state
+
+    def step_backward(self):
+        """Moves back one action and returns the new state."""
+        if self.position <= 0:
+            raise IndexError("Already at the initial state")
+        self.position -= 1
+        self._state = self._state.apply_changes(self._deltas[self.position], inverse=True)
+        return self._state
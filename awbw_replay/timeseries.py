@@ -0,0 +1,130 @@
+"""
+Per player metrics over the course of a replay, as NumPy arrays.
+
+Requires numpy, which the rest of the package doesn't.
+"""
+
+import numpy as np
+
+from awbw_replay.awbw import AWBWGameState
+
+# Metric name -> (AWBWGameState attribute, key) read for each player
+PLAYER_METRICS = {
+    "funds": ("players", "funds"),
+    "co_power": ("players", "co_power"),
+    "eliminated": ("players", "eliminated"),
+    "unit_count": ("player_stats", "unit_count"),
+    "army_value": ("player_stats", "army_value"),
+    "property_count": ("player_stats", "property_count"),
+    "income": ("player_stats", "income"),
+}
+
+def _last_indices(values):
+    """Returns the indices where values is about to change, plus the last index"""
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.append(np.flatnonzero(values[1:] != values[:-1]), len(values) - 1)
+
+class ReplaySeries(): # pylint: disable=too-many-instance-attributes
+    """
+    Per player metrics of every state in a replay.
+
+    Usage:
+
+    with AWBWReplay("52963.zip") as replay:
+        series = ReplaySeries.from_replay(replay)
+    funds = series.per_day("funds") # days x players
+    plt.plot(series.days(), funds[:, 0])
+
+    Row i of the per action arrays is the state after the first i actions, so
+    there's one more row than actions. Columns follow player_ids.
+    """
+
+    def __init__(self, player_ids, metrics, day, turn, active_player_id, action_types):
+        """
+        Arguments:
+        - player_ids: List of player ids, the order of the columns
+        - metrics: Dictionary of metric name -> (states x players) array
+        - day, turn, active_player_id: Array with the value for each state
+        - action_types: Array of the type of each action
+        """
+        self.player_ids = player_ids
+        self.metrics = metrics
+        self.day = day
+        self.turn = turn
+        self.active_player_id = active_player_id
+        self.action_types = action_types
+
+        # Index of the last state of each day / turn
+        self.day_ends = _last_indices(day)
+        self.turn_ends = _last_indices(turn)
+
+    @classmethod
+    def from_replay(cls, replay, metrics=None):
+        """
+        Applies every action of a replay to a single state, recording the metrics
+        after each one. Only that one state is kept alive.
+
+        Arguments:
+        - replay: An open AWBWReplay
+        - metrics: List of metric names from PLAYER_METRICS, or None for all of them
+
+        Returns:
+        - ReplaySeries
+        """
+        if metrics is None:
+            metrics = list(PLAYER_METRICS)
+        sources = [PLAYER_METRICS[metric] for metric in metrics]
+
+        state = AWBWGameState(replay_initial=replay.game_info())
+        player_ids = list(state.players)
+        # metric -> flat list of values, one row of players at a time
+        values = {metric: [] for metric in metrics}
+        game_values = []
+        action_types = []
+
+        def record():
+            for metric, (attribute, key) in zip(metrics, sources):
+                records = getattr(state, attribute)
+                values[metric].extend(records[p_id][key] for p_id in player_ids)
+            game_info = state.game_info
+            game_values.append((game_info["day"], game_info["turn"], game_info["active_player_id"]))
+
+        record()
+        for action in replay.compiled_actions():
+            state.apply_action_inplace(action)
+            action_types.append(action.ACTION)
+            record()
+
+        columns = {
+            metric: np.array(metric_values).reshape(-1, len(player_ids))
+            for metric, metric_values in values.items()
+        }
+        game_columns = np.array(game_values, dtype=np.int64).reshape(-1, 3)
+        return cls(
+                player_ids,
+                columns,
+                game_columns[:, 0],
+                game_columns[:, 1],
+                game_columns[:, 2],
+                np.array(action_types, dtype=str))
+
+    def per_action(self, metric):
+        """Returns the (states x players) array of a metric"""
+        return self.metrics[metric]
+
+    def per_day(self, metric):
+        """Returns the (days x players) array of a metric, at the end of each day"""
+        return self.metrics[metric][self.day_ends]
+
+    def per_turn(self, metric):
+        """Returns the (turns x players) array of a metric, at the end of each turn"""
+        return self.metrics[metric][self.turn_ends]
+
+    def days(self):
+        """Returns the array of day numbers matching the rows of per_day"""
+        return self.day[self.day_ends]
+
+    def column(self, p_id):
+        """Returns the column of a player in the metric arrays"""
+        return self.player_ids.index(p_id)
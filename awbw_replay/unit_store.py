@@ -0,0 +1,215 @@
+"""
+Columnar storage for the units of an AWBWGameState, using NumPy.
+
+Opt in with AWBWGameState(..., units_type=UnitStore). Requires numpy, which the
+rest of the package doesn't.
+"""
+
+import collections.abc
+
+import numpy as np
+
+from awbw_replay.awbw import Unit, flag_is_set
+
+_INT_KEYS = (
+    "id", "players_id", "movement_points", "vision", "fuel", "fuel_per_turn", "ammo",
+    "short_range", "long_range", "cost", "x", "y", "cargo1_units_id", "cargo2_units_id",
+)
+_FLAG_KEYS = ("sub_dive", "second_weapon", "moved", "capture", "fired", "carried")
+_TEXT_KEYS = ("name", "symbol", "movement_type")
+
+# One row per unit. in_use is False for rows on the free list.
+UNIT_DTYPE = np.dtype(
+        [(key, np.int64) for key in _INT_KEYS]
+        + [("hit_points", np.float64)]
+        + [(key, np.bool_) for key in _FLAG_KEYS]
+        + [(key, object) for key in _TEXT_KEYS]
+        + [("in_use", np.bool_)])
+
+def _from_hit_points(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+class UnitView(collections.abc.MutableMapping):
+    """
+    Dictionary style access to one unit's row in a UnitStore, with the same keys
+    as awbw.Unit. Writes go straight to the store.
+    """
+
+    __slots__ = ("_store", "_id")
+
+    def __init__(self, store, u_id):
+        self._store = store
+        self._id = u_id
+
+    def __getitem__(self, key):
+        if key not in Unit.ALLOWED_DATA:
+            raise KeyError(key)
+        # pylint: disable=protected-access
+        value = self._store._rows[key][self._store._row_of[self._id]]
+        if key == "hit_points":
+            return _from_hit_points(value)
+        if key in _TEXT_KEYS:
+            return value
+        return value.item()
+
+    def __setitem__(self, key, value):
+        # pylint: disable=protected-access
+        self._store._set(self._store._row_of[self._id], key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("Unit keys can't be removed")
+
+    def __iter__(self):
+        return iter(Unit.ALLOWED_DATA)
+
+    def __len__(self):
+        return len(Unit.ALLOWED_DATA)
+
+    def __copy__(self):
+        """Returns a Unit detached from the store"""
+        return Unit(dict(self))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class UnitStore(collections.abc.MutableMapping):
+    """
+    Maps unit id -> UnitView, like the units dictionary of an AWBWGameState, with
+    every unit's values kept in one NumPy structured array (see UNIT_DTYPE).
+
+    Flags are stored as bools, so "Y" / "N" and 0 / 1 flag values from the replay
+    read back as True / False. Rows of removed units go on a free list for the
+    next added unit.
+
+    The array is available through columns() for vectorized analysis.
+    """
+
+    # Copying the store copies every unit, so AWBWGameState doesn't copy them one by one
+    owns_records = True
+
+    def __init__(self, units=None, capacity=64):
+        """
+        Arguments:
+        - units: Optional mapping of unit id -> unit record to start with
+        - capacity: Number of rows to allocate up front
+        """
+        self._rows = np.zeros(max(capacity, 1), dtype=UNIT_DTYPE)
+        # unit id -> row
+        self._row_of = {}
+        # Rows below _size that are no longer in use
+        self._free = []
+        # Number of rows ever used
+        self._size = 0
+
+        if units is not None:
+            for u_id, unit in units.items():
+                self[u_id] = unit
+
+    def _set(self, row, key, value):
+        """Writes a single value into a row"""
+        if key not in Unit.ALLOWED_DATA:
+            raise KeyError(f"{key} is not supported for Unit")
+        if key in _FLAG_KEYS:
+            value = flag_is_set(value)
+        self._rows[key][row] = value
+
+    def _allocate(self):
+        """Returns an unused row, growing the array if needed"""
+        if self._free:
+            return self._free.pop()
+        if self._size == len(self._rows):
+            rows = np.zeros(2 * len(self._rows), dtype=UNIT_DTYPE)
+            rows[:self._size] = self._rows
+            self._rows = rows
+        self._size += 1
+        return self._size - 1
+
+    def __getitem__(self, u_id):
+        if u_id not in self._row_of:
+            raise KeyError(u_id)
+        return UnitView(self, u_id)
+
+    def __setitem__(self, u_id, unit):
+        """Stores a copy of a unit's values. Missing keys get Unit's defaults."""
+        values = {**Unit.ALLOWED_DATA, **unit}
+        row = self._row_of.get(u_id)
+        if row is None:
+            row = self._allocate()
+        for key, value in values.items():
+            self._set(row, key, value)
+        self._rows["in_use"][row] = True
+        self._row_of[u_id] = row
+
+    def __delitem__(self, u_id):
+        row = self._row_of.pop(u_id)
+        self._rows[row] = np.zeros(1, dtype=UNIT_DTYPE)[0]
+        self._free.append(row)
+
+    def __contains__(self, u_id):
+        return u_id in self._row_of
+
+    def __iter__(self):
+        return iter(self._row_of)
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def __copy__(self):
+        result = UnitStore.__new__(UnitStore)
+        result._rows = self._rows.copy()
+        result._row_of = dict(self._row_of)
+        result._free = list(self._free)
+        result._size = self._size
+        return result
+
+    def __repr__(self):
+        return f"UnitStore({dict(self.items())!r})"
+
+    def columns(self):
+        """Returns the structured array of rows in use. Writing to it modifies the store."""
+        rows = self._rows[:self._size]
+        if not self._free:
+            return rows
+        return rows[rows["in_use"]]
+
+    def ids_differing(self, values):
+        """
+        Arguments:
+        - values: Dictionary of key -> value
+
+        Returns:
+        - List of ids of the units where any key doesn't have the given value
+        """
+        rows = self._rows[:self._size]
+        differs = np.zeros(self._size, dtype=np.bool_)
+        for key, value in values.items():
+            if key in _FLAG_KEYS:
+                value = flag_is_set(value)
+            differs |= rows[key] != value
+        return rows["id"][differs & rows["in_use"]].tolist()
+
+    def ids_of_players(self, p_ids):
+        """Returns the list of ids of units owned by any player in p_ids"""
+        rows = self._rows[:self._size]
+        # Only integers can equal a player id, like "in" on a dictionary of units
+        p_ids = [p_id for p_id in p_ids if isinstance(p_id, int) and not isinstance(p_id, bool)]
+        selected = np.isin(rows["players_id"], p_ids) & rows["in_use"]
+        return rows["id"][selected].tolist()
+
+    def _by_player(self, weights):
+        rows = self.columns()
+        alive = rows["hit_points"] > 0
+        p_ids, inverse = np.unique(rows["players_id"][alive], return_inverse=True)
+        totals = np.bincount(inverse, weights=weights(rows[alive]), minlength=len(p_ids))
+        return p_ids, totals
+
+    def count_by_player(self):
+        """Returns a dictionary of player id -> number of units alive"""
+        p_ids, totals = self._by_player(lambda rows: None)
+        return {p_id: int(total) for p_id, total in zip(p_ids.tolist(), totals)}
+
+    def value_by_player(self):
+        """Returns a dictionary of player id -> army value, the sum of cost * hit points / 10"""
+        p_ids, totals = self._by_player(lambda rows: rows["cost"] * rows["hit_points"] / 10)
+        return {p_id: float(total) for p_id, total in zip(p_ids.tolist(), totals)}
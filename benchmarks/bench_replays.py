@@ -0,0 +1,230 @@
+"""
+Benchmark of opening replays and reconstructing their game states.
+
+To run:
+python -m benchmarks.bench_replays [replays/*.zip ...] [--json results.json]
+python -m benchmarks.bench_replays --baseline benchmarks/baseline.json
+python -m benchmarks.bench_replays --save-baseline benchmarks/baseline.json
+
+For each replay, measures (best of --repeat runs):
+- open_s: Opening the archive, including the stages below
+- decompress_s, decode_game_s, decode_actions_s: Stages of opening, from instrument
+- construct_s: AWBWGameState construction from the game info
+- decode_s: Decoding the JSON of every action of a freshly opened replay
+- compile_s: Compiling every action of a freshly opened replay, see
+  actions.compile_actions. Includes decoding, since it decodes each action first.
+- apply_s: apply_action over every compiled action, keeping every state
+- apply_inplace_s: apply_action_inplace over every compiled action
+- peak_memory_kb: Peak traced memory of opening the replay and keeping every state
+
+With --baseline, each metric is compared to the stored results and the exit
+status is 1 if any is more than its threshold slower (or larger). Timings vary
+between machines, so save a baseline on the machine that compares against it.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+
+from awbw_replay import actions, instrument
+from awbw_replay.awbw import AWBWGameState
+from awbw_replay.replay import AWBWReplay, RawAction
+
+DEFAULT_REPLAYS = os.path.join("replays", "*.zip")
+
+# Allowed slowdown of each metric against the baseline, as a fraction
+DEFAULT_THRESHOLDS = {
+    "open_s": 0.30,
+    "decompress_s": 0.30,
+    "decode_game_s": 0.30,
+    "decode_actions_s": 0.30,
+    "construct_s": 0.30,
+    "decode_s": 0.30,
+    "compile_s": 0.30,
+    "apply_s": 0.30,
+    "apply_inplace_s": 0.30,
+    "peak_memory_kb": 0.10,
+}
+
+# Metrics under this many seconds are too noisy to compare
+MIN_COMPARED_SECONDS = 0.001
+
+def _best_time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def _open_stages(path, repeat):
+    """Returns the best open time and the best time of each instrumented stage"""
+    best = {}
+    for _ in range(repeat):
+        with instrument.collect() as stats:
+            start = timeit.default_timer()
+            with AWBWReplay(path):
+                pass
+            elapsed = timeit.default_timer() - start
+        best["open_s"] = min(best.get("open_s", elapsed), elapsed)
+        for stage, stage_stats in stats.stages.items():
+            key = f"{stage}_s"
+            best[key] = min(best.get(key, stage_stats["total_time"]), stage_stats["total_time"])
+    return best
+
+def _compile_stages(path, repeat):
+    """
+    Returns the best decode and compile times. Actions are only decoded once
+    per opened replay, so each run times a newly opened one.
+    """
+    best = {}
+    for _ in range(repeat):
+        with AWBWReplay(path) as replay:
+            start = timeit.default_timer()
+            for action in replay.actions():
+                if isinstance(action, RawAction):
+                    action.decode()
+            elapsed = timeit.default_timer() - start
+        best["decode_s"] = min(best.get("decode_s", elapsed), elapsed)
+
+        with AWBWReplay(path) as replay:
+            start = timeit.default_timer()
+            actions.compile_actions(replay)
+            elapsed = timeit.default_timer() - start
+        best["compile_s"] = min(best.get("compile_s", elapsed), elapsed)
+    return best
+
+def _peak_memory_kb(path):
+    """Returns the peak traced memory of opening a replay and keeping every state"""
+    tracemalloc.start()
+    try:
+        with AWBWReplay(path) as replay:
+            states = [AWBWGameState(replay_initial=replay.game_info())]
+            for action in replay.compiled_actions():
+                states.append(states[-1].apply_action(action))
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+def bench_replay(path, repeat):
+    """
+    Arguments:
+    - path: Replay archive to benchmark
+    - repeat: Number of runs of each measurement, the best is kept
+
+    Returns:
+    - Dictionary of metric -> value, see the module docstring
+    """
+    results = _open_stages(path, repeat)
+    results.update(_compile_stages(path, repeat))
+
+    with AWBWReplay(path) as replay:
+        game_info = replay.game_info()
+        results["construct_s"] = _best_time(
+                lambda: AWBWGameState(replay_initial=game_info), repeat)
+        compiled = replay.compiled_actions()
+
+    def apply():
+        state = AWBWGameState(replay_initial=game_info)
+        states = [state]
+        for action in compiled:
+            states.append(states[-1].apply_action(action))
+
+    def apply_inplace():
+        state = AWBWGameState(replay_initial=game_info)
+        for action in compiled:
+            state.apply_action_inplace(action)
+
+    results["apply_s"] = _best_time(apply, repeat)
+    results["apply_inplace_s"] = _best_time(apply_inplace, repeat)
+    results["peak_memory_kb"] = _peak_memory_kb(path)
+    results["actions"] = len(compiled)
+    return results
+
+def compare(results, baseline, thresholds):
+    """
+    Arguments:
+    - results, baseline: Dictionaries of replay name -> metrics, from bench_replay
+    - thresholds: Dictionary of metric -> allowed slowdown fraction
+
+    Returns:
+    - List of (replay, metric, baseline value, new value) that regressed
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, threshold in thresholds.items():
+            old = baseline[name].get(metric)
+            new = metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if metric.endswith("_s") and max(old, new) < MIN_COMPARED_SECONDS:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+def _threshold(value):
+    metric, _, fraction = value.partition("=")
+    if metric not in DEFAULT_THRESHOLDS or not fraction:
+        raise argparse.ArgumentTypeError(f"Expected METRIC=FRACTION, got {value}")
+    return metric, float(fraction)
+
+def main(argv=None):
+    """Runs the benchmark, prints a table of results and compares to a baseline"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Replay archives to benchmark")
+    parser.add_argument(
+            "--repeat", type=int, default=10, help="Runs per measurement (best is kept)")
+    parser.add_argument("--json", help="File to write the results to as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", help="File to write the results to as the new baseline")
+    parser.add_argument(
+            "--threshold",
+            type=_threshold,
+            action="append",
+            default=[],
+            help="Allowed slowdown of a metric, ie. apply_s=0.1 (repeatable)")
+    args = parser.parse_args(argv)
+
+    files = args.files or sorted(glob.glob(DEFAULT_REPLAYS))
+    results = {}
+    print(f"{'replay':<24} {'open (ms)':>10} {'construct (ms)':>15} {'decode (ms)':>12} "
+          f"{'compile (ms)':>13} {'apply (ms)':>11} {'in place (ms)':>14} {'peak (KB)':>10}")
+    for path in files:
+        metrics = bench_replay(path, args.repeat)
+        results[os.path.basename(path)] = metrics
+        print(f"{os.path.basename(path):<24} {metrics['open_s'] * 1000:>10.2f} "
+              f"{metrics['construct_s'] * 1000:>15.2f} {metrics['decode_s'] * 1000:>12.2f} "
+              f"{metrics['compile_s'] * 1000:>13.2f} "
+              f"{metrics['apply_s'] * 1000:>11.2f} {metrics['apply_inplace_s'] * 1000:>14.2f} "
+              f"{metrics['peak_memory_kb']:>10}")
+
+    output = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    for filename in [args.json, args.save_baseline]:
+        if filename:
+            with open(filename, "w", encoding="utf-8") as file:
+                json.dump(output, file, indent=2, sort_keys=True)
+                file.write("\n")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    thresholds = {**DEFAULT_THRESHOLDS, **dict(args.threshold)}
+    regressions = compare(results, baseline, thresholds)
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name} {metric}: {old:.6g} -> {new:.6g} "
+              f"(+{(new / old - 1) * 100:.0f}%, threshold {thresholds[metric] * 100:.0f}%)")
+    if not regressions:
+        print(f"No regressions against {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
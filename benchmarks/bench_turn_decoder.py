@@ -0,0 +1,79 @@
+"""
+Benchmark of the dedicated turn line decoder against the generic parser.
+
+To run:
+python -m benchmarks.bench_turn_decoder [replays/*.zip ...]
+"""
+
+import argparse
+import glob
+import gzip
+import os
+import sys
+import timeit
+import zipfile
+
+from awbw_replay.replay import AWBWReplay, decode_turn_line
+
+DEFAULT_REPLAYS = os.path.join("replays", "*.zip")
+
+def read_action_lines(path):
+    """Returns the decompressed lines of the a{game_id} file in a replay archive"""
+    with zipfile.ZipFile(path) as file:
+        for name in file.namelist():
+            if "a" in name:
+                return gzip.decompress(file.read(name)).strip().split(b"\n")
+    return []
+
+def bench_replay(path, repeat):
+    """
+    Times both parsers over every line of the replay's action file.
+
+    Returns:
+    - (generic seconds, dedicated seconds, dedicated + decode seconds), best of repeat runs
+    """
+    lines = read_action_lines(path)
+    replay = AWBWReplay(path)
+
+    # pylint: disable=protected-access
+    def generic():
+        return [replay._parse_turn_generic(line.decode()) for line in lines]
+
+    def dedicated():
+        return [decode_turn_line(line) for line in lines]
+
+    def dedicated_decoded():
+        # The dedicated decoder defers JSON decoding, so also time decoding every action
+        turns = dedicated()
+        for turn in turns:
+            for action in turn.actions:
+                action.decode()
+        return turns
+
+    assert generic() == dedicated(), f"Decoders disagree on {path}"
+
+    generic_time = min(timeit.repeat(generic, number=1, repeat=repeat))
+    dedicated_time = min(timeit.repeat(dedicated, number=1, repeat=repeat))
+    decoded_time = min(timeit.repeat(dedicated_decoded, number=1, repeat=repeat))
+    return generic_time, dedicated_time, decoded_time
+
+def main(argv=None):
+    """Runs the benchmark and prints a table of results"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("files", nargs="*", help="Replay archives to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per replay (best is kept)")
+    args = parser.parse_args(argv)
+
+    files = args.files or sorted(glob.glob(DEFAULT_REPLAYS))
+    print(f"{'replay':<32} {'generic (ms)':>14} {'dedicated (ms)':>16} "
+          f"{'+ decode (ms)':>15} {'speedup':>9}")
+    for path in files:
+        generic_time, dedicated_time, decoded_time = bench_replay(path, args.repeat)
+        print(f"{os.path.basename(path):<32} {generic_time * 1000:>14.2f} "
+              f"{dedicated_time * 1000:>16.2f} {decoded_time * 1000:>15.2f} "
+              f"{generic_time / dedicated_time:>8.1f}x")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
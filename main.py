@@ -1,13 +1,17 @@
 """Main CLI tool to use the AWBW Replay Parser libraries"""
 
 import argparse
-import gzip
+import contextlib
+import csv
 import logging
+import multiprocessing
+import os
 import sys
-import matplotlib.pyplot as plt
-import numpy as np
+import time
 
+from awbw_replay import cli, instrument
 from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.prefetch import prefetch_replays
 from awbw_replay.replay import AWBWReplay
 
 EXIT_SUCCESS = 0
@@ -18,6 +22,21 @@ PLAYER_NAMES = ["Andy", "Bob", "Colin", "Drake", "Eagle", "Flak", "Grit", "Hawke
 
 LOGGING_LEVELS = ["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"]
 
+SUMMARY_FIELDS = [
+    "file",
+    "games_id",
+    "actions",
+    "days",
+    "winners",
+    "final_funds",
+    "wall_time_s",
+    # Peak resident memory of the process while it ran the replay (including
+    # anything read ahead by prefetching). Only measured on Linux, blank elsewhere.
+    "peak_rss_kb",
+    "warnings",
+    "exception",
+]
+
 def get_args(argv=None):
     """
     Handles argument parsing for main
@@ -37,6 +56,36 @@ def get_args(argv=None):
             "-l",
             help="Treat file as a list of replays to open",
             action="store_true")
+    parser.add_argument(
+            "--jobs",
+            "-j",
+            help="Number of worker processes to spread a file list across",
+            type=int,
+            default=1)
+    parser.add_argument(
+            "--max-tasks-per-child",
+            help="Replays each worker process handles before being replaced, to bound memory",
+            type=int,
+            default=50)
+    parser.add_argument(
+            "--prefetch",
+            help="Number of replays to read and decompress ahead on threads. Only with one "
+                 "job (default: 0, read each replay when it's opened)",
+            type=int,
+            default=0)
+    parser.add_argument(
+            "--summary",
+            "-s",
+            help="CSV file to write a summary row per replay to when using a file list "
+                 "(default: stdout)",
+            type=str,
+            default="-")
+    parser.add_argument(
+            "--profile",
+            "-p",
+            help="Print the time spent on each action type and stage of opening replays "
+                 "to stderr",
+            action="store_true")
     parser.add_argument(
             "--verbose",
             "-v",
@@ -45,35 +94,33 @@ def get_args(argv=None):
             default="WARNING",
             choices=LOGGING_LEVELS)
 
-    return parser.parse_args(argv)
+    args = parser.parse_args(argv)
+    if args.jobs > 1 and args.prefetch > 0:
+        parser.error("--prefetch can only be used with one job")
+    return args
 
 def test_replay(replay, show_plot=True):
     """Parses a replay to generate plots of data"""
-    states = [AWBWGameState(replay_initial=replay.game_info())]
-
-    # Generate all the states
-    for action in replay.actions():
-        action = AWBWGameAction(replay_action=action)
-        message = [
-            f"turn: {states[-1].game_info['turn']}",
-            f"action_number: {len(states)}",
-            f"action_type: {action.type}",
-        ]
-        logging.debug(" ".join(message))
-        states.append(states[-1].apply_action(action))
+    # Imported here so batch runs, which don't plot, start without them
+    # pylint: disable=import-outside-toplevel
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from awbw_replay.timeseries import ReplaySeries
 
-    players = {}
-    for p_id, player in states[-1].players.items():
-        players[p_id] = {"name": "Loser" if player["eliminated"] else "Winner", "funds": []}
+    series = ReplaySeries.from_replay(replay, metrics=["funds", "eliminated"])
+    logging.debug("Parsed %d actions over %d days", len(series.action_types), len(series.day_ends))
 
-    # For each state, get the day. If it's the last state of the day, track both player's stats
-    day = 1
-    for i, state in enumerate(states):
-        if i + 1 >= len(states) or states[i+1].game_info["day"] == day + 1:
-            for p_id, player in players.items():
-                player["funds"].append(state.players[p_id]["funds"])
-            day += 1
+    # Track both player's funds at the end of each day
+    funds = series.per_day("funds")
+    eliminated = series.per_action("eliminated")[-1]
+    players = {}
+    for i, p_id in enumerate(series.player_ids):
+        players[p_id] = {
+            "name": "Loser" if eliminated[i] else "Winner",
+            "funds": funds[:, i],
+        }
 
+    day = len(series.day_ends) + 1
     x_vals = np.arange(1, day)
     x_offsets = np.linspace(-0.5, 0.5, num=len(players) + 2)
     x_width = 1.0 / (len(players) + 1)
@@ -89,29 +136,224 @@ def test_replay(replay, show_plot=True):
     if show_plot:
         plt.show()
 
+class _WarningCounter(logging.Handler):
+    """Logging handler that counts the warnings (or worse) logged while attached"""
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+@contextlib.contextmanager
+def _count_warnings():
+    """
+    Context manager counting the warnings (or worse) logged on the root logger
+    inside it, even when its level is above WARNING. The other handlers still
+    only output records at or above that level.
+
+    Returns:
+    - The _WarningCounter
+    """
+    root = logging.getLogger()
+    level = root.level
+    counter = _WarningCounter()
+
+    def at_level(record):
+        return record.levelno >= level
+
+    handlers = list(root.handlers) if level > logging.WARNING else []
+    for handler in handlers:
+        handler.addFilter(at_level)
+    if handlers:
+        root.setLevel(logging.WARNING)
+    root.addHandler(counter)
+    try:
+        yield counter
+    finally:
+        root.removeHandler(counter)
+        if handlers:
+            root.setLevel(level)
+        for handler in handlers:
+            handler.removeFilter(at_level)
+
+def _reset_peak_rss():
+    """
+    Resets the peak resident memory of this process to its current resident
+    memory, so _peak_rss_kb measures from here. Only possible on Linux.
+
+    Returns:
+    - Whether the peak was reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as file:
+            file.write("5")
+    except OSError:
+        return False
+    return True
+
+def _peak_rss_kb():
+    """Returns the peak resident memory of this process in KB since _reset_peak_rss, if known"""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def summarize_replay(filename, replay=None):
+    """
+    Opens and replays a single replay file, never raising.
+
+    Arguments:
+    - filename: Path of the replay to open
+    - replay: Unopened AWBWReplay of the file to use (ie. a PrefetchedReplay), or
+      None to open filename
+
+    Returns:
+    - dict with a value for each of SUMMARY_FIELDS
+    """
+    row = {field: "" for field in SUMMARY_FIELDS}
+    row["file"] = filename
+    logging.info("Opening %s", filename)
+    measure_rss = _reset_peak_rss()
+    start_time = time.perf_counter()
+    with _count_warnings() as warnings:
+        try:
+            if replay is None:
+                replay = AWBWReplay(filename)
+            with replay:
+                state = AWBWGameState(replay_initial=replay.game_info())
+                row["games_id"] = state.game_info["games_id"]
+                actions = 0
+                # Only the final state is summarized, so skip keeping every state around
+                for action in replay.actions():
+                    state.apply_action_inplace(AWBWGameAction(action))
+                    actions += 1
+
+            row["actions"] = actions
+            row["days"] = state.game_info["day"]
+            if state.game_info["game_over"]:
+                row["winners"] = ";".join(
+                        str(p_id) for p_id, player in state.players.items()
+                        if not player["eliminated"])
+            row["final_funds"] = ";".join(
+                    f"{p_id}:{player['funds']}" for p_id, player in state.players.items())
+        except Exception as e: # pylint: disable=broad-except
+            row["exception"] = f"{type(e).__name__}: {e}"
+
+    if row["exception"]:
+        logging.error("Could not parse replay %s: %s", filename, row["exception"])
+    row["wall_time_s"] = f"{time.perf_counter() - start_time:.3f}"
+    if measure_rss:
+        row["peak_rss_kb"] = _peak_rss_kb()
+    row["warnings"] = warnings.count
+    return row
+
+def _summarize_replay_profiled(filename, replay=None):
+    """Returns the summarize_replay row and instrument summary for a replay"""
+    with instrument.collect() as stats:
+        row = summarize_replay(filename, replay)
+    return row, stats.summary()
+
+def _init_worker(level):
+    """Sets up logging in a worker process"""
+    logging.basicConfig(level=level)
+
+def summarize_replays(replay_files, summary_file, jobs=1, max_tasks_per_child=None, stats=None,
+                      prefetch=0):
+    """
+    Summarizes each replay, writing a CSV row per replay as soon as it's done.
+
+    With more than one job, replays are spread across a process pool with the
+    largest files scheduled first, so a big replay doesn't start last and hold
+    up the end of the run. Workers are replaced after max_tasks_per_child
+    replays to bound their memory.
+
+    With one job, prefetch > 0 reads and decompresses that many replays ahead
+    on threads while the current one is replayed, see prefetch.prefetch_replays.
+    Their wall_time_s then leaves out the time spent reading ahead.
+
+    Arguments:
+    - replay_files: List of replay paths
+    - summary_file: Text file object to write the CSV summary to
+    - jobs: Number of worker processes
+    - max_tasks_per_child: Replays per worker process, or None for no limit
+    - stats: Optional instrument.Instrumentation to add every replay's counters to
+    - prefetch: Number of replays to read ahead with one job, or 0 to not read ahead
+    """
+    if jobs > 1 and prefetch > 0:
+        raise ValueError("prefetch can only be used with one job")
+
+    writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+    writer.writeheader()
+
+    def file_size(filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+    replay_files = sorted(replay_files, key=file_size, reverse=True)
+
+    def write_results(results):
+        for result in results:
+            if stats is not None:
+                row, replay_stats = result
+                stats.merge(replay_stats)
+            else:
+                row = result
+            writer.writerow(row)
+            summary_file.flush()
+
+    worker = summarize_replay if stats is None else _summarize_replay_profiled
+
+    if jobs <= 1:
+        if prefetch > 0:
+            write_results(
+                    worker(replay.path(), replay)
+                    for replay in prefetch_replays(replay_files, prefetch))
+        else:
+            write_results(map(worker, replay_files))
+        return
+
+    with multiprocessing.Pool(
+            processes=jobs,
+            initializer=_init_worker,
+            initargs=(logging.getLogger().level,),
+            maxtasksperchild=max_tasks_per_child) as pool:
+        write_results(pool.imap_unordered(worker, replay_files))
+
 def main(args):
     """Handles the CLI args to call analyze one or more replays"""
     # TODO: Define a custom logger to individually control the logging level of our modules
     logging.basicConfig(level=args.verbose)
 
+    stats = instrument.Instrumentation() if args.profile else None
+
     if not args.file_list:
-        with AWBWReplay(args.file) as replay:
-            test_replay(replay)
+        with instrument.collect(stats) if stats is not None else contextlib.nullcontext():
+            with AWBWReplay(args.file) as replay:
+                test_replay(replay)
     else:
         logging.info("Running on a file list")
-        replay_files = []
-        with open(args.file, "r", encoding="utf-8") as file:
-            for line in file:
-                replay_files.append(line.strip())
-
-        for filename in replay_files:
-            logging.info("Opening %s", filename)
-            try:
-                with AWBWReplay(filename) as replay:
-                    test_replay(replay, show_plot=False)
-            except gzip.BadGzipFile as e:
-                logging.error("Could not open replay %s: %s", filename, e)
-                continue
+        replay_files = cli.read_file_list(args.file)
+
+        if args.summary == "-":
+            summarize_replays(
+                    replay_files, sys.stdout, args.jobs, args.max_tasks_per_child, stats,
+                    args.prefetch)
+        else:
+            with open(args.summary, "w", encoding="utf-8", newline="") as summary_file:
+                summarize_replays(
+                        replay_files, summary_file, args.jobs, args.max_tasks_per_child, stats,
+                        args.prefetch)
+
+    if stats is not None:
+        print(stats.report(), file=sys.stderr)
 
     return EXIT_SUCCESS
 